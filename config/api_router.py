@@ -9,6 +9,7 @@ from pdf_web.users.api.views import UserViewSet
 from pdf_web.documents.api.views import (
     DocumentViewSet,
     DocumentVersionViewSet,
+    UploadSessionViewSet,
     WorkspaceMemberViewSet,
     WorkspaceViewSet,
 )
@@ -26,6 +27,7 @@ from pdf_web.annotations.api.views import (
 
 # Operations / Export
 from pdf_web.operations.api.views import (
+    BatchConversionJobViewSet,
     ConvertFromPdfView,
     ConvertToPdfView,
     ExportJobViewSet,
@@ -56,10 +58,12 @@ router.register("workspaces", WorkspaceViewSet, basename="workspace")
 router.register("workspace-members", WorkspaceMemberViewSet, basename="workspace-member")
 router.register("documents", DocumentViewSet, basename="document")
 router.register("versions", DocumentVersionViewSet, basename="version")
+router.register("uploads", UploadSessionViewSet, basename="upload")
 router.register("annotations", AnnotationViewSet, basename="annotation")
 router.register("comments", CommentViewSet, basename="comment")
 router.register("operations", OperationJobViewSet, basename="operation")
 router.register("exports", ExportJobViewSet, basename="export")
+router.register("batch-conversions", BatchConversionJobViewSet, basename="batch-conversion")
 router.register("chat", ChatSessionViewSet, basename="chat")
 router.register("redactions", RedactionSuggestionViewSet, basename="redaction")
 router.register("audit", AuditLogViewSet, basename="audit")
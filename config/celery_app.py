@@ -1,6 +1,10 @@
+import logging
 import os
+import time
 
 from celery import Celery
+from celery.signals import before_task_publish
+from celery.signals import task_prerun
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.local")
@@ -15,3 +19,32 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
+
+logger = logging.getLogger(__name__)
+
+QUEUE_WAIT_CACHE_KEY = "celery:queue-wait:{queue}"
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    # Custom message headers surface as ``task.request.<name>`` on the worker.
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+@task_prerun.connect
+def record_queue_wait(task=None, **kwargs):
+    published_at = getattr(task.request, "published_at", None) if task else None
+    if not published_at:
+        return
+    from django.conf import settings
+    from django.core.cache import cache
+
+    wait = max(time.time() - float(published_at), 0.0)
+    queue = (task.request.delivery_info or {}).get("routing_key") or settings.CELERY_TASK_DEFAULT_QUEUE
+    max_wait = settings.TASK_QUEUE_PROFILES.get(queue, {}).get("max_wait")
+    if max_wait is not None and wait > max_wait:
+        logger.warning("Task %s waited %.2fs in queue %s (budget %ss)", task.name, wait, queue, max_wait)
+    else:
+        logger.info("Task %s waited %.2fs in queue %s", task.name, wait, queue)
+    cache.set(QUEUE_WAIT_CACHE_KEY.format(queue=queue), wait, timeout=None)
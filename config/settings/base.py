@@ -1,6 +1,7 @@
 # ruff: noqa: ERA001, E501
 """Base settings to build other settings files upon."""
 
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -191,6 +192,12 @@ STATICFILES_FINDERS = [
 MEDIA_ROOT = str(APPS_DIR / "media")
 # https://docs.djangoproject.com/en/dev/ref/settings/#media-url
 MEDIA_URL = "/media/"
+# https://docs.djangoproject.com/en/dev/ref/settings/#file-upload-handlers
+# The stock handlers, hashing uploads as they stream in for content-addressed storage.
+FILE_UPLOAD_HANDLERS = [
+    "pdf_web.documents.uploads.HashingMemoryFileUploadHandler",
+    "pdf_web.documents.uploads.HashingTemporaryFileUploadHandler",
+]
 
 # STORAGE
 # ------------------------------------------------------------------------------
@@ -199,16 +206,23 @@ STORAGES = {
     "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
     "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
 }
+# Presigned URLs (S3 only) for direct uploads and downloads expire after this long.
+PRESIGNED_URL_EXPIRY_SECONDS = env.int("PRESIGNED_URL_EXPIRY_SECONDS", default=900)
 if STORAGE_BACKEND == "s3":
     STORAGES["default"] = {"BACKEND": "storages.backends.s3boto3.S3Boto3Storage"}
     AWS_ACCESS_KEY_ID = env("AWS_ACCESS_KEY_ID")
     AWS_SECRET_ACCESS_KEY = env("AWS_SECRET_ACCESS_KEY")
     AWS_STORAGE_BUCKET_NAME = env("AWS_STORAGE_BUCKET_NAME")
     AWS_S3_REGION_NAME = env("AWS_S3_REGION_NAME", default="")
+    # Set to use an S3-compatible store such as MinIO.
+    AWS_S3_ENDPOINT_URL = env("AWS_S3_ENDPOINT_URL", default=None)
     AWS_S3_SIGNATURE_VERSION = "s3v4"
     AWS_S3_FILE_OVERWRITE = False
     AWS_DEFAULT_ACL = None
     AWS_QUERYSTRING_AUTH = True
+    AWS_QUERYSTRING_EXPIRE = PRESIGNED_URL_EXPIRY_SECONDS
+# Direct uploads larger than this are sent as a multipart upload in parts of this size (5 MiB minimum).
+DIRECT_UPLOAD_PART_BYTES = env.int("DIRECT_UPLOAD_PART_BYTES", default=64 * 1024**2)
 
 # TEMPLATES
 # ------------------------------------------------------------------------------
@@ -338,6 +352,89 @@ CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 CELERY_WORKER_SEND_TASK_EVENTS = True
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#std-setting-task_send_sent_event
 CELERY_TASK_SEND_SENT_EVENT = True
+# https://docs.celeryq.dev/en/stable/userguide/configuration.html#task-default-queue
+CELERY_TASK_DEFAULT_QUEUE = "celery"
+# Per-queue worker profiles. Interactive queues (render, text) run many short
+# tasks with a deep prefetch; heavy queues run few long tasks with prefetch 1 so
+# a 5-minute LibreOffice conversion never holds shorter work hostage.
+# ``max_wait`` is the queue wait (seconds) above which a warning is logged.
+TASK_QUEUE_PROFILES = {
+    "render": {"concurrency": 4, "prefetch_multiplier": 4, "soft_time_limit": 120, "time_limit": 150, "max_wait": 5},
+    # Ingestion walks every page of the document, so it is budgeted by document rather than by page.
+    "ingest": {"concurrency": 2, "prefetch_multiplier": 1, "soft_time_limit": 1800, "time_limit": 1860, "max_wait": 30},
+    "text": {"concurrency": 4, "prefetch_multiplier": 4, "soft_time_limit": 120, "time_limit": 150, "max_wait": 5},
+    "operations": {"concurrency": 2, "prefetch_multiplier": 1, "soft_time_limit": 300, "time_limit": 360, "max_wait": 60},
+    "conversion-heavy": {"concurrency": 2, "prefetch_multiplier": 1, "soft_time_limit": 600, "time_limit": 660, "max_wait": 300},
+    "ai": {"concurrency": 2, "prefetch_multiplier": 1, "soft_time_limit": 300, "time_limit": 360, "max_wait": 60},
+}
+# https://docs.celeryq.dev/en/stable/userguide/configuration.html#task-routes
+CELERY_TASK_ROUTES = {
+    "pdf_web.documents.tasks.ingest_version": {"queue": "ingest"},
+    "pdf_web.documents.tasks.complete_upload": {"queue": "ingest"},
+    "pdf_web.documents.tasks.render_page_images": {"queue": "render"},
+    "pdf_web.documents.tasks.extract_metadata": {"queue": "text"},
+    "pdf_web.documents.tasks.extract_text_layout": {"queue": "text"},
+    "pdf_web.documents.tasks.parse_bookmarks": {"queue": "text"},
+    "pdf_web.documents.tasks.index_search": {"queue": "text"},
+    "pdf_web.ai.tasks.summarize_version": {"queue": "text"},
+    "pdf_web.documents.tasks.create_new_version_from_document": {"queue": "operations"},
+    "pdf_web.operations.tasks.apply_operation": {"queue": "operations"},
+    "pdf_web.operations.tasks.process_page_number_job": {"queue": "operations"},
+    "pdf_web.operations.tasks.process_crop_job": {"queue": "operations"},
+    "pdf_web.operations.tasks.process_watermark_job": {"queue": "operations"},
+    "pdf_web.operations.tasks.process_conversion_job": {"queue": "conversion-heavy"},
+    "pdf_web.operations.tasks.process_batch_conversion_job": {"queue": "operations"},
+    "pdf_web.operations.tasks.finalize_batch_conversion": {"queue": "operations"},
+    "pdf_web.operations.tasks.fail_stalled_batch_items": {"queue": "operations"},
+    "pdf_web.ai.tasks.ocr_document": {"queue": "conversion-heavy"},
+    "pdf_web.ai.tasks.suggest_redactions": {"queue": "ai"},
+    "pdf_web.ai.tasks.apply_redactions": {"queue": "ai"},
+    "pdf_web.ai.tasks.embed_document": {"queue": "ai"},
+}
+# https://docs.celeryq.dev/en/stable/userguide/configuration.html#task-annotations
+CELERY_TASK_ANNOTATIONS = {
+    task_name: {
+        "soft_time_limit": TASK_QUEUE_PROFILES[route["queue"]]["soft_time_limit"],
+        "time_limit": TASK_QUEUE_PROFILES[route["queue"]]["time_limit"],
+    }
+    for task_name, route in CELERY_TASK_ROUTES.items()
+}
+# Workers are started with CELERY_WORKER_QUEUES (see compose/*/celery/worker/start);
+# the first listed queue selects the concurrency and prefetch profile.
+WORKER_QUEUES = env.list("CELERY_WORKER_QUEUES", default=[])
+WORKER_QUEUE_PROFILE = TASK_QUEUE_PROFILES.get(WORKER_QUEUES[0]) if WORKER_QUEUES else None
+if WORKER_QUEUE_PROFILE:
+    # https://docs.celeryq.dev/en/stable/userguide/configuration.html#worker-concurrency
+    CELERY_WORKER_CONCURRENCY = WORKER_QUEUE_PROFILE["concurrency"]
+    # https://docs.celeryq.dev/en/stable/userguide/configuration.html#worker-prefetch-multiplier
+    CELERY_WORKER_PREFETCH_MULTIPLIER = WORKER_QUEUE_PROFILE["prefetch_multiplier"]
+# https://docs.celeryq.dev/en/stable/userguide/configuration.html#beat-schedule
+CELERY_BEAT_SCHEDULE = {
+    "report-queue-metrics": {
+        "task": "pdf_web.core.tasks.report_queue_metrics",
+        "schedule": 30.0,
+    },
+    "evict-page-render-cache": {
+        "task": "pdf_web.documents.tasks.evict_page_render_cache",
+        "schedule": 300.0,
+    },
+    "delete-orphan-page-content": {
+        "task": "pdf_web.documents.tasks.delete_orphan_page_content",
+        "schedule": 3600.0,
+    },
+    "delete-unreferenced-files": {
+        "task": "pdf_web.documents.tasks.delete_unreferenced_files",
+        "schedule": 3600.0,
+    },
+    "expire-upload-sessions": {
+        "task": "pdf_web.documents.tasks.expire_upload_sessions",
+        "schedule": 3600.0,
+    },
+    "fail-stalled-batch-items": {
+        "task": "pdf_web.operations.tasks.fail_stalled_batch_items",
+        "schedule": 300.0,
+    },
+}
 # django-allauth
 # ------------------------------------------------------------------------------
 ACCOUNT_ALLOW_REGISTRATION = env.bool("DJANGO_ACCOUNT_ALLOW_REGISTRATION", True)
@@ -441,9 +538,63 @@ SPECTACULAR_SETTINGS = {
     "SERVE_PERMISSIONS": ["rest_framework.permissions.IsAdminUser"],
     "SCHEMA_PATH_PREFIX": "/api/",
 }
+# Documents
+# ------------------------------------------------------------------------------
+# Worker processes used to rasterise one large document in render_page_images; 1 renders
+# in-process, as do prefork Celery workers, whose daemonic processes cannot start children.
+PAGE_RENDER_PROCESSES = env.int("PAGE_RENDER_PROCESSES", default=4)
+# Below this page count the process start-up cost outweighs the parallelism.
+PAGE_RENDER_POOL_MIN_PAGES = env.int("PAGE_RENDER_POOL_MIN_PAGES", default=24)
+PAGE_RENDER_CHUNK_SIZE = env.int("PAGE_RENDER_CHUNK_SIZE", default=8)
+PAGE_ASSET_STORAGE_WORKERS = env.int("PAGE_ASSET_STORAGE_WORKERS", default=8)
+PAGE_ASSET_BATCH_SIZE = env.int("PAGE_ASSET_BATCH_SIZE", default=50)
+# Pages rendered during ingestion; later pages are rendered when first requested.
+PAGE_EAGER_RENDER_PAGES = env.int("PAGE_EAGER_RENDER_PAGES", default=3)
+PAGE_RENDER_ALLOWED_DPIS = env.list("PAGE_RENDER_ALLOWED_DPIS", cast=int, default=[72, 150, 300])
+# Total bytes of stored page renders before the least recently viewed are evicted.
+PAGE_RENDER_CACHE_MAX_BYTES = env.int("PAGE_RENDER_CACHE_MAX_BYTES", default=5 * 1024**3)
+# Deep-zoom tiles: level n renders at 72 * 2**n dpi, so level 3 is 576 dpi.
+PAGE_TILE_SIZE = env.int("PAGE_TILE_SIZE", default=256)
+PAGE_TILE_MAX_LEVEL = env.int("PAGE_TILE_MAX_LEVEL", default=3)
+PAGE_TILE_CACHE_MAX_BYTES = env.int("PAGE_TILE_CACHE_MAX_BYTES", default=5 * 1024**3)
+# Pages returned per search request, most relevant first.
+SEARCH_DEFAULT_RESULTS = env.int("SEARCH_DEFAULT_RESULTS", default=20)
+SEARCH_MAX_RESULTS = env.int("SEARCH_MAX_RESULTS", default=100)
+# Stored PDFs at least this large are linearized during ingestion for progressive loading.
+PDF_LINEARIZE_MIN_BYTES = env.int("PDF_LINEARIZE_MIN_BYTES", default=512 * 1024)
+# Node-local copies of source PDFs for workers when the storage has no local paths.
+SOURCE_CACHE_DIR = env("SOURCE_CACHE_DIR", default=str(Path(tempfile.gettempdir()) / "pdf_web-sources"))
+SOURCE_CACHE_MAX_BYTES = env.int("SOURCE_CACHE_MAX_BYTES", default=10 * 1024**3)
+# Page-range extraction: sources kept open per process, and extracted PDFs cached up to this size.
+OPEN_DOCUMENT_CACHE_SIZE = env.int("OPEN_DOCUMENT_CACHE_SIZE", default=8)
+PAGE_RANGE_MAX_PAGES = env.int("PAGE_RANGE_MAX_PAGES", default=500)
+PAGE_RANGE_CACHE_MAX_BYTES = env.int("PAGE_RANGE_CACHE_MAX_BYTES", default=16 * 1024**2)
+PAGE_RANGE_CACHE_SECONDS = env.int("PAGE_RANGE_CACHE_SECONDS", default=24 * 60 * 60)
+# Resumable uploads are assembled here, on a volume shared by web and worker nodes.
+UPLOAD_SESSION_DIR = env("UPLOAD_SESSION_DIR", default=str(Path(tempfile.gettempdir()) / "pdf_web-uploads"))
+UPLOAD_MAX_BYTES = env.int("UPLOAD_MAX_BYTES", default=4 * 1024**3)
+UPLOAD_CHUNK_MAX_BYTES = env.int("UPLOAD_CHUNK_MAX_BYTES", default=64 * 1024**2)
+# Unfinished uploads untouched for this long are deleted with their part files.
+UPLOAD_SESSION_EXPIRY_HOURS = env.int("UPLOAD_SESSION_EXPIRY_HOURS", default=24)
+# Conversions
+# ------------------------------------------------------------------------------
+BATCH_CONVERSION_MAX_ITEMS = env.int("BATCH_CONVERSION_MAX_ITEMS", default=1000)
+# Upper bound on items of one batch converting at the same time, so a large
+# batch cannot monopolise the conversion-heavy workers.
+BATCH_CONVERSION_MAX_PARALLEL = env.int("BATCH_CONVERSION_MAX_PARALLEL", default=8)
+BATCH_CONVERSION_DEFAULT_PARALLEL = env.int("BATCH_CONVERSION_DEFAULT_PARALLEL", default=4)
 # AI
 # ------------------------------------------------------------------------------
 OPENAI_API_KEY = env("OPENAI_API_KEY", default="")
+# Dotted path of the chunk encoder class, and how many chunks it encodes per call.
+EMBEDDING_ENCODER = env("EMBEDDING_ENCODER", default="pdf_web.ai.encoders.HashingEncoder")
+EMBEDDING_BATCH_SIZE = env.int("EMBEDDING_BATCH_SIZE", default=256)
+# Chat retrieval indexes kept decoded in memory per process.
+CHUNK_INDEX_CACHE_SIZE = env.int("CHUNK_INDEX_CACHE_SIZE", default=32)
+# HNSW candidates examined per vector search (pgvector's hnsw.ef_search), and how many
+# lexical and vector matches each are fused into the chat ranking.
+VECTOR_SEARCH_EF = env.int("VECTOR_SEARCH_EF", default=200)
+RETRIEVAL_CANDIDATES = env.int("RETRIEVAL_CANDIDATES", default=50)
 # Your stuff...
 # ------------------------------------------------------------------------------
 
@@ -453,10 +604,10 @@ OPENAI_API_KEY = env("OPENAI_API_KEY", default="")
 #     "http://127.0.0.1:3000",  # Next.js dev server
 # ]
 
-CORS_ALLOW_HEADERS = list(default_headers)
+CORS_ALLOW_HEADERS = [*default_headers, "upload-offset", "upload-checksum", "range", "if-range"]
 CORS_ALLOW_METHODS = ["*"]
 
-CORS_EXPOSE_HEADERS = ["Content-Type", "Content-Disposition"]
+CORS_EXPOSE_HEADERS = ["Content-Type", "Content-Disposition", "Content-Length", "Content-Range", "Accept-Ranges", "ETag"]
 
 CORS_ALLOW_ALL_ORIGINS = env.bool("CORS_ALLOW_ALL_ORIGINS", default=False)
 CORS_ALLOW_PRIVATE_NETWORK = True
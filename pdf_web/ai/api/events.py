@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+def server_sent_event(event: str, data) -> bytes:
+    """One ``text/event-stream`` event carrying ``data`` as JSON on a single line."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients ask for ``text/event-stream``; responses that are not streams, such as errors, become an ``error`` event."""
+
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return server_sent_event("error", data)
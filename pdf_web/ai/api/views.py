@@ -2,21 +2,34 @@ from __future__ import annotations
 
 import re
 from collections import Counter
+from collections.abc import Iterator
 
+import numpy as np
+from django.conf import settings
 from django.db.models import Q
+from django.http import StreamingHttpResponse
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
+from pdf_web.ai.chunk_index import get_chunk_index
+from pdf_web.ai.chunk_index import tokenize
 from pdf_web.ai.models import ChatMessage
 from pdf_web.ai.models import ChatSession
 from pdf_web.ai.models import EmbeddingChunk
 from pdf_web.ai.models import RedactionSuggestion
+from pdf_web.ai.retrieval import nearest_chunk_ids
+from pdf_web.ai.retrieval import reciprocal_rank_fusion
+from pdf_web.ai.summaries import summary_sentences
+from pdf_web.ai.tasks import save_chat_reply
 from pdf_web.documents.models import WorkspaceRole
 from pdf_web.permissions import require_role
 
+from .events import EventStreamRenderer
+from .events import server_sent_event
 from .serializers import ChatMessageSerializer
 from .serializers import ChatSessionSerializer
 from .serializers import RedactionSuggestionSerializer
@@ -52,35 +65,112 @@ class ChatSessionViewSet(ModelViewSet):
         user_message = request.data.get("content", "")
         ChatMessage.objects.create(session=session, role="user", content=user_message)
 
-        intent, prompt, selected_text = _parse_message_context(user_message)
-        ranked_chunks = _rank_chunks(
-            EmbeddingChunk.objects.filter(version=session.document.current_version),
-            query=prompt,
-            selected_text=selected_text,
-            limit=5,
-        )
-        assistant_content = _generate_grounded_response(intent=intent, prompt=prompt, ranked_chunks=ranked_chunks)
-        message = ChatMessage.objects.create(session=session, role="assistant", content=assistant_content)
-        citations = [
-            {
-                "id": f"chunk-{entry['chunk'].id}",
-                "page": entry["chunk"].page_number,
-                "label": _label_from_text(entry["chunk"].text),
-                "relevance_score": round(entry["score"], 4),
-                "match_reasons": entry["reasons"],
-            }
-            for entry in ranked_chunks
-        ]
-        supporting_text = [
-            ((entry["chunk"].text or "").strip()[:280])
-            for entry in ranked_chunks
-            if (entry["chunk"].text or "").strip()
-        ]
+        sources, segments = _prepare_reply(session, user_message)
+        message = ChatMessage.objects.create(session=session, role="assistant", content="".join(segments))
         payload = ChatMessageSerializer(message).data
-        payload["citations"] = citations
-        payload["supporting_text"] = supporting_text[:3]
+        payload.update(sources)
         return Response(payload, status=status.HTTP_201_CREATED)
 
+    @action(detail=True, methods=["post"], url_path="stream", renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def stream(self, request, pk=None):
+        """Like ``message``, with the reply sent as server-sent events while it is produced.
+
+        A ``citations`` event comes first, then ``delta`` events carrying
+        segments of the answer, then ``done`` with the whole answer. The
+        assistant message is stored by a task once the answer is complete,
+        or cut short by a disconnect, so the stream never waits on that write.
+        """
+        session = self.get_object()
+        require_role(
+            request.user,
+            session.document.workspace,
+            [WorkspaceRole.VIEWER, WorkspaceRole.EDITOR, WorkspaceRole.ADMIN, WorkspaceRole.OWNER],
+        )
+        user_message = request.data.get("content", "")
+        ChatMessage.objects.create(session=session, role="user", content=user_message)
+        response = StreamingHttpResponse(_reply_events(session, user_message), content_type=EventStreamRenderer.media_type)
+        response["Cache-Control"] = "no-cache"
+        # Stops nginx from buffering the events until the reply is complete.
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+def _prepare_reply(session, user_message: str) -> tuple[dict, Iterator[str]]:
+    """The citations and supporting text of the reply, and the segments of the answer.
+
+    Summary requests are answered from the summary computed at ingest, when it
+    exists, without ranking chunks.
+    """
+    intent, prompt, selected_text = _parse_message_context(user_message)
+    version = session.document.current_version
+    if intent == "summary" and not selected_text:
+        sentences = summary_sentences(version, *_parse_page_range(user_message))
+        if sentences:
+            return _summary_payload(sentences), _summary_segments(sentences)
+    ranked_chunks = _rank_chunks(
+        version,
+        query=prompt,
+        selected_text=selected_text,
+        limit=5,
+    )
+    return _citation_payload(ranked_chunks), _grounded_response_segments(intent=intent, prompt=prompt, ranked_chunks=ranked_chunks)
+
+
+def _citation_payload(ranked_chunks: list[dict]) -> dict:
+    citations = [
+        {
+            "id": f"chunk-{entry['chunk'].id}",
+            "page": entry["chunk"].page_number,
+            "label": _label_from_text(entry["chunk"].text),
+            "relevance_score": round(entry["score"], 4),
+            "match_reasons": entry["reasons"],
+        }
+        for entry in ranked_chunks
+    ]
+    supporting_text = [
+        ((entry["chunk"].text or "").strip()[:280])
+        for entry in ranked_chunks
+        if (entry["chunk"].text or "").strip()
+    ]
+    return {"citations": citations, "supporting_text": supporting_text[:3]}
+
+
+def _summary_payload(sentences: list[dict]) -> dict:
+    citations = [
+        {
+            "id": f"summary-{index}",
+            "page": sentence["page"],
+            "label": _label_from_text(sentence["text"]),
+            "relevance_score": round(sentence["score"], 4),
+            "match_reasons": [f"precomputed summary of {sentence['section']}" if sentence["section"] else "precomputed summary"],
+        }
+        for index, sentence in enumerate(sentences, start=1)
+    ]
+    return {"citations": citations, "supporting_text": [sentence["text"][:280] for sentence in sentences[:3]]}
+
+
+def _summary_segments(sentences: list[dict]) -> Iterator[str]:
+    yield "Summary of the document's key sections:"
+    for sentence in sentences:
+        yield f"\n- {sentence['text']}"
+
+
+def _reply_events(session, user_message: str) -> Iterator[bytes]:
+    # Retrieval runs once the response has started, so the client is not left waiting on the headers.
+    sources, segments = _prepare_reply(session, user_message)
+    yield server_sent_event("citations", sources)
+    written = []
+    try:
+        for segment in segments:
+            written.append(segment)
+            yield server_sent_event("delta", {"content": segment})
+    finally:
+        # Also runs when the client disconnects mid-answer, keeping what it was sent.
+        content = "".join(written)
+        if content:
+            save_chat_reply.delay(session.pk, content)
+    yield server_sent_event("done", {"content": content})
+
 
 def _parse_message_context(raw_content: str) -> tuple[str, str, str]:
     if not raw_content:
@@ -96,8 +186,11 @@ def _parse_message_context(raw_content: str) -> tuple[str, str, str]:
     return intent, prompt, selected_text
 
 
-def _tokenize(text: str) -> list[str]:
-    return re.findall(r"[a-z0-9]+", (text or "").lower())
+def _parse_page_range(raw_content: str) -> tuple[int | None, int | None]:
+    match = re.search(r"^Page range:\s*(\d+)(?:\s*-\s*(\d+))?", raw_content or "", flags=re.IGNORECASE | re.MULTILINE)
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2) or match.group(1))
 
 
 def _label_from_text(text: str) -> str:
@@ -108,66 +201,81 @@ def _label_from_text(text: str) -> str:
     return sentence[:120]
 
 
-def _rank_chunks(queryset, query: str, selected_text: str, limit: int = 5):
-    chunks = list(queryset)
-    if not chunks:
+def _rank_chunks(version, query: str, selected_text: str, limit: int = 5):
+    """The ``limit`` chunks of ``version`` best matching the question, by lexical and vector search fused.
+
+    The top ``RETRIEVAL_CANDIDATES`` chunks by BM25 over the version's chunk
+    index, where terms of the selected text count half as much, and by embedding
+    similarity are combined with reciprocal rank fusion, so chunks found by both
+    come first. Only the chunks returned are loaded.
+    """
+    index = get_chunk_index(version) if version is not None else None
+    if index is None or not len(index.chunk_ids):
         return []
 
-    query_tokens = _tokenize(query)
-    selected_tokens = _tokenize(selected_text)
-    query_counter = Counter(query_tokens)
-    selected_counter = Counter(selected_tokens)
+    query_scores = index.score(Counter(tokenize(query)))
+    selected_scores = index.score(Counter(tokenize(selected_text)))
+    scores = query_scores + 0.5 * selected_scores
+    matched = np.flatnonzero(scores)
+    # Highest score first, ties in document order.
+    lexical = index.chunk_ids[matched[np.lexsort((matched, -scores[matched]))][: settings.RETRIEVAL_CANDIDATES]].tolist()
+    similar = nearest_chunk_ids(version, " ".join(filter(None, (query, selected_text))), settings.RETRIEVAL_CANDIDATES)
+    vector_ranks = {chunk_id: rank for rank, chunk_id in enumerate(similar, start=1)}
+    # Chunks the index no longer covers were replaced since it was built.
+    fused = {chunk_id: score for chunk_id, score in reciprocal_rank_fusion(lexical, similar).items() if chunk_id in index.positions}
+    top = list(fused)[:limit]
+    # Chunks matching nothing fill up the rest in document order.
+    chosen = set(top)
+    top = [*top, *(chunk_id for chunk_id in index.chunk_ids[: 2 * limit].tolist() if chunk_id not in chosen)][:limit]
+    chunks = EmbeddingChunk.objects.in_bulk(top)
 
     ranked = []
-    for chunk in chunks:
-        chunk_text = (chunk.text or "").strip()
-        chunk_tokens = _tokenize(chunk_text)
-        chunk_counter = Counter(chunk_tokens)
-
-        query_overlap = sum(min(chunk_counter[t], c) for t, c in query_counter.items())
-        selected_overlap = sum(min(chunk_counter[t], c) for t, c in selected_counter.items())
-        density = (query_overlap + (0.5 * selected_overlap)) / max(len(chunk_tokens), 1)
-        coverage = query_overlap / max(len(query_tokens), 1)
-
-        score = (2.5 * coverage) + (4 * density) + (0.8 * selected_overlap)
+    for chunk_id in top:
+        chunk = chunks.get(chunk_id)
+        if chunk is None:
+            continue
+        position = index.positions[chunk_id]
         reasons = []
-        if query_overlap:
-            reasons.append(f"query token overlap: {query_overlap}")
-        if selected_overlap:
-            reasons.append(f"selection overlap: {selected_overlap}")
-        if not reasons:
+        if query_scores[position]:
+            reasons.append(f"query terms BM25: {query_scores[position]:.2f}")
+        if selected_scores[position]:
+            reasons.append(f"selection terms BM25: {selected_scores[position]:.2f}")
+        if chunk_id in vector_ranks:
+            reasons.append(f"embedding similarity rank: {vector_ranks[chunk_id]}")
+        if chunk_id not in fused:
             reasons.append("fallback by document order")
+        ranked.append({"chunk": chunk, "score": fused.get(chunk_id, 0.0), "reasons": reasons})
+    return ranked
 
-        ranked.append({"chunk": chunk, "score": score, "reasons": reasons})
-
-    ranked.sort(key=lambda entry: (entry["score"], -entry["chunk"].chunk_index), reverse=True)
-    return ranked[:limit]
 
-
-def _generate_grounded_response(intent: str, prompt: str, ranked_chunks: list[dict]) -> str:
+def _grounded_response_segments(intent: str, prompt: str, ranked_chunks: list[dict]) -> Iterator[str]:
+    """The reply in the order it is written, a line at a time."""
     if not ranked_chunks:
-        return "I couldn't find indexed document context yet. Please try again after document indexing completes."
+        yield "I couldn't find indexed document context yet. Please try again after document indexing completes."
+        return
 
     top_snippets = [entry["chunk"].text.strip() for entry in ranked_chunks if entry["chunk"].text.strip()]
     top_snippets = top_snippets[:3]
 
     if intent == "summary":
-        bullets = [f"- {snippet[:220]}" for snippet in top_snippets]
-        return "Summary based on the most relevant passages:\n" + "\n".join(bullets)
+        yield "Summary based on the most relevant passages:"
+        for snippet in top_snippets:
+            yield f"\n- {snippet[:220]}"
+        return
 
     if intent == "explain":
         explanation = top_snippets[0][:320] if top_snippets else ""
-        return (
-            "Plain-language explanation:\n"
-            f"{explanation}\n\n"
-            "In short: this section describes key points from the document context shown in citations."
-        )
+        yield "Plain-language explanation:\n"
+        yield f"{explanation}\n\n"
+        yield "In short: this section describes key points from the document context shown in citations."
+        return
 
     if prompt:
-        answer_prefix = f"Answer to your question ({prompt[:120]}):"
+        yield f"Answer to your question ({prompt[:120]}):\n"
     else:
-        answer_prefix = "Answer to your question:"
-    return answer_prefix + "\n" + "\n".join(f"- {snippet[:220]}" for snippet in top_snippets)
+        yield "Answer to your question:\n"
+    for index, snippet in enumerate(top_snippets):
+        yield ("\n- " if index else "- ") + snippet[:220]
 
 
 class RedactionSuggestionViewSet(ModelViewSet):
@@ -0,0 +1,165 @@
+"""Per-version inverted index of embedding chunks, scored with BM25.
+
+The index is built when a version is embedded and stored column-wise like page
+layouts: the vocabulary as a zstd-compressed JSON list whose positions are the
+term ids, then little-endian arrays of postings offsets per term, chunk
+positions and term frequencies per posting, token counts per chunk and the
+chunk ids. A question only reads the postings of its own terms, and decoded
+indexes stay cached per process until the version is embedded again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import re
+import threading
+from collections import Counter
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+import zstandard
+from django.conf import settings
+
+from pdf_web.ai.models import ChunkIndex
+
+ZSTD_LEVEL = 3
+# Standard BM25 parameters: term frequency saturation and length normalisation.
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_TERM_FREQUENCY = 0xFFFF
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_lock = threading.Lock()
+_loaded: OrderedDict[int, tuple[str, InvertedIndex]] = OrderedDict()
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+@dataclass(frozen=True)
+class InvertedIndex:
+    terms: list[str]
+    offsets: np.ndarray
+    postings: np.ndarray
+    frequencies: np.ndarray
+    lengths: np.ndarray
+    chunk_ids: np.ndarray
+
+    @classmethod
+    def build(cls, chunks: list[tuple[int, str]]) -> InvertedIndex:
+        """Index ``(chunk id, text)`` pairs; positions in the list are the chunk positions."""
+        vocabulary: dict[str, int] = {}
+        term_ids, positions, frequencies, lengths = [], [], [], []
+        for position, (_, text) in enumerate(chunks):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                positions.append(position)
+                frequencies.append(min(count, MAX_TERM_FREQUENCY))
+        term_ids = np.asarray(term_ids, dtype=np.uint32)
+        # Stable, so each term's postings stay in chunk order.
+        order = np.argsort(term_ids, kind="stable")
+        return cls(
+            terms=list(vocabulary),
+            offsets=np.concatenate(([0], np.cumsum(np.bincount(term_ids, minlength=len(vocabulary))))).astype("<u4"),
+            postings=np.asarray(positions, dtype="<u4")[order],
+            frequencies=np.asarray(frequencies, dtype="<u2")[order],
+            lengths=np.asarray(lengths, dtype="<u4"),
+            chunk_ids=np.asarray([chunk_id for chunk_id, _ in chunks], dtype="<i8"),
+        )
+
+    @classmethod
+    def decode(cls, row) -> InvertedIndex:
+        return cls(
+            terms=json.loads(zstandard.ZstdDecompressor().decompress(bytes(row.terms))),
+            offsets=np.frombuffer(bytes(row.offsets), dtype="<u4"),
+            postings=np.frombuffer(bytes(row.postings), dtype="<u4"),
+            frequencies=np.frombuffer(bytes(row.frequencies), dtype="<u2"),
+            lengths=np.frombuffer(bytes(row.lengths), dtype="<u4"),
+            chunk_ids=np.frombuffer(bytes(row.chunk_ids), dtype="<i8"),
+        )
+
+    def encode(self) -> dict[str, bytes]:
+        """Column values for a ``ChunkIndex`` row, with a hash covering every column."""
+        columns = {
+            "terms": zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(
+                json.dumps(self.terms, ensure_ascii=False, separators=(",", ":")).encode(),
+            ),
+            "offsets": self.offsets.tobytes(),
+            "postings": self.postings.tobytes(),
+            "frequencies": self.frequencies.tobytes(),
+            "lengths": self.lengths.tobytes(),
+            "chunk_ids": self.chunk_ids.tobytes(),
+        }
+        hasher = hashlib.blake2b(digest_size=16)
+        for value in columns.values():
+            hasher.update(len(value).to_bytes(8, "little"))
+            hasher.update(value)
+        return {**columns, "content_hash": hasher.hexdigest()}
+
+    @cached_property
+    def term_ids(self) -> dict[str, int]:
+        return {term: term_id for term_id, term in enumerate(self.terms)}
+
+    @cached_property
+    def positions(self) -> dict[int, int]:
+        """Position of each chunk id in the index."""
+        return {int(chunk_id): position for position, chunk_id in enumerate(self.chunk_ids)}
+
+    @cached_property
+    def _length_norms(self) -> np.ndarray:
+        average = float(self.lengths.mean()) if len(self.lengths) else 0.0
+        return BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / (average or 1.0))
+
+    def score(self, query: Counter) -> np.ndarray:
+        """BM25 score of every chunk for ``query`` term counts; chunks without a query term score zero."""
+        scores = np.zeros(len(self.chunk_ids), dtype=np.float64)
+        for term, weight in query.items():
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            chunks = self.postings[start:end]
+            frequencies = self.frequencies[start:end].astype(np.float64)
+            idf = math.log(1 + (len(self.chunk_ids) - (end - start) + 0.5) / ((end - start) + 0.5))
+            scores[chunks] += weight * idf * frequencies * (BM25_K1 + 1) / (frequencies + self._length_norms[chunks])
+        return scores
+
+
+def build_chunk_index(version) -> None:
+    """Index the embedding chunks of ``version``, replacing its previous index."""
+    chunks = list(version.embedding_chunks.order_by("page_number", "chunk_index").values_list("pk", "text"))
+    ChunkIndex.objects.update_or_create(version=version, defaults=InvertedIndex.build(chunks).encode())
+
+
+def get_chunk_index(version) -> InvertedIndex | None:
+    """The index of ``version``, decoded once per process and reloaded when it is rebuilt.
+
+    Versions embedded before indexes were kept get theirs built on first use.
+    """
+    content_hash = ChunkIndex.objects.filter(version=version).values_list("content_hash", flat=True).first()
+    if content_hash is None:
+        if not version.embedding_chunks.exists():
+            return None
+        build_chunk_index(version)
+    with _lock:
+        cached = _loaded.get(version.pk)
+        if cached is not None and cached[0] == content_hash:
+            _loaded.move_to_end(version.pk)
+            return cached[1]
+    row = ChunkIndex.objects.filter(version=version).first()
+    if row is None:
+        return None
+    index = InvertedIndex.decode(row)
+    with _lock:
+        _loaded[version.pk] = (row.content_hash, index)
+        _loaded.move_to_end(version.pk)
+        while len(_loaded) > settings.CHUNK_INDEX_CACHE_SIZE:
+            _loaded.popitem(last=False)
+    return index
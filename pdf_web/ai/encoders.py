@@ -0,0 +1,68 @@
+"""Text encoders turning chunks into embedding vectors.
+
+``EMBEDDING_ENCODER`` names the encoder class. An encoder has a ``name``, stored
+with each chunk so embeddings are only reused by the encoder that made them, and
+an ``encode(texts)`` method returning one row per text. The default hashing
+encoder runs in process on the CPU, with no model to download and no network.
+"""
+
+from __future__ import annotations
+
+import re
+import zlib
+from collections.abc import Sequence
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+EMBEDDING_DIMENSIONS = 1536
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class HashingEncoder:
+    """Signed feature hashing of words and adjacent word pairs, with log-scaled counts.
+
+    Texts sharing vocabulary and phrasing end up close together, which is what
+    retrieval over a single document needs; there is nothing to train or load.
+    """
+
+    name = "hashing-v1"
+    dimensions = EMBEDDING_DIMENSIONS
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        rows, features = [], []
+        for row, text in enumerate(texts):
+            tokens = _TOKEN_RE.findall(text.lower())
+            grams = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+            rows.extend([row] * len(grams))
+            features.extend(grams)
+        hashes = np.fromiter(
+            (zlib.crc32(feature.encode()) for feature in features), dtype=np.uint32, count=len(features)
+        ).astype(np.int64)
+        # The high bit picks the sign, so colliding features tend to cancel rather than pile up.
+        signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        np.add.at(vectors, (np.asarray(rows, dtype=np.int64), hashes % self.dimensions), signs)
+        return np.sign(vectors) * np.log1p(np.abs(vectors))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale every row to unit length, leaving all-zero rows of empty texts at zero."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+@lru_cache(maxsize=None)
+def _load_encoder(path: str):
+    encoder = import_string(path)()
+    if encoder.dimensions != EMBEDDING_DIMENSIONS:
+        raise ImproperlyConfigured(f"{path} makes {encoder.dimensions}-dimensional vectors; chunks store {EMBEDDING_DIMENSIONS}.")
+    return encoder
+
+
+def get_encoder():
+    """The configured encoder, loaded once per process."""
+    return _load_encoder(settings.EMBEDDING_ENCODER)
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.9 on 2026-10-19 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='embeddingchunk',
+            name='text_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
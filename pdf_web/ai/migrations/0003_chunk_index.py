@@ -0,0 +1,30 @@
+# Generated by Django 5.0.9 on 2026-10-19 06:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0002_embedding_chunk_text_hash'),
+        ('documents', '0011_upload_session_direct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=32)),
+                ('terms', models.BinaryField()),
+                ('offsets', models.BinaryField()),
+                ('postings', models.BinaryField()),
+                ('frequencies', models.BinaryField()),
+                ('lengths', models.BinaryField()),
+                ('chunk_ids', models.BinaryField()),
+                ('built_at', models.DateTimeField(auto_now=True)),
+                ('version', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='chunk_index', to='documents.documentversion')),
+            ],
+        ),
+    ]
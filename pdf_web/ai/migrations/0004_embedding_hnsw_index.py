@@ -0,0 +1,19 @@
+# Generated by Django 5.0.9 on 2026-10-19 06:52
+
+import pgvector.django.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0003_chunk_index'),
+        ('documents', '0011_upload_session_direct'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='embeddingchunk',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='ai_chunk_embedding_hnsw', opclasses=['vector_ip_ops']),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.9 on 2026-10-19 07:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0004_embedding_hnsw_index'),
+        ('documents', '0011_upload_session_direct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sentences', models.JSONField(default=list)),
+                ('sections', models.JSONField(default=list)),
+                ('built_at', models.DateTimeField(auto_now=True)),
+                ('version', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='documents.documentversion')),
+            ],
+        ),
+    ]
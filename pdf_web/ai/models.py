@@ -3,6 +3,7 @@ from __future__ import annotations
 from django.conf import settings
 from django.db import models
 from django.utils import timezone
+from pgvector.django import HnswIndex
 from pgvector.django import VectorField
 
 from pdf_web.documents.models import Document
@@ -44,11 +45,56 @@ class EmbeddingChunk(models.Model):
     page_number = models.PositiveIntegerField(default=1)
     chunk_index = models.PositiveIntegerField(default=0)
     text = models.TextField()
+    # SHA-256 of ``text``; chunks with the same text share an embedding instead of being encoded again.
+    text_hash = models.CharField(max_length=64, blank=True)
     embedding = VectorField(dimensions=1536)
     metadata = models.JSONField(default=dict, blank=True)
 
     class Meta:
         unique_together = ("version", "page_number", "chunk_index")
+        indexes = [
+            # Embeddings are unit length, so inner product ranks like cosine similarity at a lower cost.
+            HnswIndex(
+                name="ai_chunk_embedding_hnsw",
+                fields=["embedding"],
+                m=16,
+                ef_construction=64,
+                opclasses=["vector_ip_ops"],
+            ),
+        ]
+
+
+class ChunkIndex(models.Model):
+    """BM25 inverted index over the embedding chunks of a version; see ``pdf_web.ai.chunk_index``."""
+
+    version = models.OneToOneField(
+        DocumentVersion,
+        on_delete=models.CASCADE,
+        related_name="chunk_index",
+    )
+    content_hash = models.CharField(max_length=32)
+    terms = models.BinaryField()
+    offsets = models.BinaryField()
+    postings = models.BinaryField()
+    frequencies = models.BinaryField()
+    lengths = models.BinaryField()
+    chunk_ids = models.BinaryField()
+    built_at = models.DateTimeField(auto_now=True)
+
+
+class DocumentSummary(models.Model):
+    """Extractive summary of a version and of each of its sections; see ``pdf_web.ai.summaries``."""
+
+    version = models.OneToOneField(
+        DocumentVersion,
+        on_delete=models.CASCADE,
+        related_name="summary",
+    )
+    # ``page``, ``text``, ``score`` and ``section`` of each sentence, in reading order.
+    sentences = models.JSONField(default=list)
+    # ``title``, ``first_page``, ``last_page``, ``digest`` of the pages and ``sentences`` of each section.
+    sections = models.JSONField(default=list)
+    built_at = models.DateTimeField(auto_now=True)
 
 
 class ChatSession(models.Model):
@@ -0,0 +1,66 @@
+"""Vector search over chunk embeddings, and fusion with the lexical ranking.
+
+Embeddings are unit length, so the HNSW index on ``EmbeddingChunk.embedding``
+orders by inner product, which ranks exactly like cosine similarity. The index
+is scanned before rows are filtered to the version, so the search is widened to
+``VECTOR_SEARCH_EF`` candidates to leave enough of them once filtered. When too
+few of them belong to the version, its rows are ranked exactly instead.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.db import connection
+from django.db import transaction
+from pgvector.django import MaxInnerProduct
+
+from pdf_web.ai.encoders import get_encoder
+from pdf_web.ai.encoders import normalize
+from pdf_web.ai.models import EmbeddingChunk
+
+# The usual constant from the reciprocal rank fusion paper; it damps the weight of the very top ranks.
+RRF_K = 60
+
+
+def nearest_chunk_ids(version, text: str, limit: int) -> list[int]:
+    """Ids of the ``limit`` chunks of ``version`` whose embeddings are closest to that of ``text``, closest first."""
+    vector = normalize(get_encoder().encode([text]))[0]
+    if not vector.any():
+        return []
+    return nearest_to_vector(version, vector, limit)
+
+
+def nearest_to_vector(version, vector, limit: int) -> list[int]:
+    """Ids of the ``limit`` chunks of ``version`` with the largest inner product with the unit ``vector``."""
+    nearest = (
+        EmbeddingChunk.objects.filter(version=version)
+        .annotate(distance=MaxInnerProduct("embedding", vector))
+        .order_by("distance")
+        .values_list("pk", "distance")[:limit]
+    )
+    # SET takes no parameters; the settings last until the end of the enclosing transaction.
+    with transaction.atomic(savepoint=False), connection.cursor() as cursor:
+        cursor.execute(f"SET LOCAL hnsw.ef_search = {max(int(settings.VECTOR_SEARCH_EF), limit)}")
+        rows = list(nearest)
+        if len(rows) < limit:
+            # Fewer than ``limit`` of the index's candidates were this version's, or it has fewer chunks
+            # than that: rank the version's own rows exactly, which reaches them through the version index.
+            cursor.execute("SET LOCAL enable_indexscan = off")
+            try:
+                rows = list(nearest.all())
+            finally:
+                cursor.execute("RESET enable_indexscan")
+    # The distance is the negated inner product; chunks sharing nothing with the text are no match.
+    # Filtering them in SQL would lead the planner to sort the version's rows instead of using the index.
+    return [pk for pk, distance in rows if distance < 0]
+
+
+def reciprocal_rank_fusion(*rankings: Sequence[int], k: int = RRF_K) -> dict[int, float]:
+    """Fused scores of the ids in ``rankings``, best first; each ranking adds ``1 / (k + rank)``."""
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1 / (k + rank)
+    return dict(sorted(scores.items(), key=lambda entry: entry[1], reverse=True))
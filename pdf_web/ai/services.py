@@ -1,20 +1,91 @@
 from __future__ import annotations
 
+import hashlib
+
+from django.conf import settings
+
+from pdf_web.ai.chunk_index import build_chunk_index
+from pdf_web.ai.encoders import get_encoder
+from pdf_web.ai.encoders import normalize
 from pdf_web.ai.models import EmbeddingChunk
 
+CHUNK_WORDS = 200
+# Words repeated at the start of the next chunk, so a passage cut at a boundary is whole in one of them.
+CHUNK_OVERLAP_WORDS = 40
+EMBEDDING_INSERT_BATCH_SIZE = 2000
+
 
-def embed_document(version, user) -> None:
-    text = version.text_content or ""
+def chunk_page(text: str) -> list[str]:
+    """Overlapping windows of ``CHUNK_WORDS`` words over one page's text."""
     words = text.split()
-    chunk_size = 200
-    chunks = [" ".join(words[i : i + chunk_size]) for i in range(0, len(words), chunk_size)]
-    EmbeddingChunk.objects.filter(version=version).delete()
-    for index, chunk in enumerate(chunks or [text]):
-        EmbeddingChunk.objects.create(
-            version=version,
-            page_number=1,
-            chunk_index=index,
-            text=chunk,
-            embedding=[0.0] * 1536,
-            metadata={"source": "mvp"},
+    if not words:
+        return []
+    step = CHUNK_WORDS - CHUNK_OVERLAP_WORDS
+    return [" ".join(words[start:start + CHUNK_WORDS]) for start in range(0, max(len(words) - CHUNK_OVERLAP_WORDS, 1), step)]
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def embed_document(version, user) -> int:
+    """Chunk every page of ``version`` and embed the chunks, returning how many were encoded.
+
+    Chunks already stored with the same text are left alone, and embeddings of
+    identical text in the parent version are copied, so only new text is encoded,
+    in batches of ``EMBEDDING_BATCH_SIZE``. The retrieval index is rebuilt when
+    any chunk changed.
+    """
+    encoder = get_encoder()
+    pages = dict(version.page_texts.values_list("page_number", "text"))
+    if not pages:
+        # Versions indexed before per-page text was stored only have the joined text.
+        pages = {1: version.text_content or ""}
+    wanted = {
+        (page_number, index): (text, _text_hash(text))
+        for page_number, page_text in pages.items()
+        for index, text in enumerate(chunk_page(page_text))
+    }
+    stale = []
+    for pk, page_number, index, text_hash, encoder_name in EmbeddingChunk.objects.filter(version=version).values_list(
+        "pk", "page_number", "chunk_index", "text_hash", "metadata__encoder"
+    ):
+        if wanted.get((page_number, index), (None, None))[1] == text_hash and encoder_name == encoder.name:
+            del wanted[(page_number, index)]
+        else:
+            stale.append(pk)
+
+    known = {}
+    if wanted and version.parent_id:
+        known = dict(
+            EmbeddingChunk.objects.filter(
+                version_id=version.parent_id,
+                text_hash__in={text_hash for _, text_hash in wanted.values()},
+                metadata__encoder=encoder.name,
+            ).values_list("text_hash", "embedding")
         )
+    missing = list(dict.fromkeys(text for text, text_hash in wanted.values() if text_hash not in known))
+    for start in range(0, len(missing), settings.EMBEDDING_BATCH_SIZE):
+        batch = missing[start:start + settings.EMBEDDING_BATCH_SIZE]
+        known.update(zip(map(_text_hash, batch), normalize(encoder.encode(batch))))
+
+    if stale:
+        EmbeddingChunk.objects.filter(pk__in=stale).delete()
+    EmbeddingChunk.objects.bulk_create(
+        (
+            EmbeddingChunk(
+                version=version,
+                page_number=page_number,
+                chunk_index=index,
+                text=text,
+                text_hash=text_hash,
+                embedding=known[text_hash],
+                metadata={"encoder": encoder.name},
+            )
+            for (page_number, index), (text, text_hash) in sorted(wanted.items())
+        ),
+        batch_size=EMBEDDING_INSERT_BATCH_SIZE,
+    )
+    if stale or wanted or not hasattr(version, "chunk_index"):
+        build_chunk_index(version)
+    return len(missing)
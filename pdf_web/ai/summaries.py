@@ -0,0 +1,198 @@
+"""Extractive summaries of a version and of each of its sections, computed at ingest.
+
+Sections follow the top-level bookmarks, or run ``SECTION_PAGES`` pages at a
+time when there are none, titled by the first line of text on their first page.
+Sentences are taken from the text blocks of the page layouts, leaving out those
+repeated across the section's pages such as running headers and footers, and
+scored by how much of the section's vocabulary they carry. Each section is keyed
+by the content hashes of its pages, so a new version only summarizes sections
+whose pages changed and copies the others from its parent. The document summary
+is assembled from the section summaries without reading any text.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import re
+from collections import Counter
+
+from pdf_web.ai.chunk_index import tokenize
+from pdf_web.ai.models import DocumentSummary
+
+# Bumped when scoring changes, so summaries made the old way are not reused.
+SUMMARY_ALGORITHM = "extractive-v1"
+SUMMARY_SENTENCES = 5
+SECTION_SUMMARY_SENTENCES = 3
+SECTION_PAGES = 10
+MIN_SENTENCE_WORDS = 6
+MAX_SENTENCE_WORDS = 60
+# Sentences sharing more of their words than this with one already picked add nothing new.
+MAX_OVERLAP = 0.5
+MAX_TITLE_CHARS = 120
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+_STOPWORDS = frozenset(
+    "a about after all also an and any are as at be been but by can could did do does each for from had has have he her "
+    "his how if in into is it its may more most no not of on one or other our out over she should so some such than that "
+    "the their them then there these they this those through to under up was we were what when where which while who will "
+    "with would you your".split()
+)
+
+
+def _sections(version, page_count: int) -> list[dict]:
+    """``title``, ``first_page`` and ``last_page`` of each section, covering every page once."""
+    starts: dict[int, str] = {}
+    for title, page_number, tree in version.bookmarks.values_list("title", "page_number", "tree"):
+        if (tree or {}).get("level", 1) == 1 and 1 <= page_number <= page_count:
+            starts.setdefault(page_number, title)
+    if starts and 1 not in starts:
+        starts[1] = ""
+    if not starts:
+        starts = {first: "" for first in range(1, page_count + 1, SECTION_PAGES)}
+    firsts = sorted(starts)
+    return [
+        {"title": starts[first], "first_page": first, "last_page": (firsts[index + 1] - 1) if index + 1 < len(firsts) else page_count}
+        for index, first in enumerate(firsts)
+    ]
+
+
+def _digest(version, section: dict) -> str | None:
+    hashes = version.page_hashes[section["first_page"] - 1:section["last_page"]]
+    if not hashes or not all(hashes):
+        return None
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in (SUMMARY_ALGORITHM, section["title"], *hashes):
+        hasher.update(part.encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def _page_blocks(version, page_numbers: list[int]) -> dict[int, list[str]]:
+    """Text blocks of the given pages, or each page's whole text where no layout is stored."""
+    blocks = {
+        page.page_number: [block["text"] for block in page.layout.blocks() if block["block_type"] == 0]
+        for page in version.page_layouts.filter(page_number__in=page_numbers).select_related("layout")
+    }
+    missing = [page_number for page_number in page_numbers if page_number not in blocks]
+    if missing:
+        blocks.update(
+            (page_number, [text]) for page_number, text in version.page_texts.filter(page_number__in=missing).values_list("page_number", "text")
+        )
+    return blocks
+
+
+def summarize_section(blocks: dict[int, list[str]]) -> list[dict]:
+    """The ``SECTION_SUMMARY_SENTENCES`` most representative sentences of one section's pages, in reading order."""
+    sentences = {
+        page_number: [sentence for text in texts for sentence in _SENTENCE_RE.split(" ".join(text.split())) if sentence]
+        for page_number, texts in blocks.items()
+    }
+    pages_with = Counter(sentence for page_sentences in sentences.values() for sentence in set(page_sentences))
+    repeated = {sentence for sentence, pages in pages_with.items() if pages >= 2 and pages * 2 >= len(sentences)}
+
+    candidates = []
+    for page_number in sorted(sentences):
+        for sentence in sentences[page_number]:
+            words = tokenize(sentence)
+            if sentence not in repeated and MIN_SENTENCE_WORDS <= len(words) <= MAX_SENTENCE_WORDS:
+                candidates.append((page_number, sentence, {word for word in words if word not in _STOPWORDS and len(word) > 2}))
+    # Share of the section's content words each word accounts for, counted once per sentence.
+    frequencies = Counter(word for _, _, words in candidates for word in words)
+    total = sum(frequencies.values()) or 1
+
+    scored = sorted(
+        (
+            (sum(frequencies[word] for word in words) / total / math.sqrt(len(words)), position)
+            for position, (_, _, words) in enumerate(candidates)
+            if words
+        ),
+        key=lambda entry: (-entry[0], entry[1]),
+    )
+    picked: list[tuple[float, int]] = []
+    for score, position in scored:
+        words = candidates[position][2]
+        if all(len(words & candidates[other][2]) / len(words | candidates[other][2]) <= MAX_OVERLAP for _, other in picked):
+            picked.append((score, position))
+        if len(picked) == SECTION_SUMMARY_SENTENCES:
+            break
+    return [
+        {"page": candidates[position][0], "text": candidates[position][1], "score": round(score, 6)}
+        for score, position in sorted(picked, key=lambda entry: entry[1])
+    ]
+
+
+def _document_sentences(sections: list[dict]) -> list[dict]:
+    """The best sentence of each section first, then the runners-up, in reading order."""
+    ranked = []
+    for index, section in enumerate(sections):
+        sentences = section["sentences"]
+        by_score = sorted(range(len(sentences)), key=lambda position: -sentences[position]["score"])
+        ranked.extend((rank, -sentences[position]["score"], index, position) for rank, position in enumerate(by_score))
+    chosen = sorted((index, position) for _, _, index, position in sorted(ranked)[:SUMMARY_SENTENCES])
+    return [{**sections[index]["sentences"][position], "section": sections[index]["title"]} for index, position in chosen]
+
+
+def summarize_version(version) -> int:
+    """Store the summaries of ``version``, returning how many sections had to be summarized.
+
+    Sections whose pages are unchanged since the parent version keep the parent's
+    summary, moved to where the section now starts.
+    """
+    page_count = len(version.page_hashes) or (version.pdf_info or {}).get("page_count") or version.page_texts.count()
+    sections = _sections(version, page_count)
+    known = {}
+    if version.parent_id:
+        parent_summary = DocumentSummary.objects.filter(version_id=version.parent_id).first()
+        if parent_summary is not None:
+            known = {section["digest"]: section for section in parent_summary.sections if section.get("digest")}
+
+    stale = []
+    for section in sections:
+        section["digest"] = _digest(version, section)
+        reused = known.get(section["digest"]) if section["digest"] else None
+        if reused is None:
+            stale.append(section)
+            continue
+        shift = section["first_page"] - reused["first_page"]
+        section["title"] = section["title"] or reused["title"]
+        section["sentences"] = [{**sentence, "page": sentence["page"] + shift} for sentence in reused["sentences"]]
+
+    blocks = _page_blocks(version, [page for section in stale for page in range(section["first_page"], section["last_page"] + 1)])
+    for section in stale:
+        section_pages = range(section["first_page"], section["last_page"] + 1)
+        section["sentences"] = summarize_section({page: blocks.get(page, []) for page in section_pages})
+        if not section["title"]:
+            section["title"] = _untitled_section_title(section, blocks)
+
+    DocumentSummary.objects.update_or_create(
+        version=version,
+        defaults={"sentences": _document_sentences(sections), "sections": sections},
+    )
+    return len(stale)
+
+
+def _untitled_section_title(section: dict, blocks: dict[int, list[str]]) -> str:
+    """The first short line of text on the section's first page, which is usually its heading."""
+    for text in blocks.get(section["first_page"], []):
+        line = " ".join(text.split())
+        if line and len(line) <= MAX_TITLE_CHARS:
+            return line
+    if section["first_page"] == section["last_page"]:
+        return f"Page {section['first_page']}"
+    return f"Pages {section['first_page']}-{section['last_page']}"
+
+
+def summary_sentences(version, first_page: int | None = None, last_page: int | None = None) -> list[dict] | None:
+    """The stored summary of ``version``, or of the sections overlapping a page range; ``None`` if not computed yet."""
+    summary = DocumentSummary.objects.filter(version=version).first() if version is not None else None
+    if summary is None:
+        return None
+    if first_page is None:
+        return summary.sentences
+    last_page = last_page or first_page
+    return [
+        {**sentence, "section": section["title"]}
+        for section in summary.sections
+        if section["first_page"] <= last_page and section["last_page"] >= first_page
+        for sentence in section["sentences"]
+    ]
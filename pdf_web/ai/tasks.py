@@ -2,19 +2,22 @@ from __future__ import annotations
 
 import logging
 import re
+import tempfile
+from pathlib import Path
 
 from celery import shared_task
+from django.core.files import File
 from django.utils import timezone
 
+from pdf_web.ai.models import ChatMessage
 from pdf_web.ai.models import OcrJob
 from pdf_web.ai.models import OcrJobStatus
 from pdf_web.ai.models import RedactionSuggestion
-from pdf_web.documents.models import DocumentVersion
-from pdf_web.documents.tasks import extract_metadata
-from pdf_web.documents.tasks import extract_text_layout
-from pdf_web.documents.tasks import parse_bookmarks
-from pdf_web.documents.tasks import render_page_images
 from pdf_web.ai.services import embed_document as embed_document_service
+from pdf_web.ai.summaries import summarize_version as summarize_version_service
+from pdf_web.documents.models import DocumentVersion
+from pdf_web.documents.source_cache import local_source_path
+from pdf_web.documents.tasks import ingest_version
 
 logger = logging.getLogger(__name__)
 
@@ -28,27 +31,27 @@ def ocr_document(self, version_id: int, language: str = "eng") -> int:
             import ocrmypdf
         except ImportError as exc:
             raise RuntimeError("ocrmypdf not installed.") from exc
-        output_path = version.file.path.replace(".pdf", f"-ocr-{job.id}.pdf")
-        ocrmypdf.ocr(version.file.path, output_path, language=language, deskew=True)
-        new_version = DocumentVersion.objects.create(
-            document=version.document,
-            version_number=version.document.versions.count() + 1,
-            file=output_path,
-            created_by=version.created_by,
-            processing_state={"ocr": "completed"},
-        )
-        new_version.update_file_metadata()
-        new_version.save()
+        output_name = f"{Path(version.file.name).stem}-ocr-{job.id}.pdf"
+        with tempfile.TemporaryDirectory() as workdir:
+            output_path = Path(workdir) / output_name
+            ocrmypdf.ocr(local_source_path(version), output_path, language=language, deskew=True)
+            new_version = DocumentVersion(
+                document=version.document,
+                version_number=version.document.versions.count() + 1,
+                created_by=version.created_by,
+                processing_state={"ocr": "completed"},
+                parent=version,
+            )
+            with output_path.open("rb") as output:
+                new_version.attach_file(File(output, name=output_name))
+            new_version.save()
         job.status = OcrJobStatus.COMPLETED
         job.output_version = new_version
         job.finished_at = timezone.now()
         job.save(update_fields=["status", "output_version", "finished_at"])
-        extract_metadata.delay(new_version.id)
-        render_page_images.delay(new_version.id)
-        extract_text_layout.delay(new_version.id)
-        parse_bookmarks.delay(new_version.id)
+        ingest_version.delay(new_version.id)
         return job.id
-    except Exception as exc:  # noqa: BLE001
+    except Exception as exc:
         job.status = OcrJobStatus.FAILED
         job.finished_at = timezone.now()
         job.save(update_fields=["status", "finished_at"])
@@ -87,12 +90,11 @@ def apply_redactions(self, version_id: int, accepted_ids: list[int]) -> int:
     new_version = DocumentVersion.objects.create(
         document=version.document,
         version_number=version.document.versions.count() + 1,
-        file=version.file,
+        **version.shared_file_fields(),
         created_by=version.created_by,
         processing_state={"redactions": "applied"},
+        parent=version,
     )
-    new_version.update_file_metadata()
-    new_version.save()
     return new_version.id
 
 
@@ -101,3 +103,23 @@ def embed_document(self, version_id: int) -> int:
     version = DocumentVersion.objects.get(pk=version_id)
     embed_document_service(version, version.created_by)
     return version_id
+
+
+@shared_task(bind=True)
+def summarize_version(self, version_id: int) -> int:
+    """Precompute the document and section summaries the chat answers summary requests from."""
+    version = DocumentVersion.objects.get(pk=version_id)
+    try:
+        summarized = summarize_version_service(version)
+    except Exception as exc:
+        version.merge_processing_state({"summary": f"failed: {exc}"})
+        logger.exception("Summarizing version %s failed", version_id)
+        return 0
+    version.merge_processing_state({"summary": "completed"})
+    return summarized
+
+
+@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
+def save_chat_reply(self, session_id: int, content: str) -> int:
+    """Store an assistant reply that has already been streamed to the client."""
+    return ChatMessage.objects.create(session_id=session_id, role="assistant", content=content).pk
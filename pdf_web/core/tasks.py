@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import logging
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+
+from config.celery_app import QUEUE_WAIT_CACHE_KEY
+
+logger = logging.getLogger(__name__)
+
+
+def routed_queues() -> list[str]:
+    return [settings.CELERY_TASK_DEFAULT_QUEUE, *settings.TASK_QUEUE_PROFILES]
+
+
+def queue_depths(app) -> dict[str, int | None]:
+    depths: dict[str, int | None] = {}
+    with app.connection_for_read() as connection:
+        for queue in routed_queues():
+            # A failed passive declare closes its channel, so each queue gets a fresh one.
+            with connection.channel() as channel:
+                try:
+                    depths[queue] = channel.queue_declare(queue=queue, passive=True).message_count
+                except Exception:  # noqa: BLE001
+                    # Passive declares fail for queues no worker has declared yet.
+                    depths[queue] = None
+    return depths
+
+
+@shared_task(bind=True, ignore_result=True)
+def report_queue_metrics(self) -> dict[str, dict[str, float | int | None]]:
+    depths = queue_depths(self.app)
+    metrics = {
+        queue: {"depth": depth, "last_wait": cache.get(QUEUE_WAIT_CACHE_KEY.format(queue=queue))}
+        for queue, depth in depths.items()
+    }
+    for queue, values in metrics.items():
+        logger.info("Queue %s depth=%s last_wait=%s", queue, values["depth"], values["last_wait"])
+    return metrics
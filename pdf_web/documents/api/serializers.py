@@ -7,8 +7,12 @@ from pdf_web.documents.models import Document
 from pdf_web.documents.models import DocumentBookmark
 from pdf_web.documents.models import DocumentPageAsset
 from pdf_web.documents.models import DocumentVersion
+from pdf_web.documents.models import UploadSession
+from pdf_web.documents.models import UploadStatus
 from pdf_web.documents.models import Workspace
 from pdf_web.documents.models import WorkspaceMember
+from pdf_web.documents.presigned import presigned_urls_supported
+from pdf_web.documents.presigned import upload_urls
 from pdf_web.permissions import get_workspace_role
 
 
@@ -26,7 +30,42 @@ class WorkspaceMemberSerializer(serializers.ModelSerializer):
         read_only_fields = ["id"]
 
 
-class DocumentVersionSerializer(serializers.ModelSerializer):
+def query_list(request, param: str) -> set[str]:
+    """Comma-separated values of ``param``, which may also be repeated."""
+    if request is None:
+        return set()
+    return {name.strip() for value in request.query_params.getlist(param) for name in value.split(",") if name.strip()}
+
+
+class FieldSelectionMixin:
+    """Limits the output to the fields named in the ``?fields=`` query parameter."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = query_list(self.context.get("request"), "fields")
+        if selected:
+            for name in set(self.fields) - selected:
+                self.fields.pop(name)
+
+    @classmethod
+    def model_columns(cls, request=None) -> list[str]:
+        """Model fields read by this serializer's output, for ``QuerySet.only``."""
+        return _model_columns(cls(context={"request": request}))
+
+
+def _model_columns(serializer, prefix: str = "") -> list[str]:
+    opts = serializer.Meta.model._meta
+    concrete = {field.name for field in opts.concrete_fields}
+    columns = [f"{prefix}{opts.pk.name}"]
+    for field in serializer.fields.values():
+        if isinstance(field, serializers.ModelSerializer):
+            columns.extend(_model_columns(field, prefix=f"{prefix}{field.source}__"))
+        elif field.source in concrete:
+            columns.append(f"{prefix}{field.source}")
+    return columns
+
+
+class DocumentVersionSummarySerializer(FieldSelectionMixin, serializers.ModelSerializer):
     class Meta:
         model = DocumentVersion
         fields = [
@@ -40,8 +79,6 @@ class DocumentVersionSerializer(serializers.ModelSerializer):
             "created_at",
             "processing_state",
             "pdf_info",
-            "text_content",
-            "layout_json",
             "security_state",
         ]
         read_only_fields = [
@@ -51,13 +88,17 @@ class DocumentVersionSerializer(serializers.ModelSerializer):
             "created_at",
             "processing_state",
             "pdf_info",
-            "text_content",
-            "layout_json",
             "security_state",
         ]
 
 
-class DocumentSerializer(serializers.ModelSerializer):
+class DocumentVersionSerializer(DocumentVersionSummarySerializer):
+    class Meta(DocumentVersionSummarySerializer.Meta):
+        fields = [*DocumentVersionSummarySerializer.Meta.fields, "text_content"]
+        read_only_fields = [*DocumentVersionSummarySerializer.Meta.read_only_fields, "text_content"]
+
+
+class DocumentSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     current_version = DocumentVersionSerializer(read_only=True)
     workspace_role = serializers.SerializerMethodField()
 
@@ -80,8 +121,16 @@ class DocumentSerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         if not request or not getattr(request, "user", None) or not request.user.is_authenticated:
             return None
-        role = get_workspace_role(request.user, obj.workspace)
-        return str(role) if role else None
+        # Shared by every row of a list, so each workspace is looked up once.
+        roles = self.context.setdefault("workspace_roles", {})
+        if obj.workspace_id not in roles:
+            role = get_workspace_role(request.user, obj.workspace)
+            roles[obj.workspace_id] = str(role) if role else None
+        return roles[obj.workspace_id]
+
+
+class DocumentListSerializer(DocumentSerializer):
+    current_version = DocumentVersionSummarySerializer(read_only=True)
 
 
 class DocumentCreateSerializer(serializers.ModelSerializer):
@@ -101,6 +150,52 @@ class DocumentCreateSerializer(serializers.ModelSerializer):
         return value
 
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    # Fresh presigned PUTs for direct uploads still receiving, so a resumed upload gets unexpired ones.
+    upload_urls = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            "id",
+            "workspace",
+            "title",
+            "filename",
+            "size_bytes",
+            "received_bytes",
+            "direct",
+            "upload_urls",
+            "status",
+            "error",
+            "document",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = ["id", "received_bytes", "status", "error", "document", "created_at", "updated_at"]
+
+    def validate_filename(self, value):
+        if not value.lower().endswith(".pdf"):
+            raise serializers.ValidationError("Only PDF files are allowed.")
+        return value
+
+    def validate_size_bytes(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("The file is empty.")
+        if value > settings.UPLOAD_MAX_BYTES:
+            raise serializers.ValidationError("File too large.")
+        return value
+
+    def validate_direct(self, value):
+        if value and not presigned_urls_supported():
+            raise serializers.ValidationError("Direct uploads need S3 storage.")
+        return value
+
+    def get_upload_urls(self, obj: UploadSession) -> list[dict] | None:
+        if not obj.direct or obj.status != UploadStatus.RECEIVING:
+            return None
+        return upload_urls(obj)
+
+
 class DocumentPageAssetSerializer(serializers.ModelSerializer):
     thumb_url = serializers.SerializerMethodField()
     preview_url = serializers.SerializerMethodField()
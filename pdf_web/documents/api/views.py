@@ -1,31 +1,62 @@
 from __future__ import annotations
 
+import logging
+import mimetypes
+from pathlib import Path
 from typing import Any
 
+from django.conf import settings
 from django.db import transaction
 from django.db.models import Q
+from django.http import HttpResponse
+from django.http import HttpResponseRedirect
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.mixins import CreateModelMixin
+from rest_framework.mixins import RetrieveModelMixin
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.throttling import ScopedRateThrottle
+from rest_framework.viewsets import GenericViewSet
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
 from pdf_web.audit.utils import log_audit_event
+from pdf_web.documents.extraction import PageRangeError
+from pdf_web.documents.extraction import extract_page_range
+from pdf_web.documents.extraction import parse_page_range
+from pdf_web.documents.layout import is_valid_block
 from pdf_web.documents.models import Document
 from pdf_web.documents.models import DocumentBookmark
 from pdf_web.documents.models import DocumentPageAsset
 from pdf_web.documents.models import DocumentStatus
 from pdf_web.documents.models import DocumentVersion
+from pdf_web.documents.models import UploadSession
+from pdf_web.documents.models import UploadStatus
 from pdf_web.documents.models import Workspace
 from pdf_web.documents.models import WorkspaceMember
 from pdf_web.documents.models import WorkspaceRole
-from pdf_web.documents.tasks import extract_metadata
-from pdf_web.documents.tasks import extract_text_layout
-from pdf_web.documents.tasks import index_search
-from pdf_web.documents.tasks import parse_bookmarks
-from pdf_web.documents.tasks import render_page_images
+from pdf_web.documents.presigned import DirectUploadError
+from pdf_web.documents.presigned import complete_direct_upload
+from pdf_web.documents.presigned import download_url
+from pdf_web.documents.presigned import presigned_urls_supported
+from pdf_web.documents.presigned import start_direct_upload
+from pdf_web.documents.rendering import tile_levels
+from pdf_web.documents.search import search_version
+from pdf_web.documents.streaming import RangeNotSatisfiable
+from pdf_web.documents.streaming import iter_file_range
+from pdf_web.documents.streaming import parse_range
+from pdf_web.documents.tasks import DEFAULT_RENDER_DPIS
+from pdf_web.documents.tasks import complete_upload
+from pdf_web.documents.tasks import get_page_asset
+from pdf_web.documents.tasks import get_page_size
+from pdf_web.documents.tasks import get_page_tile
+from pdf_web.documents.tasks import ingest_version
+from pdf_web.documents.uploads import ChunkError
+from pdf_web.documents.uploads import append_chunk
 from pdf_web.operations.api.serializers import ConversionJobSerializer
 from pdf_web.operations.api.serializers import CropJobSerializer
 from pdf_web.operations.api.serializers import PageNumberJobSerializer
@@ -48,11 +79,17 @@ from pdf_web.permissions import require_role
 
 from .serializers import DocumentBookmarkSerializer
 from .serializers import DocumentCreateSerializer
+from .serializers import DocumentListSerializer
 from .serializers import DocumentPageAssetSerializer
 from .serializers import DocumentSerializer
 from .serializers import DocumentVersionSerializer
+from .serializers import DocumentVersionSummarySerializer
+from .serializers import UploadSessionSerializer
 from .serializers import WorkspaceMemberSerializer
 from .serializers import WorkspaceSerializer
+from .serializers import query_list
+
+logger = logging.getLogger(__name__)
 
 
 class WorkspaceViewSet(ModelViewSet):
@@ -91,10 +128,20 @@ class DocumentViewSet(ModelViewSet):
         workspace_id = self.request.query_params.get("workspace")
         if workspace_id:
             queryset = queryset.filter(workspace_id=workspace_id)
+        if self.action in {"list", "retrieve"}:
+            # Only columns the response shows are read, so list rows never pull version text.
+            columns = self.get_serializer_class().model_columns(self.request)
+            if any(column.startswith("current_version__") for column in columns):
+                queryset = queryset.select_related("current_version")
+            queryset = queryset.only("workspace", *columns)
         return queryset
 
     def get_serializer_class(self):
-        return DocumentCreateSerializer if self.action == "create" else DocumentSerializer
+        if self.action == "create":
+            return DocumentCreateSerializer
+        if self.action == "list" and "current_version" not in query_list(self.request, "expand"):
+            return DocumentListSerializer
+        return DocumentSerializer
 
     def perform_create(self, serializer):
         workspace = serializer.validated_data["workspace"]
@@ -107,22 +154,18 @@ class DocumentViewSet(ModelViewSet):
                 created_by=self.request.user,
                 status=DocumentStatus.PROCESSING,
             )
-            version = DocumentVersion.objects.create(
+            version = DocumentVersion(
                 document=document,
                 version_number=1,
-                file=file_obj,
                 created_by=self.request.user,
                 processing_state={"upload": "completed"},
             )
-            version.update_file_metadata()
-            version.save(update_fields=["file_hash", "size_bytes"])
+            # Hashed by the upload handler, so identical uploads share one stored file.
+            version.attach_file(file_obj)
+            version.save()
             document.current_version = version
             document.save(update_fields=["current_version", "status"])
-        extract_metadata.delay(version.id)
-        render_page_images.delay(version.id)
-        extract_text_layout.delay(version.id)
-        parse_bookmarks.delay(version.id)
-        index_search.delay(version.id)
+        ingest_version.delay(version.id)
         log_audit_event(request=self.request, workspace=workspace, action="document.upload", entity_type="Document", entity_id=document.id, metadata={"version_id": version.id})
         return document
 
@@ -154,6 +197,96 @@ class DocumentViewSet(ModelViewSet):
         )
 
 
+class UploadSessionViewSet(CreateModelMixin, RetrieveModelMixin, GenericViewSet):
+    """Resumable uploads for files too large for a single request.
+
+    ``POST`` declares the file, each ``PATCH`` appends one chunk as the raw request
+    body at ``Upload-Offset`` (optionally with its SHA-256 hex digest in
+    ``Upload-Checksum``), ``GET`` reports how much has arrived so an interrupted
+    client resumes from there, and ``finalize`` turns it into a document.
+
+    With S3 storage, ``"direct": true`` makes the client PUT the file to the
+    presigned ``upload_urls`` instead, one per part, so its bytes go straight to
+    the bucket; ``finalize`` then confirms the upload.
+    """
+
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = UploadSession.objects.filter(created_by=self.request.user)
+        if self.action in {"partial_update", "finalize"}:
+            # Appends and finalizing of one upload run one at a time.
+            queryset = queryset.select_for_update()
+        return queryset
+
+    def perform_create(self, serializer):
+        workspace = serializer.validated_data["workspace"]
+        require_role(self.request.user, workspace, [WorkspaceRole.EDITOR, WorkspaceRole.ADMIN, WorkspaceRole.OWNER])
+        session = serializer.save(created_by=self.request.user)
+        if session.direct:
+            start_direct_upload(session)
+            session.save(update_fields=["object_key", "multipart_id"])
+            return
+        session.part_path.parent.mkdir(parents=True, exist_ok=True)
+        session.part_path.touch()
+
+    def partial_update(self, request, pk=None):
+        session = self.get_object()
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except (KeyError, ValueError):
+            return Response({"detail": "Upload-Offset and Content-Length are required."}, status=status.HTTP_400_BAD_REQUEST)
+        if session.status != UploadStatus.RECEIVING:
+            return Response({"detail": "The upload is already finalized."}, status=status.HTTP_409_CONFLICT)
+        if session.direct:
+            return Response({"detail": "Direct uploads are sent to their upload URLs."}, status=status.HTTP_409_CONFLICT)
+        if offset != session.received_bytes:
+            return Response(
+                {"detail": "Upload-Offset does not match the bytes received.", "received_bytes": session.received_bytes},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if not 0 < length <= settings.UPLOAD_CHUNK_MAX_BYTES:
+            return Response({"detail": f"Chunks must be 1 to {settings.UPLOAD_CHUNK_MAX_BYTES} bytes."}, status=status.HTTP_400_BAD_REQUEST)
+        if offset + length > session.size_bytes:
+            return Response({"detail": "The chunk runs past the declared file size."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # Read straight from the request body; it is never buffered or parsed.
+            append_chunk(session, request.stream, length=length, checksum=request.headers.get("Upload-Checksum", ""))
+        except ChunkError as exc:
+            return Response({"detail": str(exc), "received_bytes": session.received_bytes}, status=status.HTTP_400_BAD_REQUEST)
+        session.save(update_fields=["received_bytes", "updated_at"])
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=["post"])
+    def finalize(self, request, pk=None):
+        session = self.get_object()
+        if session.status == UploadStatus.RECEIVING:
+            if session.direct:
+                try:
+                    complete_direct_upload(session)
+                except DirectUploadError as exc:
+                    return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+                session.received_bytes = session.size_bytes
+            elif session.received_bytes != session.size_bytes:
+                return Response(
+                    {"detail": "The upload is incomplete.", "received_bytes": session.received_bytes},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            session.document = Document.objects.create(
+                workspace=session.workspace,
+                title=session.title or session.filename,
+                created_by=request.user,
+                status=DocumentStatus.PROCESSING,
+            )
+            session.status = UploadStatus.FINALIZING
+            session.save(update_fields=["document", "status", "received_bytes", "multipart_id", "updated_at"])
+            transaction.on_commit(lambda: complete_upload.delay(str(session.pk)))
+            log_audit_event(request=request, workspace=session.workspace, action="document.upload", entity_type="Document", entity_id=session.document_id, metadata={"upload_id": str(session.pk)})
+        return Response(self.get_serializer(session).data, status=status.HTTP_202_ACCEPTED)
+
+
 class DocumentVersionViewSet(ReadOnlyModelViewSet):
     serializer_class = DocumentVersionSerializer
     permission_classes = [IsAuthenticated]
@@ -171,14 +304,92 @@ class DocumentVersionViewSet(ReadOnlyModelViewSet):
         document_id = self.request.query_params.get("document")
         if document_id:
             queryset = queryset.filter(document_id=document_id)
+        if self.action in {"list", "retrieve"}:
+            queryset = queryset.only(*self.get_serializer_class().model_columns(self.request))
         return queryset
 
+    def get_serializer_class(self):
+        if self.action == "list" and "text_content" not in query_list(self.request, "expand"):
+            return DocumentVersionSummarySerializer
+        return DocumentVersionSerializer
+
     @action(detail=True, methods=["get"], url_path="render-page")
     def render_page(self, request, pk=None):
         version = self.get_object()
-        page = int(request.query_params.get("page", "1"))
-        asset = version.page_assets.filter(page_number=page).first()
-        return Response({"page": page, "preview_url": request.build_absolute_uri(asset.preview_image.url) if asset and asset.preview_image else None})
+        page = self._requested_page(request, version)
+        if page is None:
+            return Response({"detail": "Page out of range."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            dpi = int(request.query_params.get("dpi", DEFAULT_RENDER_DPIS[0]))
+        except ValueError:
+            return Response({"detail": "dpi must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        if dpi not in settings.PAGE_RENDER_ALLOWED_DPIS:
+            return Response({"detail": f"dpi must be one of {settings.PAGE_RENDER_ALLOWED_DPIS}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            asset = get_page_asset(version, page, dpi)
+        except Exception:
+            logger.exception("Rendering page %s of version %s failed", page, version.id)
+            return Response({"detail": "Page cannot be rendered."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"page": page, "dpi": dpi, "preview_url": request.build_absolute_uri(asset.preview_image.url) if asset.preview_image else None})
+
+    def _requested_page(self, request, version) -> int | None:
+        try:
+            page = int(request.query_params.get("page", "1"))
+        except ValueError:
+            return None
+        page_count = (version.pdf_info or {}).get("page_count")
+        if page < 1 or (page_count and page > page_count):
+            return None
+        return page
+
+    @action(detail=True, methods=["get"], url_path="tiles")
+    def tiles(self, request, pk=None):
+        version = self.get_object()
+        page = self._requested_page(request, version)
+        if page is None:
+            return Response({"detail": "Page out of range."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            width, height = get_page_size(version, page)
+        except Exception:
+            logger.exception("Reading page %s of version %s failed", page, version.id)
+            return Response({"detail": "Page cannot be rendered."}, status=status.HTTP_400_BAD_REQUEST)
+        tile_url = self.reverse_action("tile", args=[version.pk])
+        return Response({
+            "page": page,
+            "width": width,
+            "height": height,
+            "tile_size": settings.PAGE_TILE_SIZE,
+            "format": "png",
+            "levels": tile_levels(width, height, tile_size=settings.PAGE_TILE_SIZE, max_level=settings.PAGE_TILE_MAX_LEVEL),
+            "tile_url": f"{tile_url}?page={page}&level={{level}}&column={{column}}&row={{row}}",
+        })
+
+    @action(detail=True, methods=["get"], url_path="tile")
+    def tile(self, request, pk=None):
+        version = self.get_object()
+        page = self._requested_page(request, version)
+        try:
+            level = int(request.query_params.get("level", "0"))
+            column = int(request.query_params.get("column", "0"))
+            row = int(request.query_params.get("row", "0"))
+        except ValueError:
+            return Response({"detail": "level, column and row must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        if page is None or not 0 <= level <= settings.PAGE_TILE_MAX_LEVEL:
+            return Response({"detail": "Tile out of range."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            width, height = get_page_size(version, page)
+        except Exception:
+            logger.exception("Reading page %s of version %s failed", page, version.id)
+            return Response({"detail": "Page cannot be rendered."}, status=status.HTTP_400_BAD_REQUEST)
+        grid = tile_levels(width, height, tile_size=settings.PAGE_TILE_SIZE, max_level=level)[level]
+        if not (0 <= column < grid["columns"] and 0 <= row < grid["rows"]):
+            return Response({"detail": "Tile out of range."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            tile = get_page_tile(version, page, level, column, row)
+        except Exception:
+            logger.exception("Rendering tile %s/%s/%s of page %s of version %s failed", level, column, row, page, version.id)
+            return Response({"detail": "Page cannot be rendered."}, status=status.HTTP_400_BAD_REQUEST)
+        return HttpResponseRedirect(request.build_absolute_uri(tile.image.url))
 
     @action(detail=True, methods=["get"], url_path="pages")
     def pages(self, request, pk=None):
@@ -189,21 +400,57 @@ class DocumentVersionViewSet(ReadOnlyModelViewSet):
     @action(detail=True, methods=["get"], url_path="layout")
     def layout(self, request, pk=None):
         version = self.get_object()
-        page = request.query_params.get("page")
-        layout = version.layout_json.get(str(page), []) if page and isinstance(version.layout_json, dict) else version.layout_json
-        return Response({"layout": layout})
+        if "page" not in request.query_params:
+            return Response({"layout": version.layout()})
+        page = self._requested_page(request, version)
+        if page is None:
+            return Response({"detail": "Page out of range."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"layout": version.page_layout(page)})
+
+    @action(detail=True, methods=["get"], url_path="words")
+    def words(self, request, pk=None):
+        """Every word of one page with its box and block/line ids, for client-side highlighting and selection."""
+        version = self.get_object()
+        page = self._requested_page(request, version)
+        if page is None:
+            return Response({"detail": "Page out of range."}, status=status.HTTP_400_BAD_REQUEST)
+        page_text = version.page_texts.select_related("words").defer("text", "search_vector").filter(page_number=page).first()
+        if page_text is None:
+            return Response({"detail": "Page has not been indexed."}, status=status.HTTP_404_NOT_FOUND)
+        # Word rows are content-addressed, so their hash is a strong validator.
+        etag = f'"{page_text.words.content_hash}"'
+        if request.headers.get("If-None-Match") == etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        elif request.query_params.get("encoding") == "binary":
+            response = HttpResponse(page_text.words.packed(), content_type="application/octet-stream")
+        else:
+            response = Response({"page": page, **page_text.words.columns()})
+        response["ETag"] = etag
+        return response
 
     @action(detail=True, methods=["post"], url_path="edit-text")
     def edit_text(self, request, pk=None):
         version = self.get_object()
         require_role(request.user, version.document.workspace, [WorkspaceRole.EDITOR, WorkspaceRole.ADMIN, WorkspaceRole.OWNER])
         layout = request.data.get("layout_json")
+        if layout is not None and not (
+            isinstance(layout, dict)
+            and all(
+                str(page).isdigit() and isinstance(blocks, list) and all(is_valid_block(block) for block in blocks)
+                for page, blocks in layout.items()
+            )
+        ):
+            return Response(
+                {"detail": "layout_json must map page numbers to lists of blocks with a 4-number bbox and an integer block_type."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         text_content = request.data.get("text_content", version.text_content)
         new_version = clone_version(version, created_by=request.user, processing_state={"edit_text": "completed", "font_detection": True})
         if layout is not None:
-            new_version.layout_json = layout
+            # Unedited pages keep referencing the layouts cloned from the source version.
+            new_version.set_page_layouts({int(page): blocks for page, blocks in layout.items()})
         new_version.text_content = text_content
-        new_version.save(update_fields=["layout_json", "text_content"])
+        new_version.save(update_fields=["text_content"])
         log_audit_event(request=request, workspace=version.document.workspace, action="version.edit_text", entity_type="DocumentVersion", entity_id=new_version.id)
         return Response(DocumentVersionSerializer(new_version).data, status=status.HTTP_201_CREATED)
 
@@ -215,16 +462,98 @@ class DocumentVersionViewSet(ReadOnlyModelViewSet):
     @action(detail=True, methods=["get"], url_path="download")
     def download(self, request, pk=None):
         version = self.get_object()
-        return Response({"url": request.build_absolute_uri(version.file.url)}) if version.file else Response({"detail": "No file available."}, status=404)
+        if not version.file:
+            return Response({"detail": "No file available."}, status=404)
+        if presigned_urls_supported(version.file.storage):
+            url = download_url(version.file, Path(version.file.name).name)
+        else:
+            url = request.build_absolute_uri(version.file.url)
+        return Response({
+            "url": url,
+            "stream_url": reverse("api:version-content", args=[version.pk], request=request),
+        })
+
+    @action(detail=True, methods=["get"], url_path="content")
+    def content(self, request, pk=None):
+        """The version's file streamed from storage, with ``Range`` requests answered by ``206`` partial content."""
+        version = self.get_object()
+        if not version.file:
+            return Response({"detail": "No file available."}, status=404)
+        name = version.file.name
+        storage = version.file.storage
+        size = version.size_bytes or storage.size(name)
+        # Version files never change, and the hash is that of their content.
+        etag = f'"{version.file_hash}"' if version.file_hash else None
+        if etag and request.headers.get("If-None-Match") == etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response["ETag"] = etag
+            return response
+        if presigned_urls_supported(storage):
+            # The bucket answers range requests itself; send the viewer there rather than relaying the bytes.
+            return HttpResponseRedirect(download_url(version.file, Path(name).name, attachment=False))
+        byte_range = None
+        # A stale If-Range validator means the client's partial copy is of other content: send it all.
+        if "Range" in request.headers and size and request.headers.get("If-Range", etag) == etag:
+            try:
+                byte_range = parse_range(request.headers["Range"], size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response["Content-Range"] = f"bytes */{size}"
+                return response
+        first, last = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(
+            iter_file_range(storage, name, first, last) if size else iter(()),
+            status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+            content_type=mimetypes.guess_type(name)[0] or "application/octet-stream",
+        )
+        response["Content-Length"] = str(last - first + 1)
+        if byte_range:
+            response["Content-Range"] = f"bytes {first}-{last}/{size}"
+        response["Accept-Ranges"] = "bytes"
+        if etag:
+            response["ETag"] = etag
+        response["Content-Disposition"] = content_disposition_header(False, Path(name).name)
+        response["Cache-Control"] = "private, max-age=86400"
+        return response
+
+    @action(detail=True, methods=["get"], url_path="extract")
+    def extract(self, request, pk=None):
+        """Pages ``?pages=40-45`` as a new PDF sent to the client; unlike a split job it creates no version."""
+        version = self.get_object()
+        if not version.file:
+            return Response({"detail": "No file available."}, status=404)
+        try:
+            first, last = parse_page_range(request.query_params.get("pages", ""))
+        except PageRangeError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        etag = f'"{version.file_hash}-{first}-{last}"' if version.file_hash else None
+        if etag and request.headers.get("If-None-Match") == etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response["ETag"] = etag
+            return response
+        try:
+            data = extract_page_range(version, first, last)
+        except PageRangeError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        # The range is built whole in memory, and cached that way, so it is sent in one piece.
+        response = HttpResponse(data, content_type="application/pdf")
+        response["Content-Length"] = str(len(data))
+        if etag:
+            response["ETag"] = etag
+        response["Content-Disposition"] = content_disposition_header(True, f"{Path(version.file.name).stem}-pages-{first}-{last}.pdf")
+        response["Cache-Control"] = "private, max-age=86400"
+        return response
 
     @action(detail=True, methods=["get"], url_path="search")
     def search(self, request, pk=None):
         version = self.get_object()
-        query = request.query_params.get("q", "")
-        text = version.text_content or ""
-        index = text.lower().find(query.lower()) if query else -1
-        results = [{"page_number": 1, "matches": [{"text": query, "index": index, "bbox": None}]}] if index >= 0 else []
-        return Response({"query": query, "results": results})
+        try:
+            limit = int(request.query_params.get("limit", settings.SEARCH_DEFAULT_RESULTS))
+            offset = int(request.query_params.get("offset", 0))
+        except ValueError:
+            return Response({"detail": "limit and offset must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.SEARCH_MAX_RESULTS))
+        return Response(search_version(version, request.query_params.get("q", ""), limit=limit, offset=max(offset, 0)))
 
     @action(detail=True, methods=["post"], url_path="number-pages")
     def number_pages(self, request, pk=None):
@@ -0,0 +1,84 @@
+"""Page ranges of a version assembled into a new PDF on request, without creating a version.
+
+Sources stay open per process, keyed by content hash, so repeated requests on a
+large document skip parsing it again. The requested pages are copied object by
+object into an empty document, which is all that gets serialized; the source is
+never saved. Version files never change, so results are cached by file hash and
+range.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from pdf_web.documents.source_cache import local_source_path
+
+_PAGE_RANGE_RE = re.compile(r"^(\d+)(?:-(\d+))?$")
+
+# PyMuPDF documents must not be used from two threads at once; one lock guards the cache and its handles.
+_lock = threading.Lock()
+_open_documents: OrderedDict[str, object] = OrderedDict()
+
+
+class PageRangeError(ValueError):
+    """A page range that is malformed or outside the document."""
+
+
+def parse_page_range(value: str) -> tuple[int, int]:
+    """The first and last page, inclusive and 1-based, of ``"40-45"`` or ``"40"``."""
+    match = _PAGE_RANGE_RE.match(value.strip())
+    if not match:
+        raise PageRangeError("pages must look like 40-45.")
+    first = int(match[1])
+    last = int(match[2] or first)
+    if not 1 <= first <= last:
+        raise PageRangeError("pages must run forwards from page 1.")
+    if last - first + 1 > settings.PAGE_RANGE_MAX_PAGES:
+        raise PageRangeError(f"At most {settings.PAGE_RANGE_MAX_PAGES} pages can be extracted at once; use a split job.")
+    return first, last
+
+
+def _cached_document(version):
+    """The open source of ``version``, least recently used handles closed first. Call with ``_lock`` held."""
+    import fitz
+
+    key = version.file_hash or version.file.name
+    doc = _open_documents.get(key)
+    if doc is not None:
+        _open_documents.move_to_end(key)
+        return doc
+    doc = _open_documents[key] = fitz.open(local_source_path(version))
+    while len(_open_documents) > settings.OPEN_DOCUMENT_CACHE_SIZE:
+        _, evicted = _open_documents.popitem(last=False)
+        evicted.close()
+    return doc
+
+
+def extract_page_range(version, first: int, last: int) -> bytes:
+    """Pages ``first`` to ``last`` of ``version`` as a standalone PDF."""
+    import fitz
+
+    cache_key = f"page-range:{version.file_hash}:{first}-{last}"
+    if version.file_hash:
+        data = cache.get(cache_key)
+        if data is not None:
+            return data
+    with _lock:
+        source = _cached_document(version)
+        if last > source.page_count:
+            raise PageRangeError(f"The document has {source.page_count} pages.")
+        output = fitz.open()
+        try:
+            # Copies the pages and the objects they reference, nothing else of the source.
+            output.insert_pdf(source, from_page=first - 1, to_page=last - 1)
+            data = output.tobytes()
+        finally:
+            output.close()
+    if version.file_hash and len(data) <= settings.PAGE_RANGE_CACHE_MAX_BYTES:
+        cache.set(cache_key, data, timeout=settings.PAGE_RANGE_CACHE_SECONDS)
+    return data
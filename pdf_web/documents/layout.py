@@ -0,0 +1,149 @@
+"""Compact encoding of per-page text layout and word geometry.
+
+A page's blocks are stored column-wise: bounding boxes as little-endian float32
+quadruples, block types as one byte each and the block texts as a
+zstd-compressed JSON list. Words are stored the same way, with a little-endian
+uint16 block and line number pair per word. The content hash covers every
+column, so identical pages in different versions share a single stored row.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import struct
+from dataclasses import dataclass
+
+import zstandard
+
+ZSTD_LEVEL = 3
+# float32 keeps about seven significant digits; three decimals is well below a point.
+BBOX_PRECISION = 3
+
+
+@dataclass(frozen=True)
+class EncodedLayout:
+    content_hash: str
+    boxes: bytes
+    block_types: bytes
+    texts: bytes
+
+
+# Binary word payload: magic, word count, then the columns aligned for typed arrays.
+PACKED_WORDS_MAGIC = b"PWD1"
+MAX_LINE_ID = 0xFFFF
+
+
+@dataclass(frozen=True)
+class EncodedWords:
+    content_hash: str
+    boxes: bytes
+    lines: bytes
+    texts: bytes
+
+
+def _float32(values: list[float]) -> bytes:
+    return struct.pack(f"<{len(values)}f", *values)
+
+
+def _boxes(packed: bytes) -> list[list[float]]:
+    values = struct.unpack(f"<{len(packed) // 4}f", packed)
+    return [[round(value, BBOX_PRECISION) for value in values[index:index + 4]] for index in range(0, len(values), 4)]
+
+
+def _compress_texts(texts: list[str]) -> bytes:
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(
+        json.dumps(texts, ensure_ascii=False, separators=(",", ":")).encode(),
+    )
+
+
+def _decompress_texts(packed: bytes) -> list[str]:
+    return json.loads(zstandard.ZstdDecompressor().decompress(bytes(packed)))
+
+
+def _content_hash(*parts: bytes) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        hasher.update(len(part).to_bytes(8, "little"))
+        hasher.update(part)
+    return hasher.hexdigest()
+
+
+def is_valid_block(block) -> bool:
+    """Whether ``block`` can be encoded: a ``bbox`` of four numbers and a one-byte ``block_type``, where given."""
+    if not isinstance(block, dict):
+        return False
+    bbox = block.get("bbox")
+    if bbox is not None and not (
+        isinstance(bbox, list) and len(bbox) == 4 and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in bbox)
+    ):
+        return False
+    block_type = block.get("block_type")
+    return block_type is None or (isinstance(block_type, int) and not isinstance(block_type, bool) and 0 <= block_type <= 0xFF)
+
+
+def encode_blocks(blocks: list[dict]) -> EncodedLayout:
+    boxes: list[float] = []
+    block_types = bytearray()
+    texts = []
+    for block in blocks:
+        # Hand-edited layouts may omit the geometry; it decodes as an empty box.
+        bbox = block.get("bbox") or (0, 0, 0, 0)
+        boxes.extend(bbox[:4])
+        block_types.append(int(block.get("block_type") or 0))
+        texts.append(str(block.get("text", "")))
+    packed_boxes = _float32(boxes)
+    packed_texts = _compress_texts(texts)
+    return EncodedLayout(_content_hash(packed_boxes, bytes(block_types), packed_texts), packed_boxes, bytes(block_types), packed_texts)
+
+
+def decode_blocks(boxes: bytes, block_types: bytes, texts: bytes) -> list[dict]:
+    return [
+        {"bbox": bbox, "text": text, "block_type": block_type}
+        for bbox, block_type, text in zip(_boxes(boxes), bytes(block_types), _decompress_texts(texts))
+    ]
+
+
+def encode_words(words: list[tuple]) -> EncodedWords:
+    """Encode PyMuPDF ``get_text("words")`` tuples: ``(x0, y0, x1, y1, text, block_no, line_no, ...)``."""
+    boxes: list[float] = []
+    lines: list[int] = []
+    texts = []
+    for word in words:
+        boxes.extend(word[:4])
+        lines.extend(min(value, MAX_LINE_ID) for value in (word[5:7] if len(word) > 6 else (0, 0)))
+        texts.append(word[4])
+    packed_boxes = _float32(boxes)
+    packed_lines = struct.pack(f"<{len(lines)}H", *lines)
+    packed_texts = _compress_texts(texts)
+    return EncodedWords(_content_hash(packed_boxes, packed_lines, packed_texts), packed_boxes, packed_lines, packed_texts)
+
+
+def decode_words(boxes: bytes, texts: bytes) -> list[tuple[list[float], str]]:
+    return list(zip(_boxes(boxes), _decompress_texts(texts)))
+
+
+def word_columns(boxes: bytes, lines: bytes, texts: bytes) -> dict:
+    """A page's words as parallel flat arrays: four box values and two line ids per word."""
+    count = len(boxes) // 16
+    return {
+        "count": count,
+        "boxes": [round(value, BBOX_PRECISION) for value in struct.unpack(f"<{count * 4}f", boxes)],
+        "lines": list(struct.unpack(f"<{count * 2}H", lines)),
+        "texts": _decompress_texts(texts),
+    }
+
+
+def pack_words(boxes: bytes, lines: bytes, texts: bytes) -> bytes:
+    """A page's words in one binary payload.
+
+    Layout: ``PWD1``, uint32 word count, float32 boxes, uint16 block/line pairs,
+    then the words as UTF-8 joined by newlines, which never occur inside a word.
+    Every integer and float is little-endian, and both arrays start 4-byte aligned.
+    """
+    words = _decompress_texts(texts)
+    if len(lines) != len(words) * 4:
+        msg = f"Expected block and line ids for {len(words)} words, got {len(lines)} bytes."
+        raise ValueError(msg)
+    header = PACKED_WORDS_MAGIC + struct.pack("<I", len(words))
+    return b"".join((header, bytes(boxes), bytes(lines), "\n".join(words).encode()))
@@ -0,0 +1,32 @@
+"""Linearization ("fast web view") of stored PDFs.
+
+A linearized PDF starts with a parameter dictionary and the objects of the first
+page, followed by hint tables locating every other page. Viewers that fetch by
+byte range can then show page one after the first few hundred kilobytes, where a
+file with its cross-reference table at the end has to be fetched whole first.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pikepdf
+
+
+def linearize(source: str, output: Path) -> bool:
+    """Write ``source`` linearized to ``output``; False, writing nothing, if there is no need.
+
+    Files that are already linearized are left alone, as are encrypted ones: those
+    needing a password cannot be opened, and re-saving those that open without one
+    would drop their encryption, owner password and permission flags.
+    """
+    try:
+        pdf = pikepdf.open(source)
+    except pikepdf.PasswordError:
+        return False
+    with pdf:
+        if pdf.is_linearized or pdf.is_encrypted:
+            return False
+        # A deterministic /ID keeps identical uploads byte-identical once rewritten, so they still share storage.
+        pdf.save(output, linearize=True, deterministic_id=True)
+    return True
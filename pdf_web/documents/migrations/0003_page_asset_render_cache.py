@@ -0,0 +1,24 @@
+# Generated by Django 5.0.9 on 2026-10-19 05:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_alter_workspacemember_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentpageasset',
+            name='last_accessed_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='documentpageasset',
+            name='size_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
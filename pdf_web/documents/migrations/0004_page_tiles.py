@@ -0,0 +1,33 @@
+# Generated by Django 5.0.9 on 2026-10-19 05:45
+
+import django.db.models.deletion
+import django.utils.timezone
+import pdf_web.documents.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0003_page_asset_render_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentPageTile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('level', models.PositiveSmallIntegerField()),
+                ('column', models.PositiveIntegerField()),
+                ('row', models.PositiveIntegerField()),
+                ('image', models.ImageField(upload_to=pdf_web.documents.models.tile_upload_path)),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('last_accessed_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='page_tiles', to='documents.documentversion')),
+            ],
+            options={
+                'unique_together': {('version', 'page_number', 'level', 'column', 'row')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.9 on 2026-10-19 05:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_page_tiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentversion',
+            name='page_hashes',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='documentpageasset',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=128),
+        ),
+    ]
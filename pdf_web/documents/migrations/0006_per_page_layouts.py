@@ -0,0 +1,65 @@
+# Generated by Django 5.0.9 on 2026-10-19 05:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+from pdf_web.documents.layout import encode_blocks
+
+
+def split_layouts(apps, schema_editor):
+    DocumentVersion = apps.get_model('documents', 'DocumentVersion')
+    PageLayout = apps.get_model('documents', 'PageLayout')
+    DocumentPageLayout = apps.get_model('documents', 'DocumentPageLayout')
+    for version in DocumentVersion.objects.exclude(layout_json={}).only('id', 'layout_json').iterator():
+        if not isinstance(version.layout_json, dict):
+            continue
+        links = []
+        for page_number, blocks in version.layout_json.items():
+            if not str(page_number).isdigit() or not isinstance(blocks, list):
+                continue
+            encoded = encode_blocks(blocks)
+            layout, _ = PageLayout.objects.get_or_create(
+                content_hash=encoded.content_hash,
+                defaults={'boxes': encoded.boxes, 'block_types': encoded.block_types, 'texts': encoded.texts},
+            )
+            links.append(DocumentPageLayout(version_id=version.id, page_number=int(page_number), layout=layout))
+        DocumentPageLayout.objects.bulk_create(links)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_page_content_hashes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageLayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('boxes', models.BinaryField()),
+                ('block_types', models.BinaryField()),
+                ('texts', models.BinaryField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DocumentPageLayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='page_layouts', to='documents.documentversion')),
+                ('layout', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='pages', to='documents.pagelayout')),
+            ],
+            options={
+                'ordering': ['page_number'],
+                'unique_together': {('version', 'page_number')},
+            },
+        ),
+        migrations.RunPython(split_layouts, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='documentversion',
+            name='layout_json',
+        ),
+    ]
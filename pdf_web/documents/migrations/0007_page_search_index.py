@@ -0,0 +1,44 @@
+# Generated by Django 5.0.9 on 2026-10-19 06:00
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_per_page_layouts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageWords',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('boxes', models.BinaryField()),
+                ('lines', models.BinaryField()),
+                ('texts', models.BinaryField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DocumentPageText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('text', models.TextField(blank=True)),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='page_texts', to='documents.documentversion')),
+                ('words', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='pages', to='documents.pagewords')),
+            ],
+            options={
+                'ordering': ['page_number'],
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='documents_page_text_search')],
+                'unique_together': {('version', 'page_number')},
+            },
+        ),
+    ]
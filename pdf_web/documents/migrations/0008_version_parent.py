@@ -0,0 +1,19 @@
+# Generated by Django 5.0.9 on 2026-10-19 06:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_page_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentversion',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='derived_versions', to='documents.documentversion'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.9 on 2026-10-19 06:14
+
+import django.db.models.deletion
+import django.utils.timezone
+import pdf_web.documents.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_version_parent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(max_length=255, upload_to=pdf_web.documents.models.stored_file_path)),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('linked_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='documentversion',
+            name='file',
+            field=models.FileField(max_length=255, upload_to=pdf_web.documents.models.document_upload_path),
+        ),
+        migrations.AddField(
+            model_name='documentversion',
+            name='stored_file',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='versions', to='documents.storedfile'),
+        ),
+    ]
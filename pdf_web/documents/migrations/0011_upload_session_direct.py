@@ -0,0 +1,28 @@
+# Generated by Django 5.0.9 on 2026-10-19 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='direct',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='multipart_id',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='object_key',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
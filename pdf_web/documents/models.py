@@ -1,10 +1,45 @@
 from __future__ import annotations
 
+import uuid
+from collections.abc import Iterable
+from dataclasses import asdict
+from pathlib import Path
+
 from django.conf import settings
-from django.core.files.storage import default_storage
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.contrib.postgres.search import SearchVectorField
+from django.core.files import File
+from django.db import IntegrityError
 from django.db import models
+from django.db import transaction
+from django.db.models import F
+from django.db.models import Func
+from django.db.models import Value
 from django.utils import timezone
 
+from pdf_web.documents.layout import decode_blocks
+from pdf_web.documents.layout import decode_words
+from pdf_web.documents.layout import encode_blocks
+from pdf_web.documents.layout import encode_words
+from pdf_web.documents.layout import pack_words
+from pdf_web.documents.layout import word_columns
+from pdf_web.documents.uploads import file_digest
+
+# No stemming or stop words: documents come in any language, and hits are matched back to words verbatim.
+PAGE_SEARCH_CONFIG = "simple"
+
+
+def merge_json(field: str, values: dict) -> Func:
+    """``field || values`` on a jsonb column: adds or replaces keys without rewriting the rest."""
+    return Func(
+        F(field),
+        Value(values, output_field=models.JSONField()),
+        template="%(expressions)s",
+        arg_joiner=" || ",
+        output_field=models.JSONField(),
+    )
+
 
 class WorkspaceRole(models.TextChoices):
     OWNER = "owner", "Owner"
@@ -58,10 +93,18 @@ def document_upload_path(instance: "DocumentVersion", filename: str) -> str:
     return f"documents/{instance.document_id}/versions/{instance.version_number}/{filename}"
 
 
+def stored_file_path(instance: "StoredFile", filename: str) -> str:
+    return f"documents/files/{instance.content_hash}/{filename}"
+
+
 def asset_upload_path(instance: "DocumentPageAsset", filename: str) -> str:
     return f"documents/{instance.version_id}/pages/{instance.page_number}/{filename}"
 
 
+def tile_upload_path(instance: "DocumentPageTile", filename: str) -> str:
+    return f"documents/{instance.version_id}/pages/{instance.page_number}/tiles/{instance.level}/{filename}"
+
+
 class Document(models.Model):
     workspace = models.ForeignKey(
         Workspace,
@@ -94,6 +137,36 @@ class Document(models.Model):
         return self.title
 
 
+class StoredFile(models.Model):
+    """One stored copy of a version file, shared by every version with the same content.
+
+    Its references are the versions linking it; once there are none it is deleted
+    together with the file by the cache sweep.
+    """
+
+    content_hash = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=stored_file_path, max_length=255)
+    size_bytes = models.BigIntegerField(default=0)
+    # Bumped whenever a version links the file, so the sweep never races a new link.
+    linked_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def store(cls, content: File, content_hash: str, name: str) -> StoredFile:
+        """The stored file for ``content_hash``, saving ``content`` only if it is not stored yet."""
+        if cls.objects.filter(content_hash=content_hash).update(linked_at=timezone.now()):
+            return cls.objects.get(content_hash=content_hash)
+        stored = cls(content_hash=content_hash, size_bytes=content.size)
+        stored.file.save(Path(name).name, content, save=False)
+        try:
+            with transaction.atomic():
+                stored.save()
+        except IntegrityError:
+            # Another upload of the same content got there first; keep its copy.
+            stored.file.delete(save=False)
+            return cls.objects.get(content_hash=content_hash)
+        return stored
+
+
 class DocumentVersion(models.Model):
     document = models.ForeignKey(
         Document,
@@ -101,9 +174,17 @@ class DocumentVersion(models.Model):
         related_name="versions",
     )
     version_number = models.PositiveIntegerField()
-    file = models.FileField(upload_to=document_upload_path)
+    file = models.FileField(upload_to=document_upload_path, max_length=255)
     file_hash = models.CharField(max_length=128, blank=True)
     size_bytes = models.BigIntegerField(default=0)
+    # Content-addressed copy that ``file`` names; versions uploaded before dedup have none.
+    stored_file = models.ForeignKey(
+        StoredFile,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="versions",
+    )
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
@@ -114,8 +195,16 @@ class DocumentVersion(models.Model):
     processing_state = models.JSONField(default=dict, blank=True)
     pdf_info = models.JSONField(default=dict, blank=True)
     text_content = models.TextField(blank=True)
-    layout_json = models.JSONField(default=dict, blank=True)
     security_state = models.JSONField(default=dict, blank=True)
+    page_hashes = models.JSONField(default=list, blank=True)
+    # The version this one was derived from; pages it shares with it are not re-indexed.
+    parent = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="derived_versions",
+    )
 
     class Meta:
         unique_together = ("document", "version_number")
@@ -124,22 +213,134 @@ class DocumentVersion(models.Model):
     def __str__(self) -> str:
         return f"{self.document} v{self.version_number}"
 
-    def update_file_metadata(self) -> None:
-        if not self.file:
-            return
-        if hasattr(self.file, "size"):
-            self.size_bytes = self.file.size
-        try:
-            if default_storage.exists(self.file.name):
-                with default_storage.open(self.file.name, "rb") as handle:
-                    import hashlib
+    def merge_processing_state(self, stages: dict, **fields) -> None:
+        # A single UPDATE, so stages finishing concurrently never drop each other's keys.
+        DocumentVersion.objects.filter(pk=self.pk).update(
+            processing_state=merge_json("processing_state", stages),
+            **fields,
+        )
+        self.processing_state = {**self.processing_state, **stages}
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def set_page_layouts(self, layouts: dict[int, list[dict]]) -> None:
+        """Store the text blocks of the given pages, reusing identical stored layouts."""
+        encoded = {page_number: encode_blocks(blocks) for page_number, blocks in layouts.items()}
+        layout_ids = _content_row_ids(PageLayout, encoded.values())
+        DocumentPageLayout.objects.bulk_create(
+            (
+                DocumentPageLayout(version=self, page_number=page_number, layout_id=layout_ids[layout.content_hash])
+                for page_number, layout in encoded.items()
+            ),
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["version", "page_number"],
+            update_fields=["layout"],
+        )
 
-                    hasher = hashlib.sha256()
-                    for chunk in iter(lambda: handle.read(8192), b""):
-                        hasher.update(chunk)
-                    self.file_hash = hasher.hexdigest()
-        except OSError:
-            self.file_hash = ""
+    def set_page_texts(self, pages: dict[int, tuple[str, list[tuple]]]) -> None:
+        """Index the plain text and ``get_text("words")`` geometry of the given pages for search."""
+        encoded = {page_number: encode_words(words) for page_number, (_, words) in pages.items()}
+        word_ids = _content_row_ids(PageWords, encoded.values())
+        DocumentPageText.objects.bulk_create(
+            (
+                DocumentPageText(
+                    version=self,
+                    page_number=page_number,
+                    text=text,
+                    words_id=word_ids[encoded[page_number].content_hash],
+                )
+                for page_number, (text, _) in pages.items()
+            ),
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["version", "page_number"],
+            update_fields=["text", "words"],
+        )
+        self.page_texts.filter(page_number__in=list(pages)).update(
+            search_vector=SearchVector("text", config=PAGE_SEARCH_CONFIG),
+        )
+
+    def copy_page_text(self, source: DocumentVersion, pages: dict[int, int] | None = None) -> None:
+        """Carry over page layouts and search rows of ``source`` without recomputing them.
+
+        ``pages`` maps page numbers of this version to the ``source`` pages they copy;
+        by default every page is copied to the same number.
+        """
+        layouts = source.page_layouts.all()
+        texts = source.page_texts.all()
+        if pages is not None:
+            layouts = layouts.filter(page_number__in=set(pages.values()))
+            texts = texts.filter(page_number__in=set(pages.values()))
+        layout_ids = dict(layouts.values_list("page_number", "layout_id"))
+        text_rows = {row[0]: row[1:] for row in texts.values_list("page_number", "text", "words_id", "search_vector")}
+        if pages is None:
+            pages = {page_number: page_number for page_number in layout_ids.keys() | text_rows.keys()}
+        DocumentPageLayout.objects.bulk_create(
+            (
+                DocumentPageLayout(version=self, page_number=page_number, layout_id=layout_ids[source_page])
+                for page_number, source_page in pages.items()
+                if source_page in layout_ids
+            ),
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["version", "page_number"],
+            update_fields=["layout"],
+        )
+        DocumentPageText.objects.bulk_create(
+            (
+                DocumentPageText(
+                    version=self,
+                    page_number=page_number,
+                    text=text_rows[source_page][0],
+                    words_id=text_rows[source_page][1],
+                    search_vector=text_rows[source_page][2],
+                )
+                for page_number, source_page in pages.items()
+                if source_page in text_rows
+            ),
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["version", "page_number"],
+            update_fields=["text", "words", "search_vector"],
+        )
+
+    def indexed_pages_by_hash(self) -> dict[str, int]:
+        """Page content hash to page number, for pages whose layout and search rows exist."""
+        indexed = set(self.page_layouts.values_list("page_number", flat=True))
+        indexed &= set(self.page_texts.values_list("page_number", flat=True))
+        pages: dict[str, int] = {}
+        for page_number, content_hash in enumerate(self.page_hashes, start=1):
+            if content_hash and page_number in indexed:
+                pages.setdefault(content_hash, page_number)
+        return pages
+
+    def page_layout(self, page_number: int) -> list[dict]:
+        page = self.page_layouts.select_related("layout").filter(page_number=page_number).first()
+        return page.layout.blocks() if page else []
+
+    def layout(self) -> dict[str, list[dict]]:
+        return {str(page.page_number): page.layout.blocks() for page in self.page_layouts.select_related("layout")}
+
+    def attach_file(self, content: File, name: str | None = None) -> None:
+        """Point the version at the stored copy of ``content``, storing it if no version has it yet."""
+        content_hash = file_digest(content)
+        self.link_stored_file(StoredFile.store(content, content_hash, name or content.name))
+
+    def link_stored_file(self, stored: StoredFile) -> None:
+        self.stored_file = stored
+        self.file.name = stored.file.name
+        self.file_hash = stored.content_hash
+        self.size_bytes = stored.size_bytes
+
+    def shared_file_fields(self) -> dict:
+        """Field values for a new version with the same file as this one; nothing is copied or re-hashed."""
+        return {
+            "file": self.file,
+            "stored_file_id": self.stored_file_id,
+            "file_hash": self.file_hash,
+            "size_bytes": self.size_bytes,
+        }
 
 
 class DocumentPageAsset(models.Model):
@@ -154,13 +355,122 @@ class DocumentPageAsset(models.Model):
     width = models.PositiveIntegerField(default=0)
     height = models.PositiveIntegerField(default=0)
     dpi = models.PositiveIntegerField(default=72)
-    content_hash = models.CharField(max_length=128, blank=True)
+    content_hash = models.CharField(max_length=128, blank=True, db_index=True)
+    size_bytes = models.BigIntegerField(default=0)
+    last_accessed_at = models.DateTimeField(default=timezone.now, db_index=True)
 
     class Meta:
         unique_together = ("version", "page_number", "dpi")
         ordering = ["page_number", "dpi"]
 
 
+class DocumentPageTile(models.Model):
+    version = models.ForeignKey(
+        DocumentVersion,
+        on_delete=models.CASCADE,
+        related_name="page_tiles",
+    )
+    page_number = models.PositiveIntegerField()
+    level = models.PositiveSmallIntegerField()
+    column = models.PositiveIntegerField()
+    row = models.PositiveIntegerField()
+    image = models.ImageField(upload_to=tile_upload_path)
+    size_bytes = models.BigIntegerField(default=0)
+    last_accessed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        unique_together = ("version", "page_number", "level", "column", "row")
+
+
+def _content_row_ids(model, encoded: Iterable) -> dict[str, int]:
+    """Ids of the content-addressed ``model`` rows for ``encoded``, inserting any that are missing."""
+    rows = {item.content_hash: item for item in encoded}
+    ids = dict(model.objects.filter(content_hash__in=rows).values_list("content_hash", "id"))
+    missing = [item for content_hash, item in rows.items() if content_hash not in ids]
+    if missing:
+        model.objects.bulk_create((model(**asdict(item)) for item in missing), batch_size=500, ignore_conflicts=True)
+        ids.update(
+            model.objects.filter(content_hash__in=[item.content_hash for item in missing]).values_list("content_hash", "id"),
+        )
+    return ids
+
+
+class PageLayout(models.Model):
+    """Text blocks of one page, shared by every version page with the same content."""
+
+    content_hash = models.CharField(max_length=64, unique=True)
+    # float32 x0, y0, x1, y1 per block, then one byte of block type per block.
+    boxes = models.BinaryField()
+    block_types = models.BinaryField()
+    # zstd-compressed JSON list of block texts.
+    texts = models.BinaryField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def blocks(self) -> list[dict]:
+        return decode_blocks(self.boxes, self.block_types, self.texts)
+
+
+class DocumentPageLayout(models.Model):
+    version = models.ForeignKey(
+        DocumentVersion,
+        on_delete=models.CASCADE,
+        related_name="page_layouts",
+    )
+    page_number = models.PositiveIntegerField()
+    layout = models.ForeignKey(
+        PageLayout,
+        on_delete=models.PROTECT,
+        related_name="pages",
+    )
+
+    class Meta:
+        unique_together = ("version", "page_number")
+        ordering = ["page_number"]
+
+
+class PageWords(models.Model):
+    """Word geometry of one page, shared by every version page with the same words."""
+
+    content_hash = models.CharField(max_length=64, unique=True)
+    # float32 x0, y0, x1, y1 per word.
+    boxes = models.BinaryField()
+    # uint16 block and line number per word.
+    lines = models.BinaryField()
+    # zstd-compressed JSON list of words.
+    texts = models.BinaryField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def words(self) -> list[tuple[list[float], str]]:
+        return decode_words(self.boxes, self.texts)
+
+    def columns(self) -> dict:
+        return word_columns(self.boxes, self.lines, self.texts)
+
+    def packed(self) -> bytes:
+        return pack_words(self.boxes, self.lines, self.texts)
+
+
+class DocumentPageText(models.Model):
+    version = models.ForeignKey(
+        DocumentVersion,
+        on_delete=models.CASCADE,
+        related_name="page_texts",
+    )
+    page_number = models.PositiveIntegerField()
+    text = models.TextField(blank=True)
+    words = models.ForeignKey(
+        PageWords,
+        on_delete=models.PROTECT,
+        related_name="pages",
+    )
+    search_vector = SearchVectorField(null=True)
+
+    class Meta:
+        unique_together = ("version", "page_number")
+        ordering = ["page_number"]
+        indexes = [GinIndex(fields=["search_vector"], name="documents_page_text_search")]
+
+
 class DocumentBookmark(models.Model):
     version = models.ForeignKey(
         DocumentVersion,
@@ -173,3 +483,54 @@ class DocumentBookmark(models.Model):
 
     class Meta:
         ordering = ["page_number"]
+
+
+class UploadStatus(models.TextChoices):
+    RECEIVING = "receiving", "Receiving"
+    FINALIZING = "finalizing", "Finalizing"
+    COMPLETED = "completed", "Completed"
+    FAILED = "failed", "Failed"
+
+
+class UploadSession(models.Model):
+    """A resumable upload: chunks are appended in order to a part file, then it becomes a document.
+
+    Direct uploads skip the part file: the client writes the file straight to
+    ``object_key`` in the bucket with presigned URLs, as a multipart upload when
+    ``multipart_id`` is set.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    workspace = models.ForeignKey(
+        Workspace,
+        on_delete=models.CASCADE,
+        related_name="upload_sessions",
+    )
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="upload_sessions",
+    )
+    title = models.CharField(max_length=255, blank=True)
+    filename = models.CharField(max_length=255)
+    size_bytes = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=UploadStatus.choices, default=UploadStatus.RECEIVING)
+    error = models.TextField(blank=True)
+    direct = models.BooleanField(default=False)
+    object_key = models.CharField(max_length=255, blank=True)
+    multipart_id = models.CharField(max_length=255, blank=True)
+    # Created when the upload is finalized, before the file is stored and ingested.
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def part_path(self) -> Path:
+        return Path(settings.UPLOAD_SESSION_DIR) / f"{self.pk}.part"
@@ -0,0 +1,166 @@
+"""Presigned, direct-to-bucket uploads and downloads of version files.
+
+With S3 storage, clients PUT a file straight into the bucket with presigned URLs,
+as one request or one per part of a multipart upload, then finalize the upload
+session. A worker hashes the object and copies it into content-addressed storage
+within the bucket. Downloads are short-lived presigned GET URLs, so no file bytes
+pass through the web workers either way.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from django.utils.text import get_valid_filename
+
+from pdf_web.documents.models import StoredFile
+from pdf_web.documents.uploads import PDF_MAGIC
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class DirectUploadError(ValueError):
+    """The object in the bucket is missing or is not the file the session declared."""
+
+
+def presigned_urls_supported(storage=default_storage) -> bool:
+    """Whether ``storage`` is an S3 bucket clients can be sent to directly."""
+    return getattr(storage, "bucket", None) is not None
+
+
+def _client(storage):
+    return storage.connection.meta.client
+
+
+def _key(storage, name: str) -> str:
+    from storages.utils import clean_name
+
+    return storage._normalize_name(clean_name(name))
+
+
+def start_direct_upload(session) -> None:
+    """Choose the object the client writes to and, for files over one part, open a multipart upload."""
+    session.object_key = f"uploads/{session.pk}/{get_valid_filename(session.filename)}"
+    if session.size_bytes > settings.DIRECT_UPLOAD_PART_BYTES:
+        session.multipart_id = _client(default_storage).create_multipart_upload(
+            Bucket=default_storage.bucket_name,
+            Key=_key(default_storage, session.object_key),
+            ContentType="application/pdf",
+        )["UploadId"]
+
+
+def upload_urls(session) -> list[dict]:
+    """A presigned PUT for each part of the file, in order; a single one unless it is a multipart upload."""
+    client = _client(default_storage)
+    params = {"Bucket": default_storage.bucket_name, "Key": _key(default_storage, session.object_key)}
+    expires = settings.PRESIGNED_URL_EXPIRY_SECONDS
+    if not session.multipart_id:
+        return [{"part_number": 1, "offset": 0, "size": session.size_bytes, "url": client.generate_presigned_url("put_object", Params=params, ExpiresIn=expires)}]
+    part_bytes = settings.DIRECT_UPLOAD_PART_BYTES
+    return [
+        {
+            "part_number": number,
+            "offset": (number - 1) * part_bytes,
+            "size": min(part_bytes, session.size_bytes - (number - 1) * part_bytes),
+            "url": client.generate_presigned_url(
+                "upload_part",
+                Params={**params, "UploadId": session.multipart_id, "PartNumber": number},
+                ExpiresIn=expires,
+            ),
+        }
+        for number in range(1, math.ceil(session.size_bytes / part_bytes) + 1)
+    ]
+
+
+def complete_direct_upload(session) -> None:
+    """Assemble the uploaded parts and check the object has the declared size.
+
+    The part ETags are listed from the bucket, so clients need not collect them.
+    """
+    client = _client(default_storage)
+    params = {"Bucket": default_storage.bucket_name, "Key": _key(default_storage, session.object_key)}
+    try:
+        if session.multipart_id:
+            parts = [
+                {"PartNumber": part["PartNumber"], "ETag": part["ETag"]}
+                for page in client.get_paginator("list_parts").paginate(**params, UploadId=session.multipart_id)
+                for part in page.get("Parts", [])
+            ]
+            client.complete_multipart_upload(**params, UploadId=session.multipart_id, MultipartUpload={"Parts": parts})
+            session.multipart_id = ""
+        size = client.head_object(**params)["ContentLength"]
+    except ClientError as exc:
+        raise DirectUploadError("The file has not been uploaded.") from exc
+    if size != session.size_bytes:
+        raise DirectUploadError(f"The uploaded file has {size} bytes, not {session.size_bytes}.")
+
+
+def discard_direct_upload(session) -> None:
+    """Abort the multipart upload or delete the object of an upload that will not be finished."""
+    client = _client(default_storage)
+    params = {"Bucket": default_storage.bucket_name, "Key": _key(default_storage, session.object_key)}
+    if session.multipart_id:
+        try:
+            client.abort_multipart_upload(**params, UploadId=session.multipart_id)
+        except ClientError:
+            pass
+    client.delete_object(**params)
+
+
+def store_direct_upload(session) -> StoredFile:
+    """The stored file for the uploaded object, copied within the bucket unless its content is stored already.
+
+    The object is read once, to hash it; the uploaded object is deleted afterwards.
+    """
+    client = _client(default_storage)
+    bucket = default_storage.bucket_name
+    key = _key(default_storage, session.object_key)
+    hasher = hashlib.sha256()
+    try:
+        body = client.get_object(Bucket=bucket, Key=key)["Body"]
+    except ClientError as exc:
+        raise DirectUploadError("The uploaded file is gone.") from exc
+    try:
+        for number, chunk in enumerate(body.iter_chunks(HASH_CHUNK_SIZE)):
+            if number == 0 and not chunk.startswith(PDF_MAGIC):
+                raise DirectUploadError("Only PDF files are allowed.")
+            hasher.update(chunk)
+    finally:
+        body.close()
+    content_hash = hasher.hexdigest()
+    if StoredFile.objects.filter(content_hash=content_hash).update(linked_at=timezone.now()):
+        stored = StoredFile.objects.get(content_hash=content_hash)
+    else:
+        stored = StoredFile(content_hash=content_hash, size_bytes=session.size_bytes)
+        stored.file.name = default_storage.get_available_name(
+            stored.file.field.generate_filename(stored, session.filename),
+            max_length=stored.file.field.max_length,
+        )
+        # Managed copies run as a multipart copy inside S3 for objects over 5 GB.
+        client.copy({"Bucket": bucket, "Key": key}, bucket, _key(default_storage, stored.file.name))
+        try:
+            with transaction.atomic():
+                stored.save()
+        except IntegrityError:
+            # Another upload of the same content got there first; keep its copy.
+            default_storage.delete(stored.file.name)
+            stored = StoredFile.objects.get(content_hash=content_hash)
+    client.delete_object(Bucket=bucket, Key=key)
+    return stored
+
+
+def download_url(file, filename: str, *, attachment: bool = True) -> str:
+    """A presigned GET for ``file`` that expires after ``PRESIGNED_URL_EXPIRY_SECONDS``."""
+    return file.storage.url(
+        file.name,
+        parameters={"ResponseContentDisposition": content_disposition_header(attachment, filename)},
+        expire=settings.PRESIGNED_URL_EXPIRY_SECONDS,
+    )
@@ -0,0 +1,200 @@
+"""Page rasterisation kept free of Django imports so it can run in spawned worker processes."""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import multiprocessing
+import re
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from dataclasses import field
+from io import BytesIO
+
+THUMBNAIL_SIZE = (256, 256)
+
+_OBJECT_REFERENCE_RE = re.compile(r"(\d+) \d+ R\b")
+# /Parent leads to the page tree; the rest only describe how a stream is encoded.
+_UNHASHED_KEYS = {"Parent", "Length", "Filter", "DecodeParms"}
+# Page attributes a page without its own takes from the nearest page tree node that has one.
+_INHERITABLE_KEYS = ("Resources", "MediaBox", "CropBox", "Rotate")
+
+
+@dataclass
+class RenderedImage:
+    png: bytes
+    width: int
+    height: int
+
+
+@dataclass
+class RenderedPage:
+    page_number: int
+    images: dict[int, RenderedImage] = field(default_factory=dict)
+    thumbnail: bytes = b""
+
+
+class PageHasher:
+    """Content hashes for the pages of one document.
+
+    A page hashes its geometry, its own dictionary with the attributes it inherits
+    from the page tree filled in and, recursively, every object it references:
+    content streams, fonts, images, form XObjects and annotations.
+    Dictionaries are hashed with sorted keys and decoded stream data, and references
+    are replaced by the referenced object's digest, so the same page hashes
+    identically in another file whatever its object numbering or compression.
+    Object digests are memoised, so resources shared between pages are read once.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._digests: dict[int, bytes] = {}
+
+    def page_hash(self, page) -> str:
+        try:
+            hasher = hashlib.blake2b(digest_size=16)
+            hasher.update(f"{page.rotation}|{tuple(page.mediabox)}|{tuple(page.cropbox)}|".encode())
+            hasher.update(self._page_source(page.xref))
+            return hasher.hexdigest()
+        except (RecursionError, RuntimeError, ValueError):
+            # An unhashable page simply never matches, so it is always rendered.
+            return ""
+
+    def _page_source(self, xref: int) -> bytes:
+        entries = self._entries(xref)
+        parent, seen = self.doc.xref_get_key(xref, "Parent"), {xref}
+        while parent[0] == "xref" and not entries.keys() >= set(_INHERITABLE_KEYS):
+            node = int(parent[1].split()[0])
+            if node in seen:
+                break
+            seen.add(node)
+            for key in _INHERITABLE_KEYS:
+                value = self.doc.xref_get_key(node, key)
+                if key not in entries and value[0] != "null":
+                    entries[key] = value[1]
+            parent = self.doc.xref_get_key(node, "Parent")
+        return self._dictionary_source(entries, frozenset({xref}))
+
+    def _object_source(self, xref: int, path: frozenset[int]) -> bytes:
+        if self.doc.xref_get_keys(xref):
+            return self._dictionary_source(self._entries(xref), path)
+        return self._resolve(self.doc.xref_object(xref, compressed=True), path)
+
+    def _entries(self, xref: int) -> dict[str, str]:
+        return {key: self.doc.xref_get_key(xref, key)[1] for key in self.doc.xref_get_keys(xref) if key not in _UNHASHED_KEYS}
+
+    def _dictionary_source(self, entries: dict[str, str], path: frozenset[int]) -> bytes:
+        # Sorted keys, so the same dictionary written in another order hashes alike.
+        return self._resolve(" ".join(f"/{key} {entries[key]}" for key in sorted(entries)), path)
+
+    def _resolve(self, source: str, path: frozenset[int]) -> bytes:
+        """``source`` with each reference replaced by the digest of the object it points to."""
+        return _OBJECT_REFERENCE_RE.sub(lambda match: self._digest(int(match.group(1)), path).hex(), source).encode()
+
+    def _digest(self, xref: int, path: frozenset[int]) -> bytes:
+        if xref in self._digests:
+            return self._digests[xref]
+        if xref in path:
+            # Back-references such as an annotation's /P to its page.
+            return b"cycle"
+        path = path | {xref}
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(self._object_source(xref, path))
+        if self.doc.xref_is_stream(xref):
+            hasher.update(self.doc.xref_stream(xref) or b"")
+        digest = hasher.digest()
+        self._digests[xref] = digest
+        return digest
+
+
+def _thumbnail_png(pix) -> bytes:
+    from PIL import Image
+
+    mode = "RGBA" if pix.alpha else "RGB"
+    image = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+    image.thumbnail(THUMBNAIL_SIZE)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def render_page(page, dpi_list: list[int]) -> RenderedPage:
+    """Render ``page`` at every DPI; the thumbnail is downscaled from the lowest-DPI pixmap."""
+    import fitz
+
+    rendered = RenderedPage(page_number=page.number + 1)
+    for dpi in sorted(dpi_list):
+        zoom = dpi / 72
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        rendered.images[dpi] = RenderedImage(png=pix.tobytes("png"), width=pix.width, height=pix.height)
+        if not rendered.thumbnail:
+            rendered.thumbnail = _thumbnail_png(pix)
+    return rendered
+
+
+def tile_levels(width: float, height: float, *, tile_size: int, max_level: int) -> list[dict]:
+    """Describe the tile pyramid of a ``width`` x ``height`` point page; level ``n`` renders at 72 * 2**n dpi."""
+    levels = []
+    for level in range(max_level + 1):
+        scale = 2**level
+        level_width = math.ceil(width * scale)
+        level_height = math.ceil(height * scale)
+        levels.append({
+            "level": level,
+            "dpi": 72 * scale,
+            "width": level_width,
+            "height": level_height,
+            "columns": math.ceil(level_width / tile_size),
+            "rows": math.ceil(level_height / tile_size),
+        })
+    return levels
+
+
+def render_tile(page, *, level: int, column: int, row: int, tile_size: int) -> RenderedImage:
+    """Render a single tile, clipping the page so only the tile's pixels are rasterised."""
+    import fitz
+
+    scale = 2**level
+    span = tile_size / scale
+    bounds = page.rect
+    clip = fitz.Rect(
+        bounds.x0 + column * span,
+        bounds.y0 + row * span,
+        min(bounds.x0 + (column + 1) * span, bounds.x1),
+        min(bounds.y0 + (row + 1) * span, bounds.y1),
+    )
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), clip=clip)
+    return RenderedImage(png=pix.tobytes("png"), width=pix.width, height=pix.height)
+
+
+def render_page_range(path: str, page_numbers: list[int], dpi_list: list[int]) -> list[RenderedPage]:
+    import fitz
+
+    with fitz.open(path) as doc:
+        return [render_page(doc.load_page(number - 1), dpi_list) for number in page_numbers]
+
+
+def render_in_pool(path: str, page_numbers: list[int], dpi_list: list[int], *, processes: int,
+                   chunk_size: int) -> Iterator[RenderedPage]:
+    """Render ``page_numbers`` of ``path`` across ``processes`` worker processes.
+
+    All chunks are submitted before this returns, so rendering proceeds while the caller
+    works on something else; pages are yielded in order as their chunk completes.
+    """
+    chunks = [page_numbers[start:start + chunk_size] for start in range(0, len(page_numbers), chunk_size)]
+    executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        futures = [executor.submit(render_page_range, path, chunk, dpi_list) for chunk in chunks]
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    return _drain(executor, futures)
+
+
+def _drain(executor: ProcessPoolExecutor, futures) -> Iterator[RenderedPage]:
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,144 @@
+"""Ranked full-text search over the per-page index, with hits located on the page.
+
+Queries accept plain terms, ``"quoted phrases"`` and ``prefix*`` terms, all of which
+must match. Terms are split into lexemes by the Postgres text search parser, the
+same way the pages were indexed, so numbers such as ``3.14``, e-mail addresses and
+URLs stay whole. Postgres finds and ranks the pages through the GIN-indexed
+``search_vector``; hit rectangles are then resolved only for the returned pages by
+matching the same lexemes against the page's stored word geometry.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+
+from django.contrib.postgres.search import SearchQuery
+from django.contrib.postgres.search import SearchRank
+from django.db import connection
+from django.db.models import F
+
+from pdf_web.documents.models import PAGE_SEARCH_CONFIG
+from pdf_web.documents.models import DocumentVersion
+
+_QUERY_PART_RE = re.compile(r'"([^"]*)"|(\S+)')
+# The tokens the configuration indexes, in the order to_tsvector numbers them. The
+# simple dictionary only lower-cases, so a token's lexeme is its lower-cased text.
+_LEXEMES_SQL = """
+SELECT source.ordinality, lower(token.token)
+FROM unnest(%s::text[]) WITH ORDINALITY AS source(text, ordinality)
+CROSS JOIN LATERAL ts_parse((SELECT cfgparser FROM pg_ts_config WHERE oid = %s::regconfig), source.text)
+    WITH ORDINALITY AS token(tokid, token, ordinality)
+WHERE token.tokid IN (SELECT maptokentype FROM pg_ts_config_map WHERE mapcfg = %s::regconfig)
+ORDER BY source.ordinality, token.ordinality
+"""
+
+
+@dataclass(frozen=True)
+class SearchTerm:
+    tokens: tuple[str, ...]
+    prefix: bool = False
+
+    def tsquery(self) -> str:
+        quoted = ["'" + token.replace("\\", "\\\\").replace("'", "''") + "'" for token in self.tokens]
+        if self.prefix:
+            quoted[-1] += ":*"
+        return " <-> ".join(quoted)
+
+
+def lexemes(texts: list[str]) -> list[list[str]]:
+    """The lexemes the page index holds for each of ``texts``, in position order."""
+    result: list[list[str]] = [[] for _ in texts]
+    if texts:
+        with connection.cursor() as cursor:
+            cursor.execute(_LEXEMES_SQL, [list(texts), PAGE_SEARCH_CONFIG, PAGE_SEARCH_CONFIG])
+            for ordinality, lexeme in cursor.fetchall():
+                result[ordinality - 1].append(lexeme)
+    return result
+
+
+def parse_query(query: str) -> list[SearchTerm]:
+    parts = [
+        (phrase, False) if phrase is not None else (word, word.endswith("*"))
+        for phrase, word in (match.groups() for match in _QUERY_PART_RE.finditer(query))
+    ]
+    return [
+        SearchTerm(tuple(tokens), prefix=prefix)
+        for (_, prefix), tokens in zip(parts, lexemes([text for text, _ in parts]))
+        if tokens
+    ]
+
+
+def search_version(version: DocumentVersion, query: str, *, limit: int, offset: int = 0) -> dict:
+    terms = parse_query(query)
+    if not terms:
+        return {"query": query, "total": 0, "results": []}
+    tsquery = SearchQuery(" & ".join(term.tsquery() for term in terms), search_type="raw", config=PAGE_SEARCH_CONFIG)
+    matches = version.page_texts.filter(search_vector=tsquery)
+    pages = list(
+        matches.annotate(rank=SearchRank(F("search_vector"), tsquery))
+        .select_related("words")
+        .defer("text", "search_vector")
+        .order_by("-rank", "page_number")[offset:offset + limit]
+    )
+    page_words = [page.words.words() for page in pages]
+    # The words of every returned page are parsed in one query.
+    word_lexemes = iter(_word_lexemes([text for words in page_words for _, text in words], terms))
+    return {
+        "query": query,
+        "total": matches.count(),
+        "results": [
+            {
+                "page_number": page.page_number,
+                "rank": page.rank,
+                "matches": locate_hits(words, terms, [next(word_lexemes) for _ in words]),
+            }
+            for page, words in zip(pages, page_words)
+        ],
+    }
+
+
+def _word_lexemes(texts: list[str], terms: list[SearchTerm]) -> list[list[str]]:
+    """Lexemes of each word, parsing only the words that contain one of the terms' lexemes.
+
+    Other words stand in as a lexeme that matches nothing, so they still break phrases,
+    or as none at all when they hold no letters or digits, like the punctuation the
+    parser skips.
+    """
+    needles = {token for term in terms for token in term.tokens}
+    candidates = [index for index, text in enumerate(texts) if any(needle in text.lower() for needle in needles)]
+    parsed = dict(zip(candidates, lexemes([texts[index] for index in candidates])))
+    return [
+        parsed[index] if index in parsed else [""] if any(char.isalnum() for char in text) else []
+        for index, text in enumerate(texts)
+    ]
+
+
+def locate_hits(words: list[tuple[list[float], str]], terms: list[SearchTerm], word_lexemes: list[list[str]]) -> list[dict]:
+    """Find every occurrence of ``terms`` among a page's ``(bbox, text)`` words, given each word's lexemes, in reading order."""
+    stream = [(token, index) for index, tokens in enumerate(word_lexemes) for token in tokens]
+    hits = []
+    for start in range(len(stream)):
+        for term in terms:
+            end = start + len(term.tokens)
+            if end > len(stream) or not _matches(term, [token for token, _ in stream[start:end]]):
+                continue
+            indices = list(dict.fromkeys(index for _, index in stream[start:end]))
+            rects = [words[index][0] for index in indices]
+            hits.append({
+                "text": " ".join(words[index][1] for index in indices),
+                "bbox": [
+                    min(rect[0] for rect in rects),
+                    min(rect[1] for rect in rects),
+                    max(rect[2] for rect in rects),
+                    max(rect[3] for rect in rects),
+                ],
+                "rects": rects,
+            })
+    return hits
+
+
+def _matches(term: SearchTerm, tokens: list[str]) -> bool:
+    if term.prefix:
+        return tokens[:-1] == list(term.tokens[:-1]) and tokens[-1].startswith(term.tokens[-1])
+    return tokens == list(term.tokens)
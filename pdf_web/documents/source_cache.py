@@ -0,0 +1,133 @@
+"""Worker-local disk cache of version source files.
+
+Tasks need a real path for PyMuPDF, ocrmypdf and spawned render processes, but
+``FieldFile.path`` only exists for local storage. Files are fetched through the
+storage API once per node, keyed by content hash, and shared by every task that
+touches the same source until they are evicted least recently used first.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SOURCE_SUFFIX = ".src"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Downloads lock one of a fixed set of stripes, chosen by the first hex digits of the key,
+# so lock files do not pile up with the keys. 256 stripes make waiting on another key rare.
+LOCK_STRIPE_CHARS = 2
+
+
+def _cache_dir() -> Path:
+    path = Path(settings.SOURCE_CACHE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _cache_key(version) -> str:
+    if version.file_hash:
+        return version.file_hash
+    # Unhashed versions fall back to the storage name, which is never reused for other content.
+    return hashlib.blake2b(version.file.name.encode(), digest_size=16).hexdigest()
+
+
+def _locked(path: Path, operation: int = fcntl.LOCK_EX):
+    # flock locks belong to the open file description, so they serialise threads of
+    # one worker as well as the worker processes sharing the node.
+    handle = path.open("a")
+    try:
+        fcntl.flock(handle, operation)
+    except BlockingIOError:
+        handle.close()
+        return None
+    return handle
+
+
+def local_source_path(version) -> str:
+    """Return a local path holding the source PDF of ``version``.
+
+    Local storage is read in place. Other backends are downloaded into the cache
+    under the key's lock stripe, so concurrent callers wait for the first download instead
+    of starting their own, and the file only appears once it is complete.
+    """
+    try:
+        return version.file.path
+    except NotImplementedError:
+        pass
+
+    cache_dir = _cache_dir()
+    key = _cache_key(version)
+    target = cache_dir / f"{key}{SOURCE_SUFFIX}"
+    if _hit(target):
+        return str(target)
+
+    lock = _locked(cache_dir / f".{key[:LOCK_STRIPE_CHARS]}.lock")
+    try:
+        if _hit(target):
+            return str(target)
+        _download(version, target)
+    finally:
+        lock.close()
+    evict_sources(keep=target)
+    return str(target)
+
+
+def _hit(target: Path) -> bool:
+    try:
+        # The modification time doubles as the last access time for eviction.
+        os.utime(target)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _download(version, target: Path) -> None:
+    handle, partial = tempfile.mkstemp(dir=target.parent, prefix=f".{target.stem}-", suffix=".part")
+    try:
+        with os.fdopen(handle, "wb") as destination, version.file.storage.open(version.file.name, "rb") as source:
+            shutil.copyfileobj(source, destination, DOWNLOAD_CHUNK_SIZE)
+        os.replace(partial, target)
+    except BaseException:
+        Path(partial).unlink(missing_ok=True)
+        raise
+    logger.info("Cached source of version %s at %s", version.pk, target)
+
+
+def evict_sources(*, keep: Path | None = None) -> int:
+    """Delete least recently used sources until the cache fits ``SOURCE_CACHE_MAX_BYTES``."""
+    cache_dir = _cache_dir()
+    # Only one caller per node needs to evict; the others skip rather than queue up.
+    lock = _locked(cache_dir / ".evict.lock", fcntl.LOCK_EX | fcntl.LOCK_NB)
+    if lock is None:
+        return 0
+    try:
+        entries = []
+        for path in cache_dir.glob(f"*{SOURCE_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= settings.SOURCE_CACHE_MAX_BYTES:
+                break
+            if path == keep:
+                continue
+            # Readers that already opened the file keep their handle after the unlink.
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+    finally:
+        lock.close()
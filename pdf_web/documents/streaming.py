@@ -0,0 +1,55 @@
+"""Byte-range streaming of version files.
+
+Viewers such as PDF.js show the first page of a linearized PDF after a few small
+``Range`` requests instead of fetching the whole file. Local files are read from
+the requested offset; S3 objects are not streamed here at all, as viewers are
+redirected to a presigned URL the bucket answers ranges on itself.
+"""
+
+from __future__ import annotations
+
+import re
+from collections.abc import Iterator
+
+STREAM_CHUNK_SIZE = 256 * 1024
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(ValueError):
+    """A syntactically valid range that lies entirely past the end of the file."""
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """The ``(first, last)`` byte positions of a single ``bytes=`` range, inclusive.
+
+    Returns ``None`` when the whole file should be sent instead: the header is
+    malformed, uses another unit or asks for several ranges, all of which a server
+    may ignore.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # ``bytes=-N``: the final N bytes.
+        if int(last) == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - int(last), 0), size - 1
+    if last and int(last) < int(first):
+        return None
+    if int(first) >= size:
+        raise RangeNotSatisfiable(header)
+    return int(first), min(int(last), size - 1) if last else size - 1
+
+
+def iter_file_range(storage, name: str, first: int, last: int) -> Iterator[bytes]:
+    """Bytes ``first`` to ``last`` inclusive of the stored file ``name``, in chunks."""
+    remaining = last - first + 1
+    with storage.open(name, "rb") as handle:
+        handle.seek(first)
+        while remaining > 0:
+            data = handle.read(min(remaining, STREAM_CHUNK_SIZE))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
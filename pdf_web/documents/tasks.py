@@ -1,29 +1,464 @@
 from __future__ import annotations
 
+import hashlib
 import logging
-from typing import Iterable
+import tempfile
+from collections.abc import Iterable
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
 
 from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
 from django.core.files.base import ContentFile
-from django.db import transaction
+from django.db import connection
 from django.db import models
+from django.db import transaction
+from django.db.models import Sum
 from django.utils import timezone
 
+from pdf_web.documents.linearization import linearize
 from pdf_web.documents.models import Document
 from pdf_web.documents.models import DocumentBookmark
 from pdf_web.documents.models import DocumentPageAsset
+from pdf_web.documents.models import DocumentPageTile
 from pdf_web.documents.models import DocumentStatus
 from pdf_web.documents.models import DocumentVersion
+from pdf_web.documents.models import PageLayout
+from pdf_web.documents.models import PageWords
+from pdf_web.documents.models import StoredFile
+from pdf_web.documents.models import UploadSession
+from pdf_web.documents.models import UploadStatus
+from pdf_web.documents.presigned import DirectUploadError
+from pdf_web.documents.presigned import discard_direct_upload
+from pdf_web.documents.presigned import store_direct_upload
+from pdf_web.documents.rendering import PageHasher
+from pdf_web.documents.rendering import RenderedPage
+from pdf_web.documents.rendering import render_in_pool
+from pdf_web.documents.rendering import render_page
+from pdf_web.documents.rendering import render_tile
+from pdf_web.documents.source_cache import local_source_path
+from pdf_web.documents.uploads import AssembledUpload
 
 logger = logging.getLogger(__name__)
 
 
+INGEST_STAGES = ("metadata", "render", "text", "bookmarks", "search", "linearize")
+DEFAULT_RENDER_DPIS = (72, 150)
+# Hits only refresh ``last_accessed_at`` once per interval to keep page views mostly read-only.
+PAGE_ACCESS_TOUCH_INTERVAL = timedelta(minutes=1)
+# Pages of extracted words held in memory before they are written to the search index.
+SEARCH_INDEX_BATCH_PAGES = 200
+ORPHAN_CONTENT_GRACE = timedelta(hours=1)
+
+
 def _open_pdf(version: DocumentVersion):
     try:
         import fitz
     except ImportError as exc:
         raise RuntimeError("PyMuPDF is required for PDF rendering.") from exc
-    return fitz.open(version.file.path)
+    return fitz.open(local_source_path(version))
+
+
+def _read_metadata(doc) -> dict:
+    return {
+        "page_count": doc.page_count,
+        "metadata": doc.metadata,
+        "linearized": doc.is_fast_webaccess,
+    }
+
+
+def _linearize(version: DocumentVersion) -> dict:
+    """Replace the version's file with a linearized copy; returns the version fields that changed.
+
+    Small files are left as they are: a viewer fetches them whole about as fast
+    as it fetches the first page of a linearized copy.
+    """
+    if version.pdf_info.get("linearized") or version.size_bytes < settings.PDF_LINEARIZE_MIN_BYTES:
+        return {}
+    with tempfile.TemporaryDirectory() as workdir:
+        output = Path(workdir) / Path(version.file.name).name
+        if not linearize(local_source_path(version), output):
+            return {}
+        with output.open("rb") as handle:
+            # The original stays stored while other versions link it, and is swept once none do.
+            version.attach_file(File(handle, name=output.name))
+    logger.info("Linearized version %s", version.pk)
+    return {
+        "file": version.file.name,
+        "stored_file": version.stored_file,
+        "file_hash": version.file_hash,
+        "size_bytes": version.size_bytes,
+        "pdf_info": {**version.pdf_info, "linearized": True},
+    }
+
+
+def _read_page_text(page) -> tuple[list[dict], str, list[tuple]]:
+    # One text page feeds the block layout, the plain text and the word geometry.
+    textpage = page.get_textpage()
+    blocks = [
+        {
+            "bbox": block[:4],
+            "text": block[4],
+            "block_type": block[6],
+        }
+        for block in page.get_text("blocks", textpage=textpage)
+    ]
+    return blocks, page.get_text(textpage=textpage), page.get_text("words", textpage=textpage)
+
+
+class _PageAssetWriter:
+    """Collects rendered or reused pages and persists them in batches.
+
+    Image files are written to storage from a thread pool and the matching
+    ``DocumentPageAsset`` rows go out through ``bulk_create``/``bulk_update``.
+    Pages whose content hash was already rendered, in any version or document,
+    are linked to the existing files instead of being rendered again.
+    """
+
+    def __init__(self, version: DocumentVersion, dpi_list: list[int], *, thumb_dpi: int | None = None):
+        self.version = version
+        self.dpi_list = dpi_list
+        self.thumb_dpi = min(dpi_list) if thumb_dpi is None else thumb_dpi
+        self.page_hashes: dict[int, str] = {}
+        self.pending_pages = 0
+        self.created: list[DocumentPageAsset] = []
+        self.updated: dict[tuple[int, int], DocumentPageAsset] = {}
+        self.uploads: list[tuple] = []
+        self.existing = {
+            (asset.page_number, asset.dpi): asset
+            for asset in DocumentPageAsset.objects.filter(version=version)
+        }
+        self.storage_pool = ThreadPoolExecutor(max_workers=settings.PAGE_ASSET_STORAGE_WORKERS)
+
+    def __enter__(self) -> _PageAssetWriter:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.storage_pool.shutdown()
+
+    def _stage(self, page_number: int, dpi: int) -> DocumentPageAsset:
+        asset = self.existing.get((page_number, dpi))
+        if asset is None:
+            asset = DocumentPageAsset(version=self.version, page_number=page_number, dpi=dpi)
+            self.existing[(page_number, dpi)] = asset
+            self.created.append(asset)
+        elif asset.pk is not None:
+            self.updated[(page_number, dpi)] = asset
+        asset.content_hash = self.page_hashes.get(page_number, "")
+        asset.last_accessed_at = timezone.now()
+        return asset
+
+    def _page_done(self) -> None:
+        self.pending_pages += 1
+        if self.pending_pages >= settings.PAGE_ASSET_BATCH_SIZE:
+            self.flush()
+
+    def link_existing(self, page_hashes: dict[int, str]) -> set[int]:
+        """Reuse stored renders for pages with a known content hash; returns the page numbers covered."""
+        self.page_hashes.update(page_hashes)
+        wanted = {content_hash for content_hash in page_hashes.values() if content_hash}
+        sources: dict[tuple[str, int], DocumentPageAsset] = {}
+        if wanted:
+            candidates = DocumentPageAsset.objects.filter(content_hash__in=wanted, dpi__in=self.dpi_list).exclude(preview_image="")
+            for asset in candidates:
+                if asset.dpi != self.thumb_dpi or asset.thumb_image:
+                    sources.setdefault((asset.content_hash, asset.dpi), asset)
+        linked: set[int] = set()
+        for page_number, content_hash in page_hashes.items():
+            matches = [sources.get((content_hash, dpi)) for dpi in self.dpi_list]
+            if not content_hash or None in matches:
+                continue
+            for source in matches:
+                asset = self._stage(page_number, source.dpi)
+                asset.preview_image = source.preview_image.name
+                asset.thumb_image = source.thumb_image.name if source.dpi == self.thumb_dpi else ""
+                asset.width = source.width
+                asset.height = source.height
+                asset.size_bytes = source.size_bytes
+            linked.add(page_number)
+            self._page_done()
+        return linked
+
+    def add(self, rendered: RenderedPage) -> None:
+        page_number = rendered.page_number
+        for dpi, image in rendered.images.items():
+            asset = self._stage(page_number, dpi)
+            asset.width = image.width
+            asset.height = image.height
+            asset.size_bytes = len(image.png)
+            self.uploads.append((asset.preview_image, f"page-{page_number}-dpi-{dpi}.png", image.png))
+            if dpi == self.thumb_dpi:
+                asset.size_bytes += len(rendered.thumbnail)
+                self.uploads.append((asset.thumb_image, f"page-{page_number}-thumb.png", rendered.thumbnail))
+        self._page_done()
+
+    def render(self, page) -> None:
+        self.add(render_page(page, self.dpi_list))
+
+    def extend(self, rendered_pages: Iterable[RenderedPage]) -> None:
+        for rendered in rendered_pages:
+            self.add(rendered)
+
+    def flush(self) -> None:
+        # FieldFile.save(save=False) only touches storage and the field's name, so uploads can overlap.
+        list(self.storage_pool.map(lambda upload: upload[0].save(upload[1], ContentFile(upload[2]), save=False), self.uploads))
+        DocumentPageAsset.objects.bulk_create(self.created)
+        DocumentPageAsset.objects.bulk_update(
+            list(self.updated.values()),
+            ["preview_image", "thumb_image", "width", "height", "size_bytes", "last_accessed_at", "content_hash"],
+        )
+        self.pending_pages = 0
+        self.created = []
+        self.updated = {}
+        self.uploads = []
+
+
+def _start_pooled_render(version: DocumentVersion, page_numbers: list[int], dpi_list: list[int]) -> Iterator[RenderedPage] | None:
+    """Fan rendering of ``page_numbers`` out to worker processes, or return ``None``.
+
+    Only processes that are not daemonic may start the pool: the solo and threads
+    worker pools, or a management shell. Prefork workers render in-process.
+    """
+    processes = min(settings.PAGE_RENDER_PROCESSES, -(-len(page_numbers) // settings.PAGE_RENDER_CHUNK_SIZE))
+    if processes < 2 or len(page_numbers) < settings.PAGE_RENDER_POOL_MIN_PAGES:
+        return None
+    try:
+        return render_in_pool(
+            local_source_path(version),
+            page_numbers,
+            dpi_list,
+            processes=processes,
+            chunk_size=settings.PAGE_RENDER_CHUNK_SIZE,
+        )
+    except AssertionError:
+        # Daemonic pool workers may not start child processes; render in-process instead.
+        logger.warning("Process pool unavailable, rendering version %s in-process", version.id)
+        return None
+
+
+def _carry_forward_pages(version: DocumentVersion, carried: dict[int, int], text_by_page: dict[int, str]) -> None:
+    """Link ``carried`` pages to the parent's rows and pull their text for ``text_content``."""
+    version.copy_page_text(version.parent, carried)
+    parent_texts = dict(
+        version.parent.page_texts.filter(page_number__in=set(carried.values())).values_list("page_number", "text"),
+    )
+    for page_number, parent_page in carried.items():
+        text_by_page[page_number] = parent_texts.get(parent_page, "")
+    logger.info("Version %s reused %s unchanged pages of version %s", version.id, len(carried), version.parent_id)
+
+
+def _replace_bookmarks(version: DocumentVersion, toc: list) -> None:
+    DocumentBookmark.objects.filter(version=version).delete()
+    DocumentBookmark.objects.bulk_create(
+        DocumentBookmark(version=version, title=title, page_number=page, tree={"level": level})
+        for level, title, page in toc
+    )
+
+
+def _lock_render(*parts) -> None:
+    """Take a transaction-scoped advisory lock for one render so concurrent misses wait for it."""
+    key = ":".join(str(part) for part in parts)
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [int.from_bytes(digest, "big", signed=True)])
+
+
+def _touch(queryset, asset) -> None:
+    now = timezone.now()
+    queryset.filter(pk=asset.pk, last_accessed_at__lt=now - PAGE_ACCESS_TOUCH_INTERVAL).update(last_accessed_at=now)
+
+
+def get_page_asset(version: DocumentVersion, page_number: int, dpi: int) -> DocumentPageAsset:
+    """Return the rendered page, rendering it on a miss.
+
+    Concurrent misses for the same page queue on a transaction-scoped advisory lock,
+    so only the first renders and the rest pick up its committed row.
+    """
+    asset = version.page_assets.filter(page_number=page_number, dpi=dpi).exclude(preview_image="").first()
+    if asset is not None:
+        _touch(DocumentPageAsset.objects, asset)
+        return asset
+
+    with transaction.atomic():
+        _lock_render("page", version.id, page_number, dpi)
+        asset = version.page_assets.filter(page_number=page_number, dpi=dpi).exclude(preview_image="").first()
+        if asset is not None:
+            return asset
+        with _PageAssetWriter(version, [dpi], thumb_dpi=DEFAULT_RENDER_DPIS[0]) as writer:
+            if page_number <= len(version.page_hashes):
+                writer.link_existing({page_number: version.page_hashes[page_number - 1]})
+            if (page_number, dpi) not in writer.existing:
+                doc = _open_pdf(version)
+                try:
+                    writer.render(doc.load_page(page_number - 1))
+                finally:
+                    doc.close()
+            writer.flush()
+    return writer.existing[(page_number, dpi)]
+
+
+def get_page_size(version: DocumentVersion, page_number: int) -> tuple[float, float]:
+    cache_key = f"page-size:{version.id}:{page_number}"
+    size = cache.get(cache_key)
+    if size is None:
+        doc = _open_pdf(version)
+        try:
+            bounds = doc.load_page(page_number - 1).rect
+        finally:
+            doc.close()
+        size = (bounds.width, bounds.height)
+        # Version files never change, so the size can stay cached until evicted.
+        cache.set(cache_key, size, timeout=None)
+    return size
+
+
+def get_page_tile(version: DocumentVersion, page_number: int, level: int, column: int, row: int) -> DocumentPageTile:
+    """Return one deep-zoom tile, rendering and caching it on a miss like ``get_page_asset``."""
+    lookup = {"page_number": page_number, "level": level, "column": column, "row": row}
+    tile = version.page_tiles.filter(**lookup).first()
+    if tile is not None:
+        _touch(DocumentPageTile.objects, tile)
+        return tile
+
+    with transaction.atomic():
+        _lock_render("tile", version.id, page_number, level, column, row)
+        tile = version.page_tiles.filter(**lookup).first()
+        if tile is not None:
+            return tile
+        doc = _open_pdf(version)
+        try:
+            image = render_tile(
+                doc.load_page(page_number - 1),
+                level=level,
+                column=column,
+                row=row,
+                tile_size=settings.PAGE_TILE_SIZE,
+            )
+        finally:
+            doc.close()
+        tile = DocumentPageTile(version=version, size_bytes=len(image.png), **lookup)
+        tile.image.save(f"{column}_{row}.png", ContentFile(image.png), save=False)
+        tile.save()
+    return tile
+
+
+@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
+def ingest_version(self, version_id: int, dpi_list: Iterable[int] | None = None) -> None:
+    """Open the PDF once and feed every ingestion stage from a single walk over its pages."""
+    version = DocumentVersion.objects.get(pk=version_id)
+    stages: dict[str, str] = {}
+    try:
+        _ingest(version, list(dpi_list or DEFAULT_RENDER_DPIS), stages)
+    except SoftTimeLimitExceeded:
+        # The hard limit follows shortly; a retry would run out of time the same way.
+        version.merge_processing_state(
+            {
+                stage: stages.get(stage, "failed: time limit exceeded")
+                for stage in INGEST_STAGES
+                if version.processing_state.get(stage) != "completed"
+            }
+        )
+        logger.exception("Ingestion of version %s ran out of time", version_id)
+
+
+def _ingest(version: DocumentVersion, dpi_list: list[int], stages: dict[str, str]) -> None:
+    """Run the ingestion stages, recording failed ones in ``stages`` as they happen."""
+    version_id = version.pk
+    try:
+        doc = _open_pdf(version)
+    except Exception as exc:
+        version.merge_processing_state({stage: f"failed: {exc}" for stage in INGEST_STAGES})
+        logger.exception("Failed opening version %s for ingestion", version_id)
+        return
+
+    def run_stage(stage: str, func, *args):
+        if stage in stages:
+            return None
+        try:
+            return func(*args)
+        except SoftTimeLimitExceeded:
+            raise
+        except Exception as exc:
+            stages[stage] = f"failed: {exc}"
+            logger.exception("Ingestion stage %s failed for version %s", stage, version_id)
+            return None
+
+    try:
+        # Metadata lands first so clients learn the page count before pages are rendered.
+        pdf_info = run_stage("metadata", _read_metadata, doc)
+        if pdf_info is not None:
+            version.merge_processing_state({"metadata": "completed"}, pdf_info=pdf_info)
+        else:
+            version.merge_processing_state({"metadata": stages["metadata"]})
+
+        layout: dict[int, list[dict]] = {}
+        text_by_page: dict[int, str] = {}
+        page_texts: dict[int, tuple[str, list[tuple]]] = {}
+        # Pages unchanged since the parent version reuse its text, layout and search rows.
+        parent_pages = version.parent.indexed_pages_by_hash() if version.parent_id else {}
+        carried: dict[int, int] = {}
+        hasher = PageHasher(doc)
+        # Only the opening pages are rendered eagerly; the rest render on first view.
+        eager_hashes = {number + 1: hasher.page_hash(doc.load_page(number)) for number in range(min(doc.page_count, settings.PAGE_EAGER_RENDER_PAGES))}
+        page_hashes: list[str] = []
+        with _PageAssetWriter(version, dpi_list) as writer:
+            linked = run_stage("render", writer.link_existing, eager_hashes) or set()
+            to_render = [number for number in eager_hashes if number not in linked]
+            for page in doc:
+                page_hashes.append(eager_hashes.get(page.number + 1) or hasher.page_hash(page))
+                if page_hashes[-1] in parent_pages:
+                    carried[page.number + 1] = parent_pages[page_hashes[-1]]
+                    page_text = None
+                else:
+                    page_text = run_stage("text", _read_page_text, page)
+                if page_text is not None:
+                    layout[page.number + 1] = page_text[0]
+                    text_by_page[page.number + 1] = page_text[1]
+                    page_texts[page.number + 1] = page_text[1:]
+                    if len(page_texts) >= SEARCH_INDEX_BATCH_PAGES:
+                        run_stage("search", version.set_page_texts, page_texts)
+                        page_texts = {}
+                if page.number + 1 in to_render:
+                    run_stage("render", writer.render, page)
+            run_stage("render", writer.flush)
+        if page_texts and "text" not in stages:
+            run_stage("search", version.set_page_texts, page_texts)
+        toc = run_stage("bookmarks", doc.get_toc, True)
+        if toc is not None:
+            run_stage("bookmarks", _replace_bookmarks, version, toc)
+    finally:
+        doc.close()
+
+    fields = {"page_hashes": page_hashes}
+    # Last, as it replaces the file the stages above read from.
+    fields.update(run_stage("linearize", _linearize, version) or {})
+    if carried and "text" not in stages:
+        run_stage("text", _carry_forward_pages, version, carried, text_by_page)
+    if "text" in stages:
+        # A partial text walk leaves a partial index.
+        stages.setdefault("search", stages["text"])
+    else:
+        version.set_page_layouts(layout)
+        fields["text_content"] = "\n".join(text_by_page.get(number, "") for number in range(1, len(page_hashes) + 1))
+    for stage in ("render", "text", "bookmarks", "search", "linearize"):
+        stages.setdefault(stage, "completed")
+    stages.pop("metadata", None)
+    version.merge_processing_state(stages, **fields)
+    if stages["text"] == "completed":
+        queue_summary(version_id)
+
+
+def queue_summary(version_id: int) -> None:
+    """Summarize a version once the page texts it was just given are committed."""
+    # Imported here, as the AI tasks import this module.
+    from pdf_web.ai.tasks import summarize_version
+
+    transaction.on_commit(lambda: summarize_version.delay(version_id))
 
 
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
@@ -31,59 +466,38 @@ def extract_metadata(self, version_id: int) -> None:
     version = DocumentVersion.objects.get(pk=version_id)
     try:
         doc = _open_pdf(version)
-        version.pdf_info = {
-            "page_count": doc.page_count,
-            "metadata": doc.metadata,
-        }
-        version.processing_state = {**version.processing_state, "metadata": "completed"}
-        version.save(update_fields=["pdf_info", "processing_state"])
-    except Exception as exc:  # noqa: BLE001
-        version.processing_state = {**version.processing_state, "metadata": f"failed: {exc}"}
-        version.save(update_fields=["processing_state"])
+        version.merge_processing_state({"metadata": "completed"}, pdf_info=_read_metadata(doc))
+    except Exception as exc:
+        version.merge_processing_state({"metadata": f"failed: {exc}"})
         logger.exception("Failed extracting metadata for version %s", version_id)
 
 
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
 def render_page_images(self, version_id: int, dpi_list: Iterable[int] | None = None) -> None:
     version = DocumentVersion.objects.get(pk=version_id)
-    dpi_list = list(dpi_list or [72, 150])
+    dpi_list = list(dpi_list or DEFAULT_RENDER_DPIS)
     try:
         doc = _open_pdf(version)
     except Exception as exc:  # noqa: BLE001
-        version.processing_state = {**version.processing_state, "render": f"failed: {exc}"}
-        version.save(update_fields=["processing_state"])
+        version.merge_processing_state({"render": f"failed: {exc}"})
         return
 
-    for page_index in range(doc.page_count):
-        page = doc.load_page(page_index)
-        for dpi in dpi_list:
-            zoom = dpi / 72
-            try:
-                import fitz
-
-                matrix = fitz.Matrix(zoom, zoom)
-            except ImportError:
-                matrix = None
-            pix = page.get_pixmap(matrix=matrix) if matrix is not None else page.get_pixmap()
-            img_bytes = pix.tobytes("png")
-            width, height = pix.width, pix.height
-            content_file = ContentFile(img_bytes)
-            preview_name = f"page-{page_index + 1}-dpi-{dpi}.png"
-            asset, _ = DocumentPageAsset.objects.get_or_create(
-                version=version,
-                page_number=page_index + 1,
-                dpi=dpi,
-            )
-            asset.preview_image.save(preview_name, content_file, save=False)
-            if dpi == min(dpi_list):
-                thumb_name = f"page-{page_index + 1}-thumb.png"
-                asset.thumb_image.save(thumb_name, ContentFile(img_bytes), save=False)
-            asset.width = width
-            asset.height = height
-            asset.save()
-
-    version.processing_state = {**version.processing_state, "render": "completed"}
-    version.save(update_fields=["processing_state"])
+    fields = {}
+    page_hashes = version.page_hashes
+    if len(page_hashes) != doc.page_count:
+        hasher = PageHasher(doc)
+        page_hashes = fields["page_hashes"] = [hasher.page_hash(page) for page in doc]
+    with _PageAssetWriter(version, dpi_list) as writer:
+        linked = writer.link_existing({number: content_hash for number, content_hash in enumerate(page_hashes, start=1)})
+        to_render = [number for number in range(1, doc.page_count + 1) if number not in linked]
+        pooled = _start_pooled_render(version, to_render, dpi_list)
+        if pooled is not None:
+            writer.extend(pooled)
+        else:
+            for number in to_render:
+                writer.render(doc.load_page(number - 1))
+        writer.flush()
+    version.merge_processing_state({"render": "completed"}, **fields)
 
 
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
@@ -92,27 +506,16 @@ def extract_text_layout(self, version_id: int) -> None:
     try:
         doc = _open_pdf(version)
     except Exception as exc:  # noqa: BLE001
-        version.processing_state = {**version.processing_state, "text": f"failed: {exc}"}
-        version.save(update_fields=["processing_state"])
+        version.merge_processing_state({"text": f"failed: {exc}"})
         return
     layout = {}
     text_chunks: list[str] = []
-    for page_index in range(doc.page_count):
-        page = doc.load_page(page_index)
-        blocks = page.get_text("blocks")
-        layout[str(page_index + 1)] = [
-            {
-                "bbox": block[:4],
-                "text": block[4],
-                "block_type": block[6],
-            }
-            for block in blocks
-        ]
-        text_chunks.append(page.get_text())
-    version.layout_json = layout
-    version.text_content = "\n".join(text_chunks)
-    version.processing_state = {**version.processing_state, "text": "completed"}
-    version.save(update_fields=["layout_json", "text_content", "processing_state"])
+    for page in doc:
+        blocks, text, _ = _read_page_text(page)
+        layout[page.number + 1] = blocks
+        text_chunks.append(text)
+    version.set_page_layouts(layout)
+    version.merge_processing_state({"text": "completed"}, text_content="\n".join(text_chunks))
 
 
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
@@ -120,28 +523,155 @@ def parse_bookmarks(self, version_id: int) -> None:
     version = DocumentVersion.objects.get(pk=version_id)
     try:
         doc = _open_pdf(version)
-        toc = doc.get_toc(simple=True)
-        DocumentBookmark.objects.filter(version=version).delete()
-        for entry in toc:
-            level, title, page = entry
-            DocumentBookmark.objects.create(
-                version=version,
-                title=title,
-                page_number=page,
-                tree={"level": level},
-            )
-        version.processing_state = {**version.processing_state, "bookmarks": "completed"}
-        version.save(update_fields=["processing_state"])
+        _replace_bookmarks(version, doc.get_toc(simple=True))
+        version.merge_processing_state({"bookmarks": "completed"})
     except Exception as exc:  # noqa: BLE001
-        version.processing_state = {**version.processing_state, "bookmarks": f"failed: {exc}"}
-        version.save(update_fields=["processing_state"])
+        version.merge_processing_state({"bookmarks": f"failed: {exc}"})
 
 
 @shared_task(bind=True)
 def index_search(self, version_id: int) -> None:
     version = DocumentVersion.objects.get(pk=version_id)
-    version.processing_state = {**version.processing_state, "search": "completed"}
-    version.save(update_fields=["processing_state"])
+    try:
+        doc = _open_pdf(version)
+    except Exception as exc:  # noqa: BLE001
+        version.merge_processing_state({"search": f"failed: {exc}"})
+        return
+    try:
+        page_texts = {}
+        for page in doc:
+            page_texts[page.number + 1] = _read_page_text(page)[1:]
+            if len(page_texts) >= SEARCH_INDEX_BATCH_PAGES:
+                version.set_page_texts(page_texts)
+                page_texts = {}
+        if page_texts:
+            version.set_page_texts(page_texts)
+    finally:
+        doc.close()
+    version.merge_processing_state({"search": "completed"})
+    queue_summary(version_id)
+
+
+def _evict_least_recently_used(queryset, max_bytes: int, file_fields: tuple[str, ...]) -> int:
+    total = queryset.aggregate(total=Sum("size_bytes"))["total"] or 0
+    excess = total - max_bytes
+    evicted = 0
+    while excess > 0:
+        batch = list(queryset.filter(size_bytes__gt=0).order_by("last_accessed_at")[:500])
+        if not batch:
+            break
+        victims = []
+        for entry in batch:
+            if excess <= 0:
+                break
+            excess -= entry.size_bytes
+            victims.append(entry)
+        queryset.filter(pk__in=[entry.pk for entry in victims]).delete()
+        for field_name in file_fields:
+            names = {getattr(entry, field_name).name for entry in victims if getattr(entry, field_name)}
+            # Files can be linked from other versions with the same page content; keep those.
+            still_linked = set(queryset.filter(**{f"{field_name}__in": names}).values_list(field_name, flat=True))
+            storage = queryset.model._meta.get_field(field_name).storage
+            for name in names - still_linked:
+                storage.delete(name)
+        evicted += len(victims)
+    return evicted
+
+
+@shared_task(bind=True, ignore_result=True)
+def evict_page_render_cache(self) -> int:
+    """Delete least recently viewed page renders and tiles until each fits its byte budget."""
+    evicted = _evict_least_recently_used(
+        DocumentPageAsset.objects.all(),
+        settings.PAGE_RENDER_CACHE_MAX_BYTES,
+        ("preview_image", "thumb_image"),
+    )
+    evicted += _evict_least_recently_used(
+        DocumentPageTile.objects.all(),
+        settings.PAGE_TILE_CACHE_MAX_BYTES,
+        ("image",),
+    )
+    if evicted:
+        logger.info("Evicted %s page renders from the render cache", evicted)
+    return evicted
+
+
+@shared_task(bind=True, ignore_result=True)
+def delete_orphan_page_content(self) -> int:
+    """Delete page layouts and words no version page links any more."""
+    # Recent ones may still be getting linked.
+    cutoff = timezone.now() - ORPHAN_CONTENT_GRACE
+    deleted = sum(model.objects.filter(pages__isnull=True, created_at__lt=cutoff).delete()[0] for model in (PageLayout, PageWords))
+    if deleted:
+        logger.info("Deleted %s unreferenced page layouts and words", deleted)
+    return deleted
+
+
+@shared_task(bind=True, ignore_result=True)
+def delete_unreferenced_files(self) -> int:
+    """Delete stored version files no version links any more, with their storage objects."""
+    deleted = 0
+    for stored in StoredFile.objects.filter(versions__isnull=True, linked_at__lt=timezone.now() - ORPHAN_CONTENT_GRACE):
+        # Re-checked per row: a new upload of the same content bumps linked_at before linking it.
+        if StoredFile.objects.filter(pk=stored.pk, linked_at=stored.linked_at, versions__isnull=True).delete()[0]:
+            stored.file.delete(save=False)
+            deleted += 1
+    if deleted:
+        logger.info("Deleted %s unreferenced version files", deleted)
+    return deleted
+
+
+@shared_task(bind=True, ignore_result=True)
+def expire_upload_sessions(self) -> int:
+    """Delete unfinished uploads nobody has appended to within ``UPLOAD_SESSION_EXPIRY_HOURS``."""
+    cutoff = timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_EXPIRY_HOURS)
+    expired = list(UploadSession.objects.filter(status=UploadStatus.RECEIVING, updated_at__lt=cutoff))
+    for session in expired:
+        if session.direct:
+            discard_direct_upload(session)
+        else:
+            session.part_path.unlink(missing_ok=True)
+    UploadSession.objects.filter(pk__in=[session.pk for session in expired]).delete()
+    return len(expired)
+
+
+@shared_task(bind=True, autoretry_for=(OSError,), retry_backoff=True, max_retries=3)
+def complete_upload(self, session_id: str) -> int | None:
+    """Store a finalized resumable or direct upload as the first version of its document and ingest it."""
+    session = UploadSession.objects.select_related("document").get(pk=session_id)
+    if session.status != UploadStatus.FINALIZING:
+        return None
+    document = session.document
+    version = DocumentVersion(
+        document=document,
+        version_number=1,
+        created_by=session.created_by,
+        processing_state={"upload": "completed"},
+    )
+    try:
+        if session.direct:
+            version.link_stored_file(store_direct_upload(session))
+        else:
+            with session.part_path.open("rb") as part:
+                # Hashed in one sequential pass here, off the request path, then moved into storage.
+                version.attach_file(AssembledUpload(part, name=session.filename))
+    except (FileNotFoundError, DirectUploadError) as exc:
+        session.status = UploadStatus.FAILED
+        session.error = str(exc)
+        session.save(update_fields=["status", "error", "updated_at"])
+        document.status = DocumentStatus.ERROR
+        document.save(update_fields=["status", "updated_at"])
+        return None
+    with transaction.atomic():
+        version.save()
+        document.current_version = version
+        document.save(update_fields=["current_version", "updated_at"])
+        session.status = UploadStatus.COMPLETED
+        session.save(update_fields=["status", "updated_at"])
+    # Local storage moved the part file; other backends copied it.
+    session.part_path.unlink(missing_ok=True)
+    ingest_version.delay(version.id)
+    return version.id
 
 
 @shared_task(bind=True)
@@ -156,18 +686,19 @@ def create_new_version_from_document(self, document_id: int, source_version_id:
         new_version = DocumentVersion.objects.create(
             document=document,
             version_number=next_version_number,
-            file=source_version.file,
+            **source_version.shared_file_fields(),
             created_by=source_version.created_by,
             processing_state={"copied_from": source_version_id},
+            parent=source_version,
             pdf_info=source_version.pdf_info,
             text_content=source_version.text_content,
-            layout_json=source_version.layout_json,
             security_state=source_version.security_state,
+            page_hashes=source_version.page_hashes,
         )
-        new_version.update_file_metadata()
-        new_version.save()
+        new_version.copy_page_text(source_version)
         document.current_version = new_version
         document.status = DocumentStatus.ACTIVE if hasattr(DocumentStatus, "ACTIVE") else document.status
         document.updated_at = timezone.now()
         document.save(update_fields=["current_version", "updated_at", "status"])
+        queue_summary(new_version.id)
     return new_version.id
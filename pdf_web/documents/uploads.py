@@ -0,0 +1,114 @@
+"""Receiving version files: hashing upload handlers and resumable chunked uploads.
+
+Version files are stored by content hash, so the hash is needed before the file
+reaches storage. Computing it on the chunks the parser already hands to the
+handlers saves reading the file back afterwards.
+
+Files too large for one request are sent as a resumable upload instead: chunks
+are streamed straight from the request body into a part file at the offset the
+session has reached, so neither memory use nor a dropped connection depends on
+the size of the whole file.
+"""
+
+from __future__ import annotations
+
+import hashlib
+
+from django.core.files import File
+from django.core.files.uploadhandler import MemoryFileUploadHandler
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+class HashingUploadMixin:
+    """Set ``content_hash``, the SHA-256 of the upload, on the file this handler completes."""
+
+    def new_file(self, *args, **kwargs):
+        # Set first: the memory handler signals that it takes the file by raising.
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        if remaining is None:
+            # This handler kept the chunk; handlers it was passed on to hash it themselves.
+            self.hasher.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if uploaded is not None:
+            uploaded.content_hash = self.hasher.hexdigest()
+        return uploaded
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def file_digest(content) -> str:
+    """SHA-256 of ``content``, taken from the upload handler when it was hashed on the way in."""
+    content_hash = getattr(content, "content_hash", None)
+    if content_hash:
+        return content_hash
+    hasher = hashlib.sha256()
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+# Request body bytes read and written at a time while appending a chunk.
+CHUNK_READ_SIZE = 1024 * 1024
+PDF_MAGIC = b"%PDF-"
+
+
+class ChunkError(ValueError):
+    """A chunk that could not be appended; none of its bytes are kept."""
+
+
+def append_chunk(session, stream, *, length: int, checksum: str = "") -> None:
+    """Append ``length`` bytes of ``stream`` to the part file at ``session.received_bytes``.
+
+    The chunk is hashed as it is written. A short body, a checksum mismatch or any
+    error truncates the part file back to the previous offset, so the client only
+    resends that chunk. The caller saves the advanced ``received_bytes``.
+    """
+    offset = session.received_bytes
+    hasher = hashlib.sha256()
+    with session.part_path.open("r+b") as part:
+        # Drops whatever an earlier, interrupted attempt at this chunk left behind.
+        part.truncate(offset)
+        part.seek(offset)
+        try:
+            remaining = length
+            while remaining:
+                try:
+                    data = stream.read(min(remaining, CHUNK_READ_SIZE))
+                except OSError as exc:
+                    raise ChunkError("The connection dropped during the chunk.") from exc
+                if not data:
+                    raise ChunkError("The chunk ended before its Content-Length.")
+                hasher.update(data)
+                part.write(data)
+                remaining -= len(data)
+            if checksum and checksum.lower() != hasher.hexdigest():
+                raise ChunkError("Upload-Checksum does not match the chunk.")
+            if offset == 0:
+                part.seek(0)
+                if part.read(len(PDF_MAGIC)) != PDF_MAGIC:
+                    raise ChunkError("Only PDF files are allowed.")
+        except BaseException:
+            part.truncate(offset)
+            raise
+    session.received_bytes = offset + length
+
+
+class AssembledUpload(File):
+    """The part file of a finished upload; local storage moves it into place rather than copying it."""
+
+    def temporary_file_path(self) -> str:
+        return self.file.name
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+from django.conf import settings
 from rest_framework import serializers
 
+from pdf_web.documents.models import Workspace
+from pdf_web.operations.models import BatchConversionJob
 from pdf_web.operations.models import ConversionJob
 from pdf_web.operations.models import CropJob
 from pdf_web.operations.models import OperationJob
@@ -58,6 +61,62 @@ class ConversionJobSerializer(AsyncJobSerializer):
         fields = ["id", "status", "progress", "target_format", "result_version", "result_url", "preview_url", "error", "created_at"]
 
 
+class BatchConversionItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ConversionJob
+        fields = ["id", "version", "status", "progress", "result_version", "error", "finished_at"]
+
+
+class BatchConversionJobSerializer(serializers.ModelSerializer):
+    items = BatchConversionItemSerializer(many=True, read_only=True)
+    result_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BatchConversionJob
+        fields = [
+            "id",
+            "workspace",
+            "target_format",
+            "status",
+            "progress",
+            "max_parallel",
+            "items",
+            "result_url",
+            "error",
+            "created_at",
+            "finished_at",
+        ]
+
+    def get_result_url(self, obj):
+        if not obj.result_file:
+            return None
+        request = self.context.get("request")
+        return request.build_absolute_uri(obj.result_file.url) if request else obj.result_file.url
+
+
+class BatchConversionCreateSerializer(serializers.Serializer):
+    workspace = serializers.PrimaryKeyRelatedField(queryset=Workspace.objects.all())
+    target_format = serializers.ChoiceField(choices=["pdf", "word", "excel", "ppt", "jpg"])
+    version_ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    archive = serializers.FileField(required=False)
+    max_parallel = serializers.IntegerField(required=False, min_value=1)
+    allow_text_fallback = serializers.BooleanField(required=False, default=False)
+
+    def validate_version_ids(self, value):
+        max_items = getattr(settings, "BATCH_CONVERSION_MAX_ITEMS", 1000)
+        if len(value) > max_items:
+            raise serializers.ValidationError(f"A batch may contain at most {max_items} versions.")
+        return list(dict.fromkeys(value))
+
+    def validate_max_parallel(self, value):
+        return min(value, getattr(settings, "BATCH_CONVERSION_MAX_PARALLEL", 8))
+
+    def validate(self, attrs):
+        if bool(attrs.get("version_ids")) == bool(attrs.get("archive")):
+            raise serializers.ValidationError("Provide either version_ids or an archive.")
+        return attrs
+
+
 class PageNumberJobSerializer(AsyncJobSerializer):
     class Meta:
         model = PageNumberJob
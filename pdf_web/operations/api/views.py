@@ -1,6 +1,10 @@
 from __future__ import annotations
 
+import zipfile
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.core.files.uploadedfile import UploadedFile
@@ -9,6 +13,7 @@ from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.throttling import ScopedRateThrottle
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.viewsets import ReadOnlyModelViewSet
@@ -16,15 +21,23 @@ from rest_framework.viewsets import ReadOnlyModelViewSet
 from pdf_web.audit.utils import log_audit_event
 from pdf_web.documents.models import Document
 from pdf_web.documents.models import DocumentVersion
+from pdf_web.documents.models import UploadSession
+from pdf_web.documents.models import UploadStatus
 from pdf_web.documents.models import Workspace
 from pdf_web.documents.models import WorkspaceMember
 from pdf_web.documents.models import WorkspaceRole
+from pdf_web.operations.api.serializers import BatchConversionCreateSerializer
+from pdf_web.operations.api.serializers import BatchConversionJobSerializer
 from pdf_web.operations.api.serializers import ConversionJobSerializer
 from pdf_web.operations.api.serializers import OperationJobSerializer
+from pdf_web.operations.models import BatchConversionJob
 from pdf_web.operations.models import ConversionJob
 from pdf_web.operations.models import OperationJob
 from pdf_web.operations.models import OperationType
+from pdf_web.operations.services import create_batch_conversion_job
+from pdf_web.operations.services import versions_from_archive
 from pdf_web.operations.tasks import apply_operation
+from pdf_web.operations.tasks import process_batch_conversion_job
 from pdf_web.operations.tasks import process_conversion_job
 from pdf_web.permissions import require_role
 
@@ -89,6 +102,57 @@ class ExportJobViewSet(ReadOnlyModelViewSet):
         ).distinct()
 
 
+class BatchConversionJobViewSet(ModelViewSet):
+    serializer_class = BatchConversionJobSerializer
+    permission_classes = [IsAuthenticated]
+    http_method_names = ["get", "post"]
+
+    def get_throttles(self):
+        if self.action == "create":
+            self.throttle_scope = "conversion"
+            return [ScopedRateThrottle()]
+        return super().get_throttles()
+
+    def get_queryset(self):
+        return BatchConversionJob.objects.filter(
+            Q(workspace__owner=self.request.user) | Q(workspace__memberships__user=self.request.user)
+        ).distinct().prefetch_related("items")
+
+    def create(self, request, *args, **kwargs):
+        serializer = BatchConversionCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        workspace = data["workspace"]
+        require_role(request.user, workspace, [WorkspaceRole.EDITOR, WorkspaceRole.ADMIN, WorkspaceRole.OWNER])
+        if data.get("archive"):
+            try:
+                versions = versions_from_archive(
+                    data["archive"],
+                    workspace=workspace,
+                    created_by=request.user,
+                    max_items=getattr(settings, "BATCH_CONVERSION_MAX_ITEMS", 1000),
+                    max_entry_size=getattr(settings, "PDF_MAX_UPLOAD_SIZE", 25 * 1024 * 1024),
+                )
+            except (ValueError, zipfile.BadZipFile) as exc:
+                return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            versions = list(DocumentVersion.objects.filter(id__in=data["version_ids"], document__workspace=workspace))
+            missing = sorted(set(data["version_ids"]) - {version.id for version in versions})
+            if missing:
+                return Response({"detail": "Unknown versions for this workspace.", "version_ids": missing}, status=status.HTTP_400_BAD_REQUEST)
+        batch = create_batch_conversion_job(
+            workspace=workspace,
+            requested_by=request.user,
+            target_format=data["target_format"],
+            versions=versions,
+            max_parallel=data.get("max_parallel") or getattr(settings, "BATCH_CONVERSION_DEFAULT_PARALLEL", 4),
+            params={"allow_text_fallback": data["allow_text_fallback"]},
+        )
+        transaction.on_commit(lambda: process_batch_conversion_job.delay(batch.id))
+        log_audit_event(request=request, workspace=workspace, action="conversion.batch", entity_type="BatchConversionJob", entity_id=batch.id, metadata={"items": len(versions)})
+        return Response(BatchConversionJobSerializer(batch, context={"request": request}).data, status=status.HTTP_202_ACCEPTED)
+
+
 class BaseUploadConversionView(APIView):
     permission_classes = [AllowAny]
 
@@ -134,21 +198,35 @@ class BaseUploadConversionView(APIView):
 
     def _run_upload_conversion(self, request, *, target_format: str, source_mime_type: str):
         upload = request.FILES.get("file")
-        if not upload:
+        upload_id = request.data.get("upload")
+        if upload_id and request.user.is_authenticated:
+            # A finished upload session, typically a direct upload whose bytes never passed through here.
+            session = get_object_or_404(UploadSession, pk=upload_id, created_by=request.user)
+            if source_mime_type != "pdf":
+                return Response({"detail": "Upload sessions hold PDF files."}, status=400)
+            if session.status != UploadStatus.COMPLETED:
+                return Response({"detail": "The upload is not completed yet."}, status=409)
+            document = session.document
+            version = document.current_version
+            workspace = document.workspace
+            created_by = request.user
+        elif upload:
+            workspace = self._resolve_workspace(request)
+            created_by = request.user if request.user.is_authenticated else workspace.owner
+            document = Document.objects.create(workspace=workspace, title=upload.name, created_by=created_by)
+            version = DocumentVersion(
+                document=document,
+                version_number=1,
+                created_by=created_by,
+                processing_state={"upload": "completed"},
+            )
+            version.attach_file(upload)
+            version.save()
+            document.current_version = version
+            document.save(update_fields=["current_version"])
+        else:
             return Response({"detail": "file is required"}, status=400)
-        workspace = self._resolve_workspace(request)
-        created_by = request.user if request.user.is_authenticated else workspace.owner
-        document = Document.objects.create(workspace=workspace, title=upload.name, created_by=created_by)
-        version = DocumentVersion.objects.create(
-            document=document,
-            version_number=1,
-            file=upload,
-            created_by=created_by,
-            processing_state={"upload": "completed"},
-        )
-        document.current_version = version
-        document.save(update_fields=["current_version"])
-        params = {k: v for k, v in request.data.items() if not isinstance(v, UploadedFile)}
+        params = {k: v for k, v in request.data.items() if k != "upload" and not isinstance(v, UploadedFile)}
         # For upload endpoints, prefer returning a downloadable fallback file over
         # hard-failing when high-fidelity PDF->Word/PPT conversion is unavailable.
         if source_mime_type == "pdf" and target_format in {"word", "ppt"}:
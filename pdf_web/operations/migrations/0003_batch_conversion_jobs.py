@@ -0,0 +1,64 @@
+# Generated by Django 5.0.9 on 2026-10-19 05:29
+
+import django.db.models.deletion
+import django.utils.timezone
+import pdf_web.operations.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_alter_workspacemember_role'),
+        ('operations', '0002_async_jobs_and_share_links'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversionjob',
+            name='result_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_results', to='documents.documentversion'),
+        ),
+        migrations.AlterField(
+            model_name='cropjob',
+            name='result_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_results', to='documents.documentversion'),
+        ),
+        migrations.AlterField(
+            model_name='pagenumberjob',
+            name='result_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_results', to='documents.documentversion'),
+        ),
+        migrations.AlterField(
+            model_name='watermarkjob',
+            name='result_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_results', to='documents.documentversion'),
+        ),
+        migrations.CreateModel(
+            name='BatchConversionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_format', models.CharField(max_length=16)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('archiving', 'Archiving'), ('completed', 'Completed'), ('partial', 'Completed with failures'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('progress', models.PositiveSmallIntegerField(default=0)),
+                ('max_parallel', models.PositiveSmallIntegerField(default=4)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('result_file', models.FileField(blank=True, upload_to=pdf_web.operations.models.batch_result_upload_path)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batch_conversion_jobs', to='documents.workspace')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='conversionjob',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='operations.batchconversionjob'),
+        ),
+    ]
@@ -88,6 +88,7 @@ class VersionBoundJob(models.Model):
     )
     error = models.TextField(blank=True)
     created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
     finished_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
@@ -95,9 +96,50 @@ class VersionBoundJob(models.Model):
         ordering = ["-created_at"]
 
 
+def batch_result_upload_path(instance: "BatchConversionJob", filename: str) -> str:
+    return f"batches/{instance.workspace_id}/{instance.id}/{filename}"
+
+
+class BatchConversionStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    RUNNING = "running", "Running"
+    ARCHIVING = "archiving", "Archiving"
+    COMPLETED = "completed", "Completed"
+    PARTIAL = "partial", "Completed with failures"
+    FAILED = "failed", "Failed"
+
+
+class BatchConversionJob(models.Model):
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE, related_name="batch_conversion_jobs")
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    target_format = models.CharField(max_length=16)
+    status = models.CharField(
+        max_length=16,
+        choices=BatchConversionStatus.choices,
+        default=BatchConversionStatus.PENDING,
+    )
+    progress = models.PositiveSmallIntegerField(default=0)
+    max_parallel = models.PositiveSmallIntegerField(default=4)
+    params = models.JSONField(default=dict, blank=True)
+    result_file = models.FileField(upload_to=batch_result_upload_path, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+
 class ConversionJob(VersionBoundJob):
     target_format = models.CharField(max_length=16)
     source_mime_type = models.CharField(max_length=128, blank=True)
+    batch = models.ForeignKey(
+        BatchConversionJob,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="items",
+    )
 
 
 class WatermarkJob(VersionBoundJob):
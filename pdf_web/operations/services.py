@@ -1,25 +1,35 @@
 from __future__ import annotations
 
+import json
 import logging
-import secrets
-from datetime import timedelta
-from io import BytesIO
-from pathlib import Path
 import re
+import secrets
 import shutil
 import subprocess
 import tempfile
 import zipfile
-from xml.sax.saxutils import escape
+from collections.abc import Iterable
+from collections.abc import Iterator
+from datetime import timedelta
+from io import BytesIO
+from pathlib import Path
 from xml.etree import ElementTree
+from xml.sax.saxutils import escape
 
 from django.contrib.auth.hashers import make_password
 from django.core.files.base import ContentFile
+from django.core.files.base import File
 from django.db import models
+from django.db import transaction
 from django.utils import timezone
 
+from pdf_web.documents.models import Document
 from pdf_web.documents.models import DocumentStatus
 from pdf_web.documents.models import DocumentVersion
+from pdf_web.documents.tasks import queue_summary
+from pdf_web.operations.models import AsyncJobStatus
+from pdf_web.operations.models import BatchConversionJob
+from pdf_web.operations.models import ConversionJob
 from pdf_web.operations.models import ShareLink
 
 logger = logging.getLogger(__name__)
@@ -33,6 +43,26 @@ EXT_BY_TARGET = {
 }
 
 
+SOURCE_KIND_BY_EXT = {
+    ".pdf": "pdf",
+    ".doc": "word",
+    ".docx": "word",
+    ".odt": "word",
+    ".rtf": "word",
+    ".xls": "excel",
+    ".xlsx": "excel",
+    ".xlsm": "excel",
+    ".ppt": "ppt",
+    ".pptx": "ppt",
+    ".odp": "ppt",
+    ".jpg": "jpg",
+    ".jpeg": "jpg",
+    ".png": "jpg",
+}
+
+ARCHIVE_COPY_CHUNK_SIZE = 1024 * 1024
+
+
 def _is_truthy(value) -> bool:
     if isinstance(value, bool):
         return value
@@ -66,16 +96,17 @@ def clone_version(version: DocumentVersion, *, created_by=None,
     new_version = DocumentVersion.objects.create(
         document=document,
         version_number=next_version_number,
-        file=version.file,
+        **version.shared_file_fields(),
         created_by=created_by or version.created_by,
         processing_state=processing_state or {"copied_from": version.id},
+        parent=version,
         pdf_info=version.pdf_info,
         text_content=version.text_content,
-        layout_json=version.layout_json,
         security_state=version.security_state,
+        page_hashes=version.page_hashes,
     )
-    new_version.update_file_metadata()
-    new_version.save()
+    new_version.copy_page_text(version)
+    queue_summary(new_version.id)
     document.current_version = new_version
     document.status = DocumentStatus.ACTIVE
     document.updated_at = timezone.now()
@@ -117,57 +148,116 @@ def _minimal_pdf_bytes(text: str) -> bytes:
     return out.getvalue()
 
 
-def _extract_docx_text(xml_data: bytes) -> str:
-    values = re.findall(rb"<w:t[^>]*>(.*?)</w:t>", xml_data, flags=re.DOTALL)
-    return " ".join(v.decode("utf-8", errors="ignore").strip() for v in values if v.strip())
-
-
-def _extract_pptx_text(xml_data: bytes) -> str:
-    values = re.findall(rb"<a:t[^>]*>(.*?)</a:t>", xml_data, flags=re.DOTALL)
-    return " ".join(v.decode("utf-8", errors="ignore").strip() for v in values if v.strip())
-
+def _join_within_budget(fragments: Iterable[str], max_chars: int) -> str:
+    # ``fragments`` is consumed lazily, so stopping here also stops the parse feeding it.
+    parts: list[str] = []
+    total = 0
+    for fragment in fragments:
+        if not fragment:
+            continue
+        parts.append(fragment)
+        total += len(fragment) + 1
+        if total >= max_chars:
+            break
+    return " ".join(parts)[:max_chars]
+
+
+def _iter_xml_records(stream, tag: str) -> Iterator[ElementTree.Element]:
+    """Stream ``tag`` elements out of an XML part, detaching each one once the caller is done with it."""
+    parents: list[ElementTree.Element] = []
+    for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag.rpartition("}")[2] != tag:
+            continue
+        yield element
+        element.clear()
+        if parents:
+            parents[-1].remove(element)
+
+
+def _iter_archive_records(archive: zipfile.ZipFile, name: str, tag: str) -> Iterator[ElementTree.Element]:
+    with archive.open(name) as stream:
+        yield from _iter_xml_records(stream, tag)
+
+
+def _iter_xml_text(stream, tag: str) -> Iterator[str]:
+    """Yield the text of each ``tag`` element of an XML part, discarding every element once it has ended."""
+    parents: list[ElementTree.Element] = []
+    for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag.rpartition("}")[2] == tag:
+            text = (element.text or "").strip()
+            if text:
+                yield text
+        element.clear()
+        if parents:
+            parents[-1].remove(element)
+
+
+def _iter_archive_text(archive: zipfile.ZipFile, names: Iterable[str], tag: str) -> Iterator[str]:
+    for name in names:
+        with archive.open(name) as stream:
+            yield from _iter_xml_text(stream, tag)
+
+
+class _SharedStrings:
+    """Shared string table that is only parsed as far as the highest index a sheet asks for."""
+
+    def __init__(self, archive: zipfile.ZipFile):
+        self._strings: list[str] = []
+        self._records = None
+        if "xl/sharedStrings.xml" in archive.namelist():
+            self._records = _iter_archive_records(archive, "xl/sharedStrings.xml", "si")
+
+    def get(self, index: int) -> str:
+        while self._records is not None and index >= len(self._strings):
+            si = next(self._records, None)
+            if si is None:
+                self._records = None
+                break
+            self._strings.append("".join(t.text or "" for t in si.iterfind(".//{*}t")).strip())
+        if 0 <= index < len(self._strings):
+            return self._strings[index]
+        return ""
 
-def _extract_xlsx_text(archive: zipfile.ZipFile) -> str:
-    strings: list[str] = []
-    if "xl/sharedStrings.xml" in archive.namelist():
-        root = ElementTree.fromstring(archive.read("xl/sharedStrings.xml"))
-        for si in root.findall("{*}si"):
-            text_parts = [t.text or "" for t in si.findall(".//{*}t")]
-            strings.append("".join(text_parts).strip())
 
-    values: list[str] = []
+def _iter_xlsx_values(archive: zipfile.ZipFile) -> Iterator[str]:
+    shared_strings = _SharedStrings(archive)
     sheet_paths = [n for n in archive.namelist() if n.startswith("xl/worksheets/") and n.endswith(".xml")]
     for sheet_path in sorted(sheet_paths)[:12]:
-        root = ElementTree.fromstring(archive.read(sheet_path))
-        for cell in root.findall(".//{*}c"):
-            t_attr = cell.attrib.get("t")
-            v = cell.find("{*}v")
-            if v is None or v.text is None:
-                continue
-            raw = v.text.strip()
-            if not raw:
-                continue
-            if t_attr == "s" and raw.isdigit():
-                idx = int(raw)
-                if 0 <= idx < len(strings):
-                    if strings[idx]:
-                        values.append(strings[idx])
-            else:
-                values.append(raw)
-    return " ".join(values)
+        for row in _iter_archive_records(archive, sheet_path, "row"):
+            for cell in row.iterfind("{*}c"):
+                t_attr = cell.attrib.get("t")
+                if t_attr == "inlineStr":
+                    yield "".join(t.text or "" for t in cell.iterfind(".//{*}t")).strip()
+                    continue
+                v = cell.find("{*}v")
+                if v is None or v.text is None:
+                    continue
+                raw = v.text.strip()
+                if t_attr == "s" and raw.isdigit():
+                    yield shared_strings.get(int(raw))
+                else:
+                    yield raw
 
 
-def _extract_ooxml_text(source_bytes: bytes, source_name: str) -> str:
+def _extract_ooxml_text(source_bytes: bytes, source_name: str, *, max_chars: int = 4000) -> str:
     try:
         with zipfile.ZipFile(BytesIO(source_bytes)) as archive:
-            if source_name.endswith(".docx") and "word/document.xml" in archive.namelist():
-                return _extract_docx_text(archive.read("word/document.xml"))
+            names = archive.namelist()
+            if source_name.endswith(".docx") and "word/document.xml" in names:
+                return _join_within_budget(_iter_archive_text(archive, ["word/document.xml"], "t"), max_chars)
             if source_name.endswith(".xlsx"):
-                return _extract_xlsx_text(archive)
+                return _join_within_budget(_iter_xlsx_values(archive), max_chars)
             if source_name.endswith(".pptx"):
-                slides = [n for n in archive.namelist() if n.startswith("ppt/slides/") and n.endswith(".xml")]
-                fragments = [_extract_pptx_text(archive.read(path)) for path in sorted(slides)[:30]]
-                return " ".join(f for f in fragments if f).strip()
+                slides = [n for n in names if n.startswith("ppt/slides/") and n.endswith(".xml")]
+                return _join_within_budget(_iter_archive_text(archive, sorted(slides)[:30], "t"), max_chars)
     except Exception:  # noqa: BLE001
         return ""
     return ""
@@ -382,9 +472,10 @@ def _convert_pdf_to_docx_with_pdf2docx(source_bytes: bytes) -> bytes | None:
 def _convert_pdf_to_pptx_with_images(source_bytes: bytes) -> bytes | None:
     """Convert PDF to PPTX by rendering each page as an image."""
     try:
+        from io import BytesIO
+
         from pdf2image import convert_from_bytes
         from pptx import Presentation
-        from io import BytesIO
 
         # Convert PDF pages to images
         images = convert_from_bytes(source_bytes, dpi=150)
@@ -501,10 +592,11 @@ def _convert_pdf_to_editable_pptx(source_bytes: bytes) -> bytes | None:
     try:
         import fitz
         from pptx import Presentation
-        from pptx.util import Pt, Inches
         from pptx.dml.color import RGBColor
-        from pptx.oxml.xmlchemy import OxmlElement
         from pptx.oxml.ns import qn
+        from pptx.oxml.xmlchemy import OxmlElement
+        from pptx.util import Inches
+        from pptx.util import Pt
 
         pdf_doc = fitz.open(stream=source_bytes, filetype="pdf")
         if len(pdf_doc) == 0:
@@ -694,10 +786,11 @@ def _convert_pdf_to_editable_pptx(source_bytes: bytes) -> bytes | None:
 def _convert_pdf_to_xlsx_with_tabula(source_bytes: bytes) -> bytes | None:
     """Convert PDF to XLSX by extracting tables."""
     try:
-        import tabula
-        import pandas as pd
         from io import BytesIO
 
+        import pandas as pd
+        import tabula
+
         with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as pdf_tmp:
             pdf_tmp.write(source_bytes)
             pdf_path = pdf_tmp.name
@@ -895,9 +988,9 @@ def _pdf_from_upload(version: DocumentVersion, *, allow_excel_text_fallback: boo
         if converted_pdf:
             return converted_pdf
 
-    ooxml_text = _extract_ooxml_text(source_bytes, source_name)
+    ooxml_text = _extract_ooxml_text(source_bytes, source_name, max_chars=1200)
     if ooxml_text:
-        return _minimal_pdf_bytes(ooxml_text[:1200])
+        return _minimal_pdf_bytes(ooxml_text)
 
     text_snippet = source_bytes[:4096].decode("utf-8", errors="ignore").strip()
     if not text_snippet:
@@ -1005,19 +1098,20 @@ def create_converted_version(
             )
         )
 
-    new_version = DocumentVersion.objects.create(
+    new_version = DocumentVersion(
         document=document,
         version_number=next_version_number,
         created_by=created_by or version.created_by,
         processing_state={"conversion": target_format},
+        parent=version,
         pdf_info=version.pdf_info,
         text_content=version.text_content,
-        layout_json=version.layout_json,
         security_state=version.security_state,
     )
-    new_version.file.save(f"{base_name}-converted.{extension}", ContentFile(output_bytes), save=False)
-    new_version.update_file_metadata()
+    new_version.attach_file(ContentFile(output_bytes), f"{base_name}-converted.{extension}")
     new_version.save()
+    new_version.copy_page_text(version)
+    queue_summary(new_version.id)
 
     document.current_version = new_version
     document.status = DocumentStatus.ACTIVE
@@ -1038,3 +1132,113 @@ def create_share_link(*, version: DocumentVersion, user, expires_in_hours: int |
         expires_at=expires_at,
         password_hash=make_password(password) if password else "",
     )
+
+
+def versions_from_archive(archive_file, *, workspace, created_by, max_items: int,
+                          max_entry_size: int) -> list[DocumentVersion]:
+    """Unpack an uploaded ZIP into one single-version document per convertible entry."""
+    versions: list[DocumentVersion] = []
+    with zipfile.ZipFile(archive_file) as archive:
+        entries = [
+            info
+            for info in archive.infolist()
+            if not info.is_dir()
+            and "__MACOSX" not in info.filename
+            and not Path(info.filename).name.startswith(".")
+            and Path(info.filename).suffix.lower() in SOURCE_KIND_BY_EXT
+        ]
+        if not entries:
+            raise ValueError("The archive does not contain any convertible files.")
+        if len(entries) > max_items:
+            raise ValueError(f"The archive contains more than {max_items} files.")
+        oversized = [info.filename for info in entries if info.file_size > max_entry_size]
+        if oversized:
+            raise ValueError(f"Archive entries exceed the maximum file size: {', '.join(oversized[:5])}")
+        for info in entries:
+            name = Path(info.filename).name
+            document = Document.objects.create(workspace=workspace, title=name, created_by=created_by)
+            version = DocumentVersion(
+                document=document,
+                version_number=1,
+                created_by=created_by,
+                processing_state={"upload": "completed"},
+            )
+            # Entries are streamed from the archive straight into storage.
+            with archive.open(info) as handle:
+                version.attach_file(File(handle, name=name))
+            version.save()
+            document.current_version = version
+            document.save(update_fields=["current_version"])
+            versions.append(version)
+    return versions
+
+
+def create_batch_conversion_job(*, workspace, requested_by, target_format: str,
+                                versions: list[DocumentVersion], max_parallel: int,
+                                params: dict | None = None) -> BatchConversionJob:
+    with transaction.atomic():
+        batch = BatchConversionJob.objects.create(
+            workspace=workspace,
+            requested_by=requested_by,
+            target_format=target_format,
+            max_parallel=max_parallel,
+            params=params or {},
+        )
+        ConversionJob.objects.bulk_create(
+            [
+                ConversionJob(
+                    workspace=workspace,
+                    document_id=version.document_id,
+                    version=version,
+                    requested_by=requested_by,
+                    target_format=target_format,
+                    source_mime_type=SOURCE_KIND_BY_EXT.get(Path(version.file.name).suffix.lower(), ""),
+                    params=params or {},
+                    batch=batch,
+                )
+                for version in versions
+            ]
+        )
+    return batch
+
+
+def build_batch_archive(batch: BatchConversionJob) -> dict[str, int]:
+    """Stream every converted output of ``batch`` into a ZIP stored on ``result_file``.
+
+    Outputs are copied chunk by chunk through a temporary file, so memory use does
+    not grow with the batch size. A ``manifest.json`` records the outcome of every
+    item, including failures.
+    """
+    items = batch.items.select_related("version", "result_version").order_by("id")
+    manifest: list[dict] = []
+    used_names: set[str] = set()
+    counts = {"completed": 0, "failed": 0}
+    with tempfile.TemporaryFile() as spool:
+        with zipfile.ZipFile(spool, mode="w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for item in items.iterator():
+                entry = {
+                    "item_id": item.id,
+                    "version_id": item.version_id,
+                    "source": Path(item.version.file.name).name if item.version.file else "",
+                    "status": item.status,
+                    "error": item.error,
+                    "output": None,
+                }
+                output = item.result_version
+                if item.status == AsyncJobStatus.COMPLETED and output and output.file:
+                    name = Path(output.file.name).name
+                    if name in used_names:
+                        name = f"{item.id}-{name}"
+                    used_names.add(name)
+                    with output.file.open("rb") as src, archive.open(name, mode="w", force_zip64=True) as dst:
+                        shutil.copyfileobj(src, dst, ARCHIVE_COPY_CHUNK_SIZE)
+                    entry["output"] = name
+                    counts["completed"] += 1
+                else:
+                    entry["status"] = AsyncJobStatus.FAILED
+                    counts["failed"] += 1
+                manifest.append(entry)
+            archive.writestr("manifest.json", json.dumps({"batch_id": batch.id, "items": manifest}, indent=2))
+        spool.seek(0)
+        batch.result_file.save(f"batch-{batch.id}-{batch.target_format}.zip", File(spool), save=False)
+    return counts
@@ -1,19 +1,26 @@
 from __future__ import annotations
 
 import logging
+from datetime import timedelta
 
+from asgiref.sync import async_to_sync
 from celery import shared_task
 from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 
 from pdf_web.documents.tasks import render_page_images
+from pdf_web.operations.models import AsyncJobStatus
+from pdf_web.operations.models import BatchConversionJob
+from pdf_web.operations.models import BatchConversionStatus
 from pdf_web.operations.models import ConversionJob
 from pdf_web.operations.models import CropJob
 from pdf_web.operations.models import OperationJob
 from pdf_web.operations.models import OperationStatus
 from pdf_web.operations.models import PageNumberJob
 from pdf_web.operations.models import WatermarkJob
+from pdf_web.operations.services import build_batch_archive
 from pdf_web.operations.services import clone_version
 from pdf_web.operations.services import create_converted_version
 
@@ -47,7 +54,7 @@ def apply_operation(self, job_id: int) -> int:
         job.log = f"Operation {job.type} completed."
         job.save(update_fields=["output_version", "status", "log"])
         return job_id
-    except Exception as exc:  # noqa: BLE001
+    except Exception as exc:
         job.status = OperationStatus.FAILED
         job.error = str(exc)
         job.save(update_fields=["status", "error"])
@@ -58,9 +65,13 @@ def apply_operation(self, job_id: int) -> int:
 @shared_task(bind=True)
 def process_conversion_job(self, job_id: int) -> int:
     job = ConversionJob.objects.select_related("workspace", "version").get(pk=job_id)
+    if job.batch_id and job.status == AsyncJobStatus.FAILED:
+        # A redelivery of an item already swept as stalled; its batch has moved on without it.
+        return job.id
     job.status = "running"
     job.progress = 10
-    job.save(update_fields=["status", "progress"])
+    job.started_at = timezone.now()
+    job.save(update_fields=["status", "progress", "started_at"])
     _notify_workspace(job.workspace_id, {"job_id": job.id, "status": job.status, "progress": job.progress, "result_url": None})
     try:
         output = create_converted_version(
@@ -69,26 +80,139 @@ def process_conversion_job(self, job_id: int) -> int:
             created_by=job.requested_by,
             conversion_params=job.params,
         )
-        if output.file and output.file.name.lower().endswith(".pdf"):
+        if output.file and output.file.name.lower().endswith(".pdf") and not job.batch_id:
             # Generate page assets immediately so document review screens can render
             # the converted file right away instead of waiting on a separate queue.
+            # Batch items are delivered as a ZIP and never reviewed page by page.
             render_page_images(output.id)
         job.result_version = output
         job.status = "completed"
         job.progress = 100
         job.finished_at = timezone.now()
-        job.save(update_fields=["result_version", "status", "progress", "finished_at"])
+        if not _save_if_running(job, ["result_version", "status", "progress", "finished_at"]):
+            return job.id
         result_url = output.file.url if output.file else None
         _notify_workspace(job.workspace_id, {"job_id": job.id, "status": job.status, "progress": job.progress, "result_url": result_url})
         return job.id
-    except Exception as exc:  # noqa: BLE001
+    except Exception as exc:
         job.status = "failed"
         job.error = str(exc)
         job.finished_at = timezone.now()
-        job.save(update_fields=["status", "error", "finished_at"])
-        _notify_workspace(job.workspace_id, {"job_id": job.id, "status": job.status, "progress": job.progress, "result_url": None})
         logger.exception("Failed conversion job %s", job_id)
+        if not _save_if_running(job, ["status", "error", "finished_at"]):
+            return job.id
+        _notify_workspace(job.workspace_id, {"job_id": job.id, "status": job.status, "progress": job.progress, "result_url": None})
         return job.id
+    finally:
+        if job.batch_id:
+            dispatch_batch_items(job.batch_id)
+
+
+def _save_if_running(job: ConversionJob, fields: list[str]) -> bool:
+    """Save the outcome of ``job`` unless it was swept as stalled meanwhile, which a late result must not undo."""
+    if ConversionJob.objects.filter(pk=job.pk, status=AsyncJobStatus.RUNNING).update(**{field: getattr(job, field) for field in fields}):
+        return True
+    logger.warning("Conversion job %s finished after it was failed as stalled; its result is discarded", job.pk)
+    return False
+
+
+def dispatch_batch_items(batch_id: int) -> None:
+    """Keep up to ``max_parallel`` items of a batch in flight, then archive it.
+
+    Called when a batch starts and whenever one of its items finishes. The batch
+    row lock serialises concurrent callers so the window is never overfilled and
+    the archive step is queued exactly once.
+    """
+    with transaction.atomic():
+        batch = BatchConversionJob.objects.select_for_update().get(pk=batch_id)
+        if batch.status not in {BatchConversionStatus.PENDING, BatchConversionStatus.RUNNING}:
+            return
+        items = batch.items.all()
+        total = items.count()
+        running = items.filter(status=AsyncJobStatus.RUNNING).count()
+        pending_ids = list(
+            items.filter(status=AsyncJobStatus.PENDING)
+            .order_by("id")
+            .values_list("id", flat=True)[: max(batch.max_parallel - running, 0)]
+        )
+        finished = total - running - items.filter(status=AsyncJobStatus.PENDING).count()
+        if pending_ids:
+            # Claimed items count as in flight until their task picks them up.
+            ConversionJob.objects.filter(id__in=pending_ids).update(status=AsyncJobStatus.RUNNING)
+            batch.status = BatchConversionStatus.RUNNING
+        elif not running:
+            batch.status = BatchConversionStatus.ARCHIVING
+        batch.progress = min(int(finished * 100 / total), 99) if total else 99
+        batch.save(update_fields=["status", "progress"])
+        for item_id in pending_ids:
+            transaction.on_commit(lambda item_id=item_id: process_conversion_job.delay(item_id))
+        if batch.status == BatchConversionStatus.ARCHIVING:
+            transaction.on_commit(lambda: finalize_batch_conversion.delay(batch_id))
+    _notify_workspace(batch.workspace_id, {"batch_id": batch.id, "status": batch.status, "progress": batch.progress, "result_url": None})
+
+
+@shared_task(bind=True)
+def fail_stalled_batch_items(self) -> int:
+    """Fail batch items whose task died without reporting back, and let their batches move on.
+
+    A worker killed at the hard time limit, or lost altogether, never reaches the
+    ``finally`` in ``process_conversion_job``, so its item would stay running and
+    the batch would never be archived. Only items whose task recorded its start
+    are considered, and they count as stalled once that start is further back
+    than the conversion queue's hard time limit; items still waiting in the queue
+    are left alone however long the queue is.
+    """
+    time_limit = settings.TASK_QUEUE_PROFILES[settings.CELERY_TASK_ROUTES[process_conversion_job.name]["queue"]]["time_limit"]
+    stalled = dict(
+        ConversionJob.objects.filter(
+            batch__isnull=False,
+            status=AsyncJobStatus.RUNNING,
+            started_at__lt=timezone.now() - timedelta(seconds=time_limit),
+        ).values_list("id", "batch_id")
+    )
+    if not stalled:
+        return 0
+    # Re-checked in the update, as an item may have finished since it was read.
+    failed = ConversionJob.objects.filter(id__in=stalled, status=AsyncJobStatus.RUNNING).update(
+        status=AsyncJobStatus.FAILED,
+        error="Conversion did not finish within its time limit.",
+        finished_at=timezone.now(),
+    )
+    logger.warning("Failed %s stalled batch conversion items", failed)
+    for batch_id in set(stalled.values()):
+        dispatch_batch_items(batch_id)
+    return failed
+
+
+@shared_task(bind=True)
+def process_batch_conversion_job(self, batch_id: int) -> int:
+    dispatch_batch_items(batch_id)
+    return batch_id
+
+
+@shared_task(bind=True)
+def finalize_batch_conversion(self, batch_id: int) -> int:
+    batch = BatchConversionJob.objects.get(pk=batch_id)
+    try:
+        counts = build_batch_archive(batch)
+        if not counts["completed"]:
+            batch.status = BatchConversionStatus.FAILED
+            batch.error = "All items failed to convert."
+        elif counts["failed"]:
+            batch.status = BatchConversionStatus.PARTIAL
+            batch.error = f"{counts['failed']} of {counts['completed'] + counts['failed']} items failed to convert."
+        else:
+            batch.status = BatchConversionStatus.COMPLETED
+    except Exception as exc:
+        batch.status = BatchConversionStatus.FAILED
+        batch.error = str(exc)
+        logger.exception("Failed archiving batch conversion %s", batch_id)
+    batch.progress = 100
+    batch.finished_at = timezone.now()
+    batch.save(update_fields=["result_file", "status", "error", "progress", "finished_at"])
+    result_url = batch.result_file.url if batch.result_file else None
+    _notify_workspace(batch.workspace_id, {"batch_id": batch.id, "status": batch.status, "progress": batch.progress, "result_url": result_url})
+    return batch.id
 
 
 @shared_task(bind=True)
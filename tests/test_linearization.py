@@ -0,0 +1,143 @@
+"""Benchmark: time to first page for plain and linearized PDFs over a throttled connection.
+
+A progressive viewer fetches the head of the file first. A linearized file names
+the end of its first page in the parameter dictionary there, so the viewer only
+needs the bytes up to it; any other file has to be fetched whole, as its
+cross-reference table sits at the end. Time to first page is the time to fetch
+what the viewer needs plus the time to render page one.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from pdf_web.documents.linearization import linearize
+
+THROTTLE_BYTES_PER_SECOND = 4 * 1024 * 1024
+LATENCY_SECONDS = 0.02
+WRITE_CHUNK = 16 * 1024
+# What PDF.js requests first before deciding how to load the rest.
+PROBE_BYTES = 64 * 1024
+_FIRST_PAGE_END_RE = re.compile(rb"/Linearized\b.*?/E\s+(\d+)", re.DOTALL)
+
+
+class ThrottledRangeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        payload = self.server.files[self.path]
+        first, last = 0, len(payload) - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            first = int(match[1])
+            last = min(int(match[2]), last) if match[2] else last
+        body = payload[first:last + 1]
+        time.sleep(LATENCY_SECONDS)
+        self.send_response(206 if match else 200)
+        self.send_header("Content-Length", str(len(body)))
+        if match:
+            self.send_header("Content-Range", f"bytes {first}-{last}/{len(payload)}")
+        self.end_headers()
+        for offset in range(0, len(body), WRITE_CHUNK):
+            chunk = body[offset:offset + WRITE_CHUNK]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / THROTTLE_BYTES_PER_SECOND)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def throttled_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottledRangeHandler)
+    server.files = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _image_heavy_pdf(pages: int) -> bytes:
+    import fitz
+
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((72, 72), f"Scanned page {number + 1}")
+        # Noise does not compress, like the scans that make archives large.
+        image = BytesIO()
+        Image.frombytes("RGB", (160, 160), os.urandom(160 * 160 * 3)).save(image, format="PNG")
+        page.insert_image(fitz.Rect(72, 100, 523, 551), stream=image.getvalue())
+    return doc.tobytes()
+
+
+def _fetch(url: str, first: int, last: int | None = None) -> bytes:
+    request = urllib.request.Request(url, headers={"Range": f"bytes={first}-{'' if last is None else last}"})
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+
+def _time_to_first_page(url: str, payload: bytes) -> tuple[float, int]:
+    import fitz
+
+    started = time.perf_counter()
+    fetched = _fetch(url, 0, PROBE_BYTES - 1)
+    match = _FIRST_PAGE_END_RE.search(fetched)
+    if match is None:
+        fetched += _fetch(url, len(fetched))
+    elif int(match[1]) > len(fetched):
+        fetched += _fetch(url, len(fetched), int(match[1]) - 1)
+    # PyMuPDF cannot open a partial file, so page one renders from the full copy once its bytes have arrived.
+    with fitz.open(stream=payload) as doc:
+        doc.load_page(0).get_pixmap(dpi=72)
+    return time.perf_counter() - started, len(fetched)
+
+
+def test_linearized_files_reach_the_first_page_sooner(throttled_server, tmp_path, record_property):
+    source = tmp_path / "plain.pdf"
+    source.write_bytes(_image_heavy_pdf(40))
+    output = tmp_path / "linearized.pdf"
+    assert linearize(str(source), output)
+    # Already linearized files are left alone.
+    assert not linearize(str(output), tmp_path / "again.pdf")
+
+    results = {}
+    for path in (source, output):
+        payload = Path(path).read_bytes()
+        throttled_server.files[f"/{path.name}"] = payload
+        url = f"http://127.0.0.1:{throttled_server.server_port}/{path.name}"
+        results[path.name] = (*_time_to_first_page(url, payload), len(payload))
+
+    for name, (seconds, fetched, size) in results.items():
+        record_property(f"{name} first page ms", round(seconds * 1000))
+        record_property(f"{name} bytes fetched", f"{fetched} of {size}")
+    plain_seconds, _, size = results["plain.pdf"]
+    linearized_seconds, linearized_fetched, _ = results["linearized.pdf"]
+    assert linearized_fetched < size / 4
+    assert linearized_seconds < plain_seconds / 2
+
+
+def test_encrypted_files_are_not_rewritten(tmp_path):
+    import pikepdf
+
+    source = tmp_path / "encrypted.pdf"
+    with pikepdf.open(BytesIO(_image_heavy_pdf(2))) as pdf:
+        # Opens without a password, but only the owner may print or modify it.
+        pdf.save(source, encryption=pikepdf.Encryption(owner="owner-secret", user="", R=6, allow=pikepdf.Permissions(print_highres=False, modify_other=False)))
+    output = tmp_path / "linearized.pdf"
+
+    assert not linearize(str(source), output)
+    assert not output.exists()
+    with pikepdf.open(source) as pdf:
+        assert pdf.is_encrypted
+        assert not pdf.allow.modify_other
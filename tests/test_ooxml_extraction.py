@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import tracemalloc
+import zipfile
+from io import BytesIO
+
+from pdf_web.operations import services
+
+SHEET_COLS = 10
+MILLION_CELL_ROWS = 100_000
+
+
+def _column(index: int) -> str:
+    return chr(ord("A") + index)
+
+
+def _large_workbook(*, rows: int, cell: str, shared_strings: int = 0) -> bytes:
+    """Build a ``rows`` x SHEET_COLS workbook whose last row holds an inline "grand total" cell."""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        if shared_strings:
+            with archive.open("xl/sharedStrings.xml", mode="w") as part:
+                part.write(b'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">')
+                for idx in range(shared_strings):
+                    part.write(f"<si><t>label-{idx}</t></si>".encode())
+                part.write(b"</sst>")
+        with archive.open("xl/worksheets/sheet1.xml", mode="w") as part:
+            part.write(b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            for row in range(1, rows + 1):
+                cells = "".join(cell.format(ref=f"{_column(col)}{row}", idx=row * SHEET_COLS + col) for col in range(SHEET_COLS))
+                part.write(f'<row r="{row}">{cells}</row>'.encode())
+            part.write(f'<row r="{rows + 1}"><c r="A{rows + 1}" t="inlineStr"><is><t>grand total</t></is></c></row>'.encode())
+            part.write(b"</sheetData></worksheet>")
+    return buffer.getvalue()
+
+
+def _extract(source: bytes, *, trace_memory: bool = False, **kwargs) -> tuple[str, int]:
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        text = services._extract_ooxml_text(source, "large.xlsx", **kwargs)
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+    finally:
+        tracemalloc.stop()
+    return text, peak
+
+
+def _count_reads(monkeypatch) -> list[int]:
+    """Record the size of every read from a compressed archive member."""
+    sizes: list[int] = []
+    real_read = zipfile.ZipExtFile.read
+    monkeypatch.setattr(zipfile.ZipExtFile, "read", lambda self, n=-1: sizes.append(len(data := real_read(self, n))) or data)
+    return sizes
+
+
+def test_xlsx_extraction_memory_does_not_grow_with_sheet_size():
+    # tracemalloc slows parsing roughly tenfold, so the bound is checked on a 100k-cell (~2 MB) sheet;
+    # building its full tree would take well over 10 MB.
+    source = _large_workbook(rows=MILLION_CELL_ROWS // 10, cell='<c r="{ref}" s="1"/>')
+
+    text, peak = _extract(source, trace_memory=True)
+
+    assert text == "grand total"
+    assert peak < 1_500_000
+
+
+def test_xlsx_extraction_benchmark_million_cell_sheet():
+    source = _large_workbook(rows=MILLION_CELL_ROWS, cell='<c r="{ref}" s="1"/>')
+
+    text, _ = _extract(source)
+
+    assert text == "grand total"
+
+
+def test_xlsx_extraction_stops_at_char_budget_and_reads_shared_strings_lazily(monkeypatch):
+    cells = MILLION_CELL_ROWS * SHEET_COLS
+    source = _large_workbook(rows=MILLION_CELL_ROWS, cell='<c r="{ref}" t="s"><v>{idx}</v></c>', shared_strings=cells + SHEET_COLS)
+    reads = _count_reads(monkeypatch)
+
+    text, peak = _extract(source, trace_memory=True, max_chars=500)
+
+    assert len(text) == 500
+    assert text.startswith("label-10 label-11")
+    assert peak < 2_000_000
+    # The sheet and shared strings run to tens of megabytes; filling the budget takes a few of their first blocks.
+    assert sum(reads) < 500_000
+
+
+WORD_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+DRAWING_NAMESPACE = "http://schemas.openxmlformats.org/drawingml/2006/main"
+
+
+def _docx(body: str) -> bytes:
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("word/document.xml", f'<w:document xmlns:w="{WORD_NAMESPACE}"><w:body>{body}</w:body></w:document>')
+    return buffer.getvalue()
+
+
+def test_docx_and_pptx_runs_stop_at_the_char_budget():
+    body = "".join(f'<w:p><w:r><w:t xml:space="preserve">word{idx}</w:t></w:r><w:tab/></w:p>' for idx in range(50))
+
+    text = services._extract_ooxml_text(_docx(body), "report.docx", max_chars=40)
+
+    assert text == " ".join(f"word{idx}" for idx in range(7))[:40]
+
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, mode="w") as archive:
+        for number in (2, 1):
+            archive.writestr(
+                f"ppt/slides/slide{number}.xml",
+                f'<p:sld xmlns:p="urn:p" xmlns:a="{DRAWING_NAMESPACE}"><a:p><a:r><a:t>Slide {number}</a:t></a:r></a:p></p:sld>',
+            )
+    assert services._extract_ooxml_text(buffer.getvalue(), "deck.pptx") == "Slide 1 Slide 2"
+
+
+def test_docx_empty_and_self_closing_runs_add_no_markup():
+    body = '<w:p><w:r><w:t xml:space="preserve"/></w:r><w:r><w:rPr><w:b/></w:rPr><w:t>Hello</w:t></w:r><w:r><w:t></w:t></w:r></w:p>'
+
+    assert services._extract_ooxml_text(_docx(body), "runs.docx") == "Hello"
+
+
+def test_docx_tables_without_text_keep_memory_flat():
+    # <w:tc> and <w:tbl> share the <w:t prefix but hold no text of their own.
+    rows = "<w:tr>" + '<w:tc><w:tcPr><w:tcW w:w="1000"/></w:tcPr></w:tc>' * 20 + "</w:tr>"
+    body = "<w:tbl>" + rows * 2500 + "</w:tbl><w:p><w:r><w:t>last</w:t></w:r></w:p>"
+    source = _docx(body)
+
+    tracemalloc.start()
+    try:
+        text = services._extract_ooxml_text(source, "tables.docx")
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert text == "last"
+    # The part is over 2 MB; elements are discarded as soon as they end.
+    assert len(body) > 2_000_000
+    assert peak < 500_000
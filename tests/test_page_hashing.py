@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from io import BytesIO
+
+import fitz
+import pikepdf
+
+from pdf_web.documents.rendering import PageHasher
+
+
+def _font(name: str) -> pikepdf.Dictionary:
+    return pikepdf.Dictionary(Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1, BaseFont=pikepdf.Name(f"/{name}"))
+
+
+def _inheriting_pages(*fonts: str) -> fitz.Document:
+    """One page per font, identical apart from the /Resources each inherits from its own page tree node."""
+    pdf = pikepdf.new()
+    contents = pdf.make_stream(b"BT /F1 24 Tf 72 720 Td (Same text) Tj ET")
+    root = pdf.make_indirect(pikepdf.Dictionary(Type=pikepdf.Name.Pages, Kids=pikepdf.Array(), Count=len(fonts)))
+    for font in fonts:
+        node = pdf.make_indirect(
+            pikepdf.Dictionary(
+                Type=pikepdf.Name.Pages,
+                Parent=root,
+                Kids=pikepdf.Array(),
+                Count=1,
+                Resources=pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=_font(font))),
+                MediaBox=pikepdf.Array([0, 0, 612, 792]),
+            )
+        )
+        node.Kids.append(pdf.make_indirect(pikepdf.Dictionary(Type=pikepdf.Name.Page, Parent=node, Contents=contents)))
+        root.Kids.append(node)
+    pdf.Root.Pages = root
+    buffer = BytesIO()
+    pdf.save(buffer)
+    return fitz.open(stream=buffer.getvalue(), filetype="pdf")
+
+
+def test_pages_differing_only_in_inherited_resources_hash_differently():
+    doc = _inheriting_pages("Helvetica", "Courier", "Helvetica")
+    hasher = PageHasher(doc)
+    first, second, third = (hasher.page_hash(page) for page in doc)
+    assert first and second
+    assert first != second
+    assert first == third
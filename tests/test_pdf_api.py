@@ -1,8 +1,12 @@
-from io import BytesIO
 import zipfile
+from datetime import timedelta
+from io import BytesIO
+
 import pytest
-from PIL import Image
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+from PIL import Image
 from rest_framework.test import APIClient
 
 from pdf_web.annotations.models import Annotation
@@ -100,9 +104,10 @@ def create_document(workspace, user):
         file=make_pdf_file(),
         created_by=user,
         text_content="Hello World",
-        layout_json={"1": [{"bbox": [0, 0, 10, 10], "text": "Hello", "block_type": 0}]},
         pdf_info={"page_count": 1},
     )
+    version.set_page_layouts({1: [{"bbox": [0, 0, 10, 10], "text": "Hello", "block_type": 0}]})
+    version.set_page_texts({1: ("Hello World", [(0, 0, 10, 10, "Hello"), (12, 0, 30, 10, "World")])})
     document.current_version = version
     document.save(update_fields=["current_version"])
     return document, version
@@ -121,6 +126,1092 @@ def test_upload_creates_document_and_version(api_client, user, workspace):
     assert DocumentVersion.objects.count() == 1
 
 
+@pytest.mark.django_db
+def test_identical_uploads_share_one_stored_file(api_client, user, workspace, monkeypatch):
+    import hashlib
+
+    from django.core.files.storage import FileSystemStorage
+
+    from pdf_web.documents.models import StoredFile
+    from pdf_web.documents.tasks import delete_unreferenced_files
+    from pdf_web.operations.services import clone_version
+
+    storage_open = FileSystemStorage._open
+    reads = []
+    monkeypatch.setattr(FileSystemStorage, "_open", lambda self, name, mode="rb": reads.append(name) or storage_open(self, name, mode))
+    api_client.force_authenticate(user=user)
+    with monkeypatch.context() as patched:
+        # Ingestion opens the stored file; only the upload itself is checked for read-backs.
+        patched.setattr("pdf_web.documents.api.views.ingest_version.delay", lambda version_id: None)
+        for title in ("First", "Second"):
+            response = api_client.post(
+                "/api/documents/",
+                {"workspace": workspace.id, "title": title, "file": make_pdf_file(f"{title}.pdf")},
+                format="multipart",
+            )
+            assert response.status_code == 201
+    assert reads == []
+
+    first, second = DocumentVersion.objects.order_by("id")
+    stored = StoredFile.objects.get()
+    assert first.file.name == second.file.name == stored.file.name
+    assert first.file_hash == second.file_hash == stored.content_hash == hashlib.sha256(make_pdf_file().read()).hexdigest()
+    assert first.size_bytes == stored.size_bytes > 0
+
+    clone = clone_version(first)
+    assert clone.stored_file_id == stored.id
+    assert clone.file.name == stored.file.name
+    assert stored.versions.count() == 3
+
+    Document.objects.all().delete()
+    StoredFile.objects.update(linked_at=timezone.now() - timedelta(days=1))
+    assert delete_unreferenced_files.apply().get() == 1
+    assert not StoredFile.objects.exists()
+    assert not stored.file.storage.exists(stored.file.name)
+
+
+@pytest.mark.django_db
+def test_upload_ingests_every_stage_from_a_single_open(api_client, user, workspace, monkeypatch, django_capture_on_commit_callbacks):
+    import fitz
+
+    from pdf_web.documents import tasks
+    from pdf_web.documents.models import DocumentBookmark
+    from pdf_web.documents.models import DocumentPageAsset
+
+    source = fitz.open()
+    for number in (1, 2):
+        source.new_page(width=300, height=144).insert_text((72, 72), f"Chapter {number}")
+    source.set_toc([[1, "Chapter 1", 1], [1, "Chapter 2", 2]])
+    upload = SimpleUploadedFile("chapters.pdf", source.tobytes(), content_type="application/pdf")
+
+    opened = []
+    real_open = tasks._open_pdf
+    monkeypatch.setattr(tasks, "_open_pdf", lambda version: opened.append(version.id) or real_open(version))
+
+    api_client.force_authenticate(user=user)
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post("/api/documents/", {"workspace": workspace.id, "title": "Chapters", "file": upload}, format="multipart")
+    assert response.status_code == 201
+
+    version = DocumentVersion.objects.get()
+    assert opened == [version.id]
+    assert version.pdf_info["page_count"] == 2
+    assert "Chapter 2" in version.text_content
+    assert set(version.layout()) == {"1", "2"}
+    assert version.page_texts.filter(search_vector__isnull=False).count() == 2
+    assert DocumentPageAsset.objects.filter(version=version).count() == 4
+    assert list(DocumentBookmark.objects.filter(version=version).values_list("title", flat=True)) == ["Chapter 1", "Chapter 2"]
+    assert version.processing_state == {
+        "upload": "completed",
+        "metadata": "completed",
+        "render": "completed",
+        "text": "completed",
+        "bookmarks": "completed",
+        "search": "completed",
+        "linearize": "completed",
+        "summary": "completed",
+    }
+
+
+@pytest.mark.django_db
+def test_ingestion_records_unfinished_stages_when_out_of_time(user, workspace, monkeypatch):
+    from celery.exceptions import SoftTimeLimitExceeded
+
+    from pdf_web.documents import tasks
+
+    _, version = create_document(workspace, user)
+    version.file.save("slow.pdf", ContentFile(_multi_page_pdf(3)))
+    calls = []
+
+    def slow_read(page):
+        calls.append(page.number)
+        raise SoftTimeLimitExceeded
+
+    monkeypatch.setattr(tasks, "_read_page_text", slow_read)
+    tasks.ingest_version.apply(args=[version.id]).get()
+
+    version.refresh_from_db()
+    assert calls == [0]
+    assert version.processing_state["metadata"] == "completed"
+    unfinished = ("render", "text", "bookmarks", "search", "linearize")
+    assert {stage: version.processing_state[stage] for stage in unfinished} == dict.fromkeys(unfinished, "failed: time limit exceeded")
+
+
+@pytest.mark.django_db
+def test_ingestion_linearizes_stored_pdfs_once(api_client, user, workspace, settings):
+    import hashlib
+
+    import pikepdf
+
+    from pdf_web.documents.models import StoredFile
+
+    settings.PDF_LINEARIZE_MIN_BYTES = 0
+    payload = _multi_page_pdf(5)
+    api_client.force_authenticate(user=user)
+    versions = []
+    for title in ("First", "Second"):
+        response = api_client.post(
+            "/api/documents/",
+            {"workspace": workspace.id, "title": title, "file": SimpleUploadedFile(f"{title}.pdf", payload, content_type="application/pdf")},
+            format="multipart",
+        )
+        versions.append(Document.objects.get(pk=response.data["id"]).current_version)
+
+    first, second = versions
+    assert first.pdf_info["linearized"] is True
+    assert first.processing_state["linearize"] == "completed"
+    with first.file.open("rb") as handle:
+        linearized = handle.read()
+    assert first.file_hash == hashlib.sha256(linearized).hexdigest() != hashlib.sha256(payload).hexdigest()
+    with pikepdf.open(first.file.path) as pdf:
+        assert pdf.is_linearized
+        assert len(pdf.pages) == 5
+    # The same upload linearizes to the same bytes, so both versions still share one stored copy.
+    assert second.stored_file_id == first.stored_file_id
+    assert StoredFile.objects.filter(versions__isnull=False).distinct().count() == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("pool_min_pages", [1000, 4])
+def test_render_page_images_writes_assets_in_bulk(user, workspace, settings, pool_min_pages, django_assert_max_num_queries):
+    import fitz
+
+    from pdf_web.documents.models import DocumentPageAsset
+    from pdf_web.documents.tasks import render_page_images
+
+    settings.PAGE_RENDER_POOL_MIN_PAGES = pool_min_pages
+    settings.PAGE_RENDER_PROCESSES = 2
+    settings.PAGE_RENDER_CHUNK_SIZE = 4
+    settings.PAGE_ASSET_BATCH_SIZE = 5
+    source = fitz.open()
+    for number in range(12):
+        source.new_page(width=612, height=792).insert_text((72, 72), f"Page {number + 1}")
+    document, version = create_document(workspace, user)
+    version.file.save("long.pdf", ContentFile(source.tobytes()))
+    DocumentPageAsset.objects.create(version=version, page_number=1, dpi=72)
+
+    # Asset rows are written per batch of pages, not per page and DPI.
+    with django_assert_max_num_queries(12):
+        render_page_images.apply(args=[version.id])
+
+    assets = DocumentPageAsset.objects.filter(version=version)
+    assert assets.count() == 24
+    assert {asset.dpi for asset in assets} == {72, 150}
+    assert assets.get(page_number=12, dpi=150).width == 1275
+    thumb = assets.get(page_number=1, dpi=72).thumb_image
+    with Image.open(thumb) as image:
+        assert max(image.size) <= 256
+    assert not assets.filter(dpi=150).exclude(thumb_image="").exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_render_page_images_falls_back_in_process_inside_prefork_workers(user, workspace, settings, monkeypatch):
+    import billiard
+    import fitz
+    from django.db import connection
+
+    from pdf_web.documents import tasks
+    from pdf_web.documents.models import DocumentPageAsset
+
+    settings.PAGE_RENDER_POOL_MIN_PAGES = 4
+    settings.PAGE_RENDER_PROCESSES = 2
+    settings.PAGE_RENDER_CHUNK_SIZE = 4
+    source = fitz.open()
+    for number in range(8):
+        source.new_page(width=612, height=792).insert_text((72, 72), f"Page {number + 1}")
+    document, version = create_document(workspace, user)
+    version.file.save("long.pdf", ContentFile(source.tobytes()))
+
+    context = billiard.get_context("fork")
+    refusals = context.Queue()
+    real_render_in_pool = tasks.render_in_pool
+
+    def render_in_pool(*args, **kwargs):
+        try:
+            return real_render_in_pool(*args, **kwargs)
+        except AssertionError as exc:
+            refusals.put(str(exc))
+            raise
+
+    monkeypatch.setattr(tasks, "render_in_pool", render_in_pool)
+
+    def work():
+        tasks.render_page_images.apply(args=[version.id])
+        connection.close()
+
+    # Celery's prefork pool runs tasks in daemonic billiard processes like this one.
+    connection.close()
+    worker = context.Process(target=work, daemon=True)
+    worker.start()
+    worker.join(60)
+
+    assert worker.exitcode == 0
+    assert refusals.get(timeout=5) == "daemonic processes are not allowed to have children"
+    assert DocumentPageAsset.objects.filter(version=version).count() == 16
+
+
+def _multi_page_pdf(pages: int) -> bytes:
+    import fitz
+
+    source = fitz.open()
+    for number in range(pages):
+        source.new_page(width=300, height=144).insert_text((72, 72), f"Page {number + 1}")
+    return source.tobytes()
+
+
+@pytest.mark.django_db
+def test_resumable_upload_appends_chunks_and_finalizes_into_a_document(api_client, user, workspace, settings, tmp_path, django_capture_on_commit_callbacks):
+    import hashlib
+
+    from pdf_web.documents.models import UploadSession
+    from pdf_web.documents.uploads import ChunkError
+    from pdf_web.documents.uploads import append_chunk
+
+    class DroppedStream:
+        def __init__(self, data):
+            self.data = data
+
+        def read(self, size):
+            if not self.data:
+                raise OSError("connection reset")
+            data, self.data = self.data[:size], self.data[size:]
+            return data
+
+    settings.UPLOAD_SESSION_DIR = str(tmp_path / "uploads")
+    settings.UPLOAD_CHUNK_MAX_BYTES = 1024
+    payload = _multi_page_pdf(3)
+    chunks = [payload[offset:offset + 1024] for offset in range(0, len(payload), 1024)]
+    api_client.force_authenticate(user=user)
+    # Direct uploads need S3 storage.
+    assert api_client.post(
+        "/api/uploads/",
+        {"workspace": workspace.id, "filename": "scan.pdf", "size_bytes": len(payload), "direct": True},
+        format="json",
+    ).status_code == 400
+
+    response = api_client.post(
+        "/api/uploads/",
+        {"workspace": workspace.id, "filename": "scan.pdf", "size_bytes": len(payload)},
+        format="json",
+    )
+    assert response.status_code == 201
+    assert response.data["upload_urls"] is None
+    url = f"/api/uploads/{response.data['id']}/"
+
+    def append(offset, chunk, **headers):
+        return api_client.generic("PATCH", url, chunk, content_type="application/offset+octet-stream", HTTP_UPLOAD_OFFSET=str(offset), **headers)
+
+    assert append(0, b"not a pdf").status_code == 400
+    response = append(0, chunks[0], HTTP_UPLOAD_CHECKSUM=hashlib.sha256(chunks[0]).hexdigest())
+    assert response.status_code == 200
+    assert response.data["received_bytes"] == 1024
+    # A wrong offset, a corrupted chunk and a dropped connection all leave the received bytes alone.
+    assert append(0, chunks[0]).data["received_bytes"] == 1024
+    assert append(1024, chunks[1], HTTP_UPLOAD_CHECKSUM="0" * 64).status_code == 400
+    session = UploadSession.objects.get(pk=response.data["id"])
+    with pytest.raises(ChunkError):
+        append_chunk(session, DroppedStream(chunks[1][:100]), length=len(chunks[1]))
+    assert session.part_path.stat().st_size == 1024
+    assert api_client.post(f"{url}finalize/").status_code == 409
+
+    offset = api_client.get(url).data["received_bytes"]
+    for chunk in chunks[1:]:
+        offset = append(offset, chunk).data["received_bytes"]
+    assert offset == len(payload)
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post(f"{url}finalize/")
+    assert response.status_code == 202
+
+    document = Document.objects.get(pk=response.data["document"])
+    assert document.title == "scan.pdf"
+    version = document.current_version
+    assert version.file_hash == hashlib.sha256(payload).hexdigest()
+    with version.file.open("rb") as handle:
+        assert handle.read() == payload
+    assert version.pdf_info["page_count"] == 3
+    assert api_client.get(url).data["status"] == "completed"
+    assert not list((tmp_path / "uploads").iterdir())
+
+
+@pytest.fixture
+def s3_bucket(settings):
+    """A moto stand-in for an S3 bucket as the default storage."""
+    moto = pytest.importorskip("moto")
+    with moto.mock_aws():
+        import boto3
+
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="pdf-web-test")
+        settings.AWS_ACCESS_KEY_ID = "testing"
+        settings.AWS_SECRET_ACCESS_KEY = "testing"
+        settings.AWS_STORAGE_BUCKET_NAME = "pdf-web-test"
+        settings.AWS_S3_REGION_NAME = "us-east-1"
+        settings.AWS_S3_SIGNATURE_VERSION = "s3v4"
+        settings.AWS_S3_FILE_OVERWRITE = False
+        settings.AWS_DEFAULT_ACL = None
+        settings.STORAGES = {**settings.STORAGES, "default": {"BACKEND": "storages.backends.s3boto3.S3Boto3Storage"}}
+        yield boto3.client("s3", region_name="us-east-1")
+
+
+@pytest.mark.django_db
+def test_direct_uploads_go_straight_to_the_bucket(api_client, user, workspace, settings, s3_bucket, django_capture_on_commit_callbacks):
+    import hashlib
+    import os
+
+    import fitz
+    import requests
+    from django.core.files.storage import default_storage
+
+    from pdf_web.documents.models import StoredFile
+    from pdf_web.documents.models import UploadSession
+    from pdf_web.documents.tasks import expire_upload_sessions
+
+    settings.DIRECT_UPLOAD_PART_BYTES = 5 * 1024**2
+    settings.PDF_LINEARIZE_MIN_BYTES = 64 * 1024**2
+    source = fitz.open(stream=_multi_page_pdf(3))
+    source.embfile_add("noise.bin", os.urandom(6 * 1024**2))
+    payload = source.tobytes()
+    api_client.force_authenticate(user=user)
+
+    def upload(**fields):
+        response = api_client.post(
+            "/api/uploads/",
+            {"workspace": workspace.id, "filename": "scan.pdf", "size_bytes": len(payload), "direct": True, **fields},
+            format="json",
+        )
+        assert response.status_code == 201
+        return response.data
+
+    session = upload()
+    url = f"/api/uploads/{session['id']}/"
+    assert [part["part_number"] for part in session["upload_urls"]] == [1, 2]
+    assert api_client.generic("PATCH", url, payload[:10], content_type="application/offset+octet-stream", HTTP_UPLOAD_OFFSET="0").status_code == 409
+    assert api_client.post(f"{url}finalize/").status_code == 409
+    for part in session["upload_urls"]:
+        assert requests.put(part["url"], data=payload[part["offset"]:part["offset"] + part["size"]]).ok
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post(f"{url}finalize/")
+    assert response.status_code == 202
+
+    version = Document.objects.get(pk=response.data["document"]).current_version
+    assert version.file_hash == hashlib.sha256(payload).hexdigest()
+    with version.file.open("rb") as handle:
+        assert handle.read() == payload
+    assert version.pdf_info["page_count"] == 3
+    # The uploaded object was copied into content-addressed storage and removed.
+    assert not default_storage.exists(UploadSession.objects.get(pk=session["id"]).object_key)
+
+    download = api_client.get(f"/api/versions/{version.id}/download/").data["url"]
+    assert "X-Amz-Expires=900" in download
+    assert "response-content-disposition=attachment" in download
+    assert requests.get(download).content == payload
+    response = api_client.get(f"/api/versions/{version.id}/content/")
+    assert response.status_code == 302
+    assert requests.get(response["Location"], headers={"Range": "bytes=0-4"}).content == b"%PDF-"
+
+    # Small files are a single PUT; identical content shares the stored copy.
+    settings.DIRECT_UPLOAD_PART_BYTES = 64 * 1024**2
+    again = upload()
+    assert len(again["upload_urls"]) == 1
+    assert requests.put(again["upload_urls"][0]["url"], data=payload).ok
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post(f"/api/uploads/{again['id']}/finalize/")
+    assert Document.objects.get(pk=response.data["document"]).current_version.stored_file_id == version.stored_file_id
+    assert StoredFile.objects.count() == 1
+
+    # Abandoned multipart uploads are aborted by the sweep.
+    settings.DIRECT_UPLOAD_PART_BYTES = 5 * 1024**2
+    abandoned = upload()
+    UploadSession.objects.filter(pk=abandoned["id"]).update(updated_at=timezone.now() - timedelta(days=2))
+    assert expire_upload_sessions.apply().get() == 1
+    assert not s3_bucket.list_multipart_uploads(Bucket="pdf-web-test").get("Uploads")
+
+
+@pytest.mark.django_db
+def test_render_page_renders_on_miss_and_serves_hits_from_cache(api_client, user, workspace, monkeypatch):
+    from pdf_web.documents import tasks
+    from pdf_web.documents.models import DocumentPageAsset
+
+    upload = SimpleUploadedFile("long.pdf", _multi_page_pdf(6), content_type="application/pdf")
+    api_client.force_authenticate(user=user)
+    api_client.post("/api/documents/", {"workspace": workspace.id, "title": "Long", "file": upload}, format="multipart")
+    version = DocumentVersion.objects.get()
+    assert set(DocumentPageAsset.objects.filter(version=version).values_list("page_number", flat=True)) == {1, 2, 3}
+
+    renders = []
+    real_render = tasks.render_page
+    monkeypatch.setattr(tasks, "render_page", lambda page, dpi_list: renders.append(page.number) or real_render(page, dpi_list))
+
+    for _ in range(2):
+        response = api_client.get(f"/api/versions/{version.id}/render-page/?page=5&dpi=150")
+        assert response.status_code == 200
+        assert response.data["preview_url"]
+    assert renders == [4]
+    asset = DocumentPageAsset.objects.get(version=version, page_number=5, dpi=150)
+    assert asset.size_bytes > 0
+
+    assert api_client.get(f"/api/versions/{version.id}/render-page/?page=7").status_code == 400
+    assert api_client.get(f"/api/versions/{version.id}/render-page/?page=1&dpi=1200").status_code == 400
+
+    monkeypatch.setattr(tasks, "render_page", lambda page, dpi_list: 1 / 0)
+    response = api_client.get(f"/api/versions/{version.id}/render-page/?page=6&dpi=150")
+    assert response.status_code == 400
+    assert response.data == {"detail": "Page cannot be rendered."}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_render_misses_are_coalesced(user, workspace, monkeypatch):
+    import threading
+    import time
+
+    from django.db import connection
+
+    from pdf_web.documents import tasks
+
+    document, version = create_document(workspace, user)
+    version.file.save("long.pdf", ContentFile(_multi_page_pdf(3)))
+
+    renders = []
+    real_render = tasks.render_page
+
+    def slow_render(page, dpi_list):
+        renders.append(page.number)
+        time.sleep(0.2)
+        return real_render(page, dpi_list)
+
+    monkeypatch.setattr(tasks, "render_page", slow_render)
+    results = []
+
+    def view_page():
+        try:
+            results.append(tasks.get_page_asset(version, 2, 72).pk)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=view_page) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert renders == [1]
+    assert len(results) == 3
+    assert len(set(results)) == 1
+
+
+@pytest.mark.django_db
+def test_tile_manifest_and_lazily_rendered_tiles(api_client, user, workspace, monkeypatch):
+    from pdf_web.documents.api import views
+    from pdf_web.documents.models import DocumentPageTile
+
+    document, version = create_document(workspace, user)
+    version.file.save("drawing.pdf", ContentFile(_multi_page_pdf(1)))
+    api_client.force_authenticate(user=user)
+
+    manifest = api_client.get(f"/api/versions/{version.id}/tiles/?page=1").data
+    assert (manifest["width"], manifest["height"], manifest["tile_size"]) == (300, 144, 256)
+    deepest = manifest["levels"][-1]
+    assert (deepest["level"], deepest["dpi"], deepest["columns"], deepest["rows"]) == (3, 576, 10, 5)
+    assert DocumentPageTile.objects.count() == 0
+
+    tile_url = manifest["tile_url"].format(level=3, column=9, row=4)
+    for _ in range(2):
+        response = api_client.get(tile_url)
+        assert response.status_code == 302
+    tile = DocumentPageTile.objects.get()
+    with Image.open(tile.image) as image:
+        assert image.size == (2400 - 9 * 256, 1152 - 4 * 256)
+
+    assert api_client.get(manifest["tile_url"].format(level=3, column=10, row=0)).status_code == 400
+    assert api_client.get(manifest["tile_url"].format(level=4, column=0, row=0)).status_code == 400
+
+    def broken_tile(*args):
+        raise RuntimeError("cannot render")
+
+    monkeypatch.setattr(views, "get_page_tile", broken_tile)
+    response = api_client.get(manifest["tile_url"].format(level=0, column=0, row=0))
+    assert response.status_code == 400
+    assert response.data == {"detail": "Page cannot be rendered."}
+
+
+@pytest.mark.django_db
+def test_page_render_cache_evicts_least_recently_viewed(user, workspace, settings):
+    from pdf_web.documents.models import DocumentPageAsset
+    from pdf_web.documents.tasks import evict_page_render_cache
+
+    _, version = create_document(workspace, user)
+    now = timezone.now()
+    for page_number in range(1, 5):
+        DocumentPageAsset.objects.create(
+            version=version,
+            page_number=page_number,
+            preview_image=ContentFile(b"x" * 100, name=f"page-{page_number}.png"),
+            size_bytes=100,
+            last_accessed_at=now - timedelta(minutes=10 * page_number),
+        )
+    settings.PAGE_RENDER_CACHE_MAX_BYTES = 250
+
+    assert evict_page_render_cache.apply().get() == 2
+    assert sorted(DocumentPageAsset.objects.values_list("page_number", flat=True)) == [1, 2]
+
+
+@pytest.mark.django_db
+def test_page_content_without_version_links_is_deleted_after_a_grace_period(user, workspace):
+    from pdf_web.documents.models import PageLayout
+    from pdf_web.documents.tasks import delete_orphan_page_content
+
+    _, kept = create_document(workspace, user)
+    dropped, version = create_document(workspace, user)
+    version.set_page_layouts({1: [{"bbox": [0, 0, 10, 10], "text": "Dropped", "block_type": 0}]})
+    dropped.delete()
+
+    assert delete_orphan_page_content.apply().get() == 0
+    PageLayout.objects.update(created_at=timezone.now() - timedelta(days=1))
+    assert delete_orphan_page_content.apply().get() == 1
+    assert list(PageLayout.objects.all()) == [kept.page_layouts.get().layout]
+
+
+@pytest.mark.django_db
+def test_unchanged_pages_reuse_renders_across_versions(user, workspace, monkeypatch, settings):
+    import fitz
+
+    from pdf_web.documents import tasks
+    from pdf_web.documents.models import DocumentPageAsset
+
+    _, original = create_document(workspace, user)
+    original.file.save("original.pdf", ContentFile(_multi_page_pdf(3)))
+    tasks.render_page_images.apply(args=[original.id])
+
+    edited = fitz.open(stream=original.file.read())
+    edited[1].draw_rect(fitz.Rect(10, 10, 50, 50))
+    _, revision = create_document(workspace, user)
+    revision.file.save("revision.pdf", ContentFile(edited.tobytes(garbage=4, deflate=True)))
+
+    rendered = []
+    real_render = tasks.render_page
+    monkeypatch.setattr(tasks, "render_page", lambda page, dpi_list: rendered.append(page.number + 1) or real_render(page, dpi_list))
+    tasks.render_page_images.apply(args=[revision.id])
+
+    assert rendered == [2]
+    revision.refresh_from_db()
+    original.refresh_from_db()
+    assert [a == b for a, b in zip(original.page_hashes, revision.page_hashes)] == [True, False, True]
+    shared = DocumentPageAsset.objects.get(version=revision, page_number=3, dpi=150)
+    assert shared.preview_image.name == DocumentPageAsset.objects.get(version=original, page_number=3, dpi=150).preview_image.name
+
+    # Evicting the original's renders keeps files the revision still links to.
+    DocumentPageAsset.objects.filter(version=revision).update(last_accessed_at=timezone.now() + timedelta(days=1))
+    settings.PAGE_RENDER_CACHE_MAX_BYTES = sum(DocumentPageAsset.objects.filter(version=revision).values_list("size_bytes", flat=True))
+    tasks.evict_page_render_cache.apply()
+    assert not DocumentPageAsset.objects.filter(version=original).exists()
+    assert shared.preview_image.storage.exists(shared.preview_image.name)
+
+
+@pytest.mark.django_db
+def test_layout_is_stored_per_page_and_shared_by_clones(api_client, user, workspace, django_assert_max_num_queries):
+    from pdf_web.documents.models import PageLayout
+
+    document, version = create_document(workspace, user)
+    blocks = [{"bbox": [72.5, 60.25, 300.125, 80.0], "text": f"Line {number}", "block_type": 0} for number in range(200)]
+    version.set_page_layouts({number: blocks for number in range(2, 51)})
+    version.pdf_info = {"page_count": 50}
+    version.save(update_fields=["pdf_info"])
+    # Identical pages are stored once.
+    assert PageLayout.objects.count() == 2
+
+    api_client.force_authenticate(user=user)
+    with django_assert_max_num_queries(4):
+        # The request savepoint pair, the version lookup and the one page's layout row.
+        response = api_client.get(f"/api/versions/{version.id}/layout/?page=7")
+    assert response.data["layout"] == blocks
+    assert api_client.get(f"/api/versions/{version.id}/layout/?page=0").status_code == 400
+    assert set(api_client.get(f"/api/versions/{version.id}/layout/").data["layout"]) == {str(number) for number in range(1, 51)}
+
+    response = api_client.post(
+        f"/api/versions/{version.id}/edit-text/",
+        {"layout_json": {"2": [{"text": "Edited"}]}},
+        format="json",
+    )
+    assert response.status_code == 201
+    clone = DocumentVersion.objects.get(pk=response.data["id"])
+    assert clone.page_layout(2) == [{"bbox": [0, 0, 0, 0], "text": "Edited", "block_type": 0}]
+    assert clone.page_layouts.get(page_number=3).layout_id == version.page_layouts.get(page_number=3).layout_id
+    assert PageLayout.objects.count() == 3
+    assert api_client.post(f"/api/versions/{version.id}/edit-text/", {"layout_json": ["x"]}, format="json").status_code == 400
+    for block in ({"text": "x", "bbox": [0, 0, 10]}, {"text": "x", "bbox": [0, 0, "10", 10]}, {"text": "x", "block_type": "0"}):
+        response = api_client.post(f"/api/versions/{version.id}/edit-text/", {"layout_json": {"1": [block]}}, format="json")
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_search_ranks_pages_and_locates_hits(api_client, user, workspace):
+    import fitz
+
+    from pdf_web.documents import tasks
+
+    _, version = create_document(workspace, user)
+    source = fitz.open()
+    texts = ["Quarterly revenue grew", "Revenue and revenue forecasts", "Unrelated appendix", "Pi is 3.14 - ask help@example.com"]
+    for text in texts:
+        source.new_page(width=400, height=200).insert_text((72, 72), text)
+    version.file.save("report.pdf", ContentFile(source.tobytes()))
+    tasks.index_search.apply(args=[version.id])
+
+    api_client.force_authenticate(user=user)
+    response = api_client.get(f"/api/versions/{version.id}/search/?q=revenue")
+    assert response.data["total"] == 2
+    # The page mentioning revenue twice ranks first, with one hit per occurrence.
+    first, second = response.data["results"]
+    assert (first["page_number"], second["page_number"]) == (2, 1)
+    assert [hit["text"] for hit in first["matches"]] == ["Revenue", "revenue"]
+    x0, y0, x1, y1 = first["matches"][0]["bbox"]
+    assert 70 <= x0 < x1 and y0 < 72 <= y1
+
+    response = api_client.get(f"/api/versions/{version.id}/search/", {"q": '"revenue grew"'})
+    assert [result["page_number"] for result in response.data["results"]] == [1]
+    assert response.data["results"][0]["matches"][0]["text"] == "revenue grew"
+    assert len(response.data["results"][0]["matches"][0]["rects"]) == 2
+
+    response = api_client.get(f"/api/versions/{version.id}/search/?q=forecast*")
+    assert [hit["text"] for hit in response.data["results"][0]["matches"]] == ["forecasts"]
+    assert api_client.get(f"/api/versions/{version.id}/search/?q=revenue&limit=1").data["results"][0]["page_number"] == 2
+    assert api_client.get(f"/api/versions/{version.id}/search/?q=missing").data["results"] == []
+
+    # Numbers, addresses and phrases around punctuation are split the way the index splits them.
+    for query, hit in (("3.14", "3.14"), ('"help@example.com"', "help@example.com"), ('"3.14 ask"', "3.14 ask")):
+        results = api_client.get(f"/api/versions/{version.id}/search/", {"q": query}).data["results"]
+        assert [(result["page_number"], [match["text"] for match in result["matches"]]) for result in results] == [(4, [hit])]
+
+
+@pytest.mark.django_db
+def test_content_endpoint_serves_byte_ranges(api_client, user, workspace):
+    _, version = create_document(workspace, user)
+    payload = _multi_page_pdf(20)
+    version.attach_file(ContentFile(payload), "report.pdf")
+    version.save()
+    etag = f'"{version.file_hash}"'
+    url = f"/api/versions/{version.id}/content/"
+    api_client.force_authenticate(user=user)
+
+    assert api_client.get(f"/api/versions/{version.id}/download/").data["stream_url"].endswith(url)
+    response = api_client.get(url)
+    assert response.status_code == 200
+    assert response["Accept-Ranges"] == "bytes"
+    assert response["ETag"] == etag
+    assert b"".join(response.streaming_content) == payload
+
+    response = api_client.get(url, HTTP_RANGE="bytes=100-1123")
+    assert response.status_code == 206
+    assert response["Content-Range"] == f"bytes 100-1123/{len(payload)}"
+    assert response["Content-Length"] == "1024"
+    assert b"".join(response.streaming_content) == payload[100:1124]
+    response = api_client.get(url, HTTP_RANGE="bytes=-10", HTTP_IF_RANGE=etag)
+    assert response.status_code == 206
+    assert b"".join(response.streaming_content) == payload[-10:]
+
+    # A partial copy of other content is replaced by the whole file.
+    assert api_client.get(url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"').status_code == 200
+    response = api_client.get(url, HTTP_RANGE=f"bytes={len(payload)}-")
+    assert response.status_code == 416
+    assert response["Content-Range"] == f"bytes */{len(payload)}"
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+
+@pytest.mark.django_db
+def test_extract_streams_page_ranges_without_creating_versions(api_client, user, workspace, settings, monkeypatch):
+    import fitz
+
+    from pdf_web.documents import extraction
+
+    _, version = create_document(workspace, user)
+    version.attach_file(ContentFile(_multi_page_pdf(60)), "minutes.pdf")
+    version.save()
+    settings.PAGE_RANGE_MAX_PAGES = 20
+    opened = []
+    monkeypatch.setattr(extraction, "local_source_path", lambda version: opened.append(version.pk) or version.file.path)
+    url = f"/api/versions/{version.id}/extract/"
+    api_client.force_authenticate(user=user)
+
+    response = api_client.get(url, {"pages": "40-45"})
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/pdf"
+    assert 'filename="minutes-pages-40-45.pdf"' in response["Content-Disposition"]
+    assert int(response["Content-Length"]) == len(response.content)
+    with fitz.open(stream=response.content) as doc:
+        assert [page.get_text().strip() for page in doc] == [f"Page {number}" for number in range(40, 46)]
+    assert DocumentVersion.objects.filter(document=version.document).count() == 1
+
+    # Another range reuses the open source; the same range is served from the cache.
+    assert api_client.get(url, {"pages": "7"}).status_code == 200
+    assert opened == [version.pk]
+    monkeypatch.setattr(extraction, "_cached_document", None)
+    response = api_client.get(url, {"pages": "40-45"})
+    assert response.status_code == 200
+    assert api_client.get(url, {"pages": "40-45"}, HTTP_IF_NONE_MATCH=response["ETag"]).status_code == 304
+
+    for pages in ("", "45-40", "0-3", "1-21", "a-b"):
+        assert api_client.get(url, {"pages": pages}).status_code == 400
+    monkeypatch.undo()
+    assert api_client.get(url, {"pages": "55-61"}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_words_endpoint_serves_packed_page_geometry(api_client, user, workspace):
+    import struct
+
+    import fitz
+
+    from pdf_web.documents import tasks
+
+    _, version = create_document(workspace, user)
+    source = fitz.open()
+    page = source.new_page(width=400, height=200)
+    page.insert_text((72, 72), "First line here")
+    page.insert_text((72, 120), "Second line")
+    version.file.save("words.pdf", ContentFile(source.tobytes()))
+    tasks.index_search.apply(args=[version.id])
+    api_client.force_authenticate(user=user)
+
+    response = api_client.get(f"/api/versions/{version.id}/words/?page=1")
+    assert response.status_code == 200
+    assert response.data["count"] == 5
+    assert response.data["texts"] == ["First", "line", "here", "Second", "line"]
+    assert len(response.data["boxes"]) == 20
+    line_ids = list(zip(response.data["lines"][::2], response.data["lines"][1::2]))
+    assert line_ids[0] == line_ids[2] != line_ids[3]
+
+    binary = api_client.get(f"/api/versions/{version.id}/words/?page=1&encoding=binary")
+    payload = binary.content
+    assert payload[:4] == b"PWD1"
+    (count,) = struct.unpack_from("<I", payload, 4)
+    boxes = struct.unpack_from(f"<{count * 4}f", payload, 8)
+    lines = struct.unpack_from(f"<{count * 2}H", payload, 8 + count * 16)
+    assert payload[8 + count * 20:].decode().split("\n") == response.data["texts"]
+    assert [round(value, 3) for value in boxes] == response.data["boxes"]
+    assert list(lines) == response.data["lines"]
+
+    cached = api_client.get(f"/api/versions/{version.id}/words/?page=1", HTTP_IF_NONE_MATCH=binary["ETag"])
+    assert cached.status_code == 304
+    assert api_client.get(f"/api/versions/{version.id}/words/?page=2").status_code == 400
+
+
+@pytest.mark.django_db
+def test_search_stays_fast_on_large_documents(user, workspace):
+    import time
+
+    from django.db import connection
+
+    from pdf_web.documents.search import search_version
+
+    _, version = create_document(workspace, user)
+    vocabulary = [f"term{number}" for number in range(400)]
+    pages = {}
+    for page_number in range(1, 5001):
+        words = [vocabulary[(page_number * 7 + index) % 400] for index in range(300)]
+        if page_number % 1000 == 0:
+            words[10] = "needle"
+        pages[page_number] = (" ".join(words), [(index, 0, index + 1, 1, word) for index, word in enumerate(words)])
+    version.set_page_texts(pages)
+    with connection.cursor() as cursor:
+        # Planner statistics and the search index as autovacuum would leave them after a bulk load;
+        # until the GIN pending list is merged the planner may prefer a sequential scan.
+        cursor.execute("ANALYZE documents_documentpagetext")
+        cursor.execute("ANALYZE documents_pagewords")
+        cursor.execute("SELECT gin_clean_pending_list('documents_page_text_search')")
+
+    timings = []
+    for _ in range(3):
+        started = time.perf_counter()
+        result = search_version(version, "needle", limit=20)
+        timings.append(time.perf_counter() - started)
+
+    assert [page["page_number"] for page in result["results"]] == [1000, 2000, 3000, 4000, 5000]
+    assert min(timings) < 0.1
+
+
+@pytest.mark.django_db
+def test_new_versions_only_reindex_changed_pages(user, workspace, monkeypatch):
+    import fitz
+
+    from pdf_web.ai.models import EmbeddingChunk
+    from pdf_web.ai.services import embed_document
+    from pdf_web.documents import tasks
+    from pdf_web.documents.models import PageLayout
+    from pdf_web.documents.search import search_version
+
+    document, parent = create_document(workspace, user)
+    source = fitz.open()
+    for text in ("Alpha page", "Beta page", "Gamma page"):
+        source.new_page(width=300, height=144).insert_text((72, 72), text)
+    parent.file.save("parent.pdf", ContentFile(source.tobytes()))
+    tasks.ingest_version.apply(args=[parent.id])
+    parent.refresh_from_db()
+    embed_document(parent, user)
+
+    source[1].insert_text((72, 100), "revised")
+    child = DocumentVersion.objects.create(document=document, version_number=2, parent=parent, created_by=user)
+    child.file.save("child.pdf", ContentFile(source.tobytes()))
+    extracted = []
+    real_read = tasks._read_page_text
+    monkeypatch.setattr(tasks, "_read_page_text", lambda page: extracted.append(page.number + 1) or real_read(page))
+    layouts_before = PageLayout.objects.count()
+
+    tasks.ingest_version.apply(args=[child.id])
+
+    child.refresh_from_db()
+    assert extracted == [2]
+    assert PageLayout.objects.count() == layouts_before + 1
+    assert child.page_layouts.get(page_number=3).layout_id == parent.page_layouts.get(page_number=3).layout_id
+    assert [line for line in child.text_content.splitlines() if line] == ["Alpha page", "Beta page", "revised", "Gamma page"]
+    assert [result["page_number"] for result in search_version(child, "gamma", limit=5)["results"]] == [3]
+    assert [result["page_number"] for result in search_version(child, "revised", limit=5)["results"]] == [2]
+
+    # Only the revised page's text is encoded; the others take the parent's embeddings.
+    assert embed_document(child, user) == 1
+    parent_embeddings = dict(EmbeddingChunk.objects.filter(version=parent).values_list("page_number", "embedding"))
+    child_embeddings = dict(EmbeddingChunk.objects.filter(version=child).values_list("page_number", "embedding"))
+    assert list(child_embeddings[1]) == list(parent_embeddings[1])
+    assert list(child_embeddings[2]) != list(parent_embeddings[2])
+
+
+@pytest.mark.django_db
+def test_embedding_is_batched_and_skips_unchanged_chunks(user, workspace, settings, monkeypatch, django_assert_max_num_queries):
+    import numpy as np
+
+    from pdf_web.ai.encoders import HashingEncoder
+    from pdf_web.ai.models import EmbeddingChunk
+    from pdf_web.ai.services import embed_document
+
+    settings.EMBEDDING_BATCH_SIZE = 500
+    _, version = create_document(workspace, user)
+    pages = {}
+    for page_number in range(1, 1001):
+        words = [f"p{page_number}w{index}" for index in range(250)]
+        pages[page_number] = (" ".join(words), [(index, 0, index + 1, 1, word) for index, word in enumerate(words)])
+    version.set_page_texts(pages)
+    batches = []
+    real_encode = HashingEncoder.encode
+    monkeypatch.setattr(HashingEncoder, "encode", lambda self, texts: batches.append(len(texts)) or real_encode(self, texts))
+
+    # Chunk writes and the retrieval index build included.
+    with django_assert_max_num_queries(12):
+        assert embed_document(version, user) == 2000
+    assert batches == [500] * 4
+
+    first, second = EmbeddingChunk.objects.filter(version=version, page_number=700).order_by("chunk_index")
+    # Two overlapping windows: words 0-199 and 160-249.
+    assert first.text.split()[-40:] == second.text.split()[:40]
+    assert second.text.split()[-1] == "p700w249"
+    assert np.linalg.norm(first.embedding) == pytest.approx(1.0, abs=1e-5)
+    assert EmbeddingChunk.objects.filter(version=version).values("page_number").distinct().count() == 1000
+
+    # Re-embedding leaves unchanged chunks alone and encodes only edited text.
+    version.page_texts.filter(page_number=3).update(text="A rewritten third page")
+    ids = set(EmbeddingChunk.objects.filter(version=version).exclude(page_number=3).values_list("pk", flat=True))
+    batches.clear()
+    assert embed_document(version, user) == 1
+    assert batches == [1]
+    assert ids <= set(EmbeddingChunk.objects.filter(version=version).values_list("pk", flat=True))
+    assert EmbeddingChunk.objects.filter(version=version, page_number=3).count() == 1
+
+
+@pytest.mark.django_db
+def test_chat_fuses_bm25_and_vector_rankings(api_client, user, workspace, monkeypatch, django_assert_max_num_queries):
+    from pdf_web.ai import chunk_index
+    from pdf_web.ai.api.views import _rank_chunks
+    from pdf_web.ai.services import embed_document
+
+    document, version = create_document(workspace, user)
+    filler = " ".join(f"filler{index}" for index in range(50))
+    texts = {page_number: f"{filler} common words on page {page_number}" for page_number in range(1, 301)}
+    texts[120] += " the zebra grazes"
+    texts[250] += " a zebra and another zebra"
+    version.set_page_texts({page_number: (text, []) for page_number, text in texts.items()})
+    embed_document(version, user)
+    decoded = []
+    real_decode = chunk_index.InvertedIndex.decode.__func__
+    monkeypatch.setattr(chunk_index.InvertedIndex, "decode", classmethod(lambda cls, row: decoded.append(row.pk) or real_decode(cls, row)))
+
+    api_client.force_authenticate(user=user)
+    session_id = api_client.post(f"/api/documents/{document.id}/chat/", format="json").data["id"]
+    response = api_client.post(f"/api/chat/{session_id}/message/", {"content": "User prompt: zebra sightings?"}, format="json")
+    assert response.status_code == 201
+    assert [citation["page"] for citation in response.data["citations"]][:2] == [250, 120]
+    assert response.data["citations"][0]["match_reasons"][0].startswith("query terms BM25")
+    assert "embedding similarity rank: 1" in response.data["citations"][0]["match_reasons"]
+
+    # The decoded index is reused, and ranking loads only the chunks it returns, after the vector search:
+    # one indexed query, plus an exact one when earlier tests' dead index entries crowd out this version's.
+    with django_assert_max_num_queries(7):
+        ranked = _rank_chunks(version, "grazes", "", limit=3)
+    assert [entry["chunk"].page_number for entry in ranked] == [120, 1, 2]
+    assert len(decoded) == 1
+
+    # Re-embedding changed text rebuilds the index, and the new copy replaces the cached one.
+    version.page_texts.filter(page_number=7).update(text="an okapi appears")
+    embed_document(version, user)
+    assert [entry["chunk"].page_number for entry in _rank_chunks(version, "okapi", "", limit=1)] == [7]
+    assert len(decoded) == 2
+
+    # Versions embedded before the index existed get one built on their first search.
+    chunk_index.ChunkIndex.objects.filter(version=version).delete()
+    assert [entry["chunk"].page_number for entry in _rank_chunks(version, "okapi", "", limit=1)] == [7]
+    assert chunk_index.ChunkIndex.objects.filter(version=version).exists()
+
+
+@pytest.mark.django_db
+def test_chat_streams_citations_before_the_reply_and_stores_it_after(api_client, user, workspace, monkeypatch):
+    import json
+
+    from pdf_web.ai.api import views as ai_views
+    from pdf_web.ai.models import ChatMessage
+    from pdf_web.ai.models import ChatSession
+    from pdf_web.ai.services import embed_document
+    from pdf_web.ai.tasks import save_chat_reply
+
+    document, version = create_document(workspace, user)
+    version.set_page_texts({1: ("Zebras graze on the savanna at dawn.", []), 2: ("Okapis live in the forest.", [])})
+    embed_document(version, user)
+    api_client.force_authenticate(user=user)
+    session_id = api_client.post(f"/api/documents/{document.id}/chat/", format="json").data["id"]
+    content = "Intent: question\nUser prompt: where do zebras graze?"
+    saved = []
+    monkeypatch.setattr(save_chat_reply, "delay", lambda *args: saved.append(args) or save_chat_reply.apply(args))
+
+    response = api_client.post(f"/api/chat/{session_id}/stream/", {"content": content}, format="json", HTTP_ACCEPT="text/event-stream")
+    assert response.status_code == 200
+    assert response["Content-Type"] == "text/event-stream"
+    events = []
+    for raw in response.streaming_content:
+        if not events:
+            # Nothing is stored until the reply has been produced.
+            assert not ChatMessage.objects.filter(session_id=session_id, role="assistant").exists()
+        name, data = raw.decode().strip().split("\n")
+        events.append((name.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+
+    names = [name for name, _ in events]
+    assert names[0] == "citations" and names[-1] == "done"
+    assert set(names[1:-1]) == {"delta"} and len(names) > 3
+    assert events[0][1]["citations"][0]["page"] == 1
+    reply = events[-1][1]["content"]
+    assert "".join(data["content"] for _, data in events[1:-1]) == reply
+    assert saved == [(session_id, reply)]
+    assert list(ChatMessage.objects.filter(session_id=session_id).values_list("role", "content")) == [("user", content), ("assistant", reply)]
+
+    # The buffered endpoint answers with the same text.
+    assert api_client.post(f"/api/chat/{session_id}/message/", {"content": content}, format="json").data["content"] == reply
+
+    # A client that disconnects mid-answer keeps the part it was sent; Django closes the event generator.
+    stream = ai_views._reply_events(ChatSession.objects.get(pk=session_id), content)
+    next(stream)
+    first_delta = json.loads(next(stream).decode().strip().split("\n")[1].removeprefix("data: "))["content"]
+    stream.close()
+    assert saved[-1] == (session_id, first_delta)
+    assert ChatMessage.objects.filter(session_id=session_id, role="assistant").latest("id").content == first_delta
+
+    # Errors reach event-stream clients as an event too.
+    response = api_client.post("/api/chat/999999/stream/", {"content": content}, format="json", HTTP_ACCEPT="text/event-stream")
+    assert response.status_code == 404
+    assert response.content.startswith(b"event: error\ndata: ")
+
+
+@pytest.mark.django_db
+def test_summaries_are_precomputed_at_ingest_and_reused_per_section(api_client, user, workspace, monkeypatch, django_capture_on_commit_callbacks):
+    import fitz
+
+    from pdf_web.ai import summaries
+    from pdf_web.ai.api import views as ai_views
+    from pdf_web.documents import tasks
+    from pdf_web.operations.services import clone_version
+
+    chapters = {
+        "Rivers": ["The river carries silt from the mountains to the delta every spring.", "Floods along the river renew the farmland of the delta."],
+        "Forests": ["Old forests store carbon in their trunks and their soil.", "Fires clear the forest floor so young trees can grow."],
+        "Deserts": ["Desert plants keep water in thick leaves through the dry season.", "Wind shapes the desert dunes a little more every night."],
+    }
+
+    def build(edited=False):
+        source = fitz.open()
+        toc = []
+        for title, sentences in chapters.items():
+            toc.append([1, title, source.page_count + 1])
+            for number, sentence in enumerate(sentences):
+                page = source.new_page(width=400, height=400)
+                page.insert_text((40, 30), "Acme Corporation confidential field report draft copy")
+                body = f"{sentence} Survey teams recorded these {title.lower()} observations in detail over many seasons."
+                if edited and title == "Forests" and number == 1:
+                    body = "Storms topple the tallest forest trees and open bright clearings for new growth."
+                page.insert_textbox(fitz.Rect(40, 80, 360, 360), body)
+        source.set_toc(toc)
+        return source.tobytes()
+
+    document, parent = create_document(workspace, user)
+    parent.file.save("parent.pdf", ContentFile(build()))
+    with django_capture_on_commit_callbacks(execute=True):
+        tasks.ingest_version.apply(args=[parent.id])
+    parent.refresh_from_db()
+    assert parent.processing_state["summary"] == "completed"
+    summary = parent.summary
+    assert [(section["title"], section["first_page"], section["last_page"]) for section in summary.sections] == [
+        ("Rivers", 1, 2),
+        ("Forests", 3, 4),
+        ("Deserts", 5, 6),
+    ]
+    # The running header repeats on every page and is left out.
+    assert all("Acme" not in sentence["text"] for section in summary.sections for sentence in section["sentences"])
+    assert {sentence["section"] for sentence in summary.sentences} == set(chapters)
+
+    # Summary requests are answered from the stored summary, without ranking chunks.
+    monkeypatch.setattr(ai_views, "_rank_chunks", lambda *args, **kwargs: pytest.fail("ranked chunks"))
+    api_client.force_authenticate(user=user)
+    document.current_version = parent
+    document.save(update_fields=["current_version"])
+    session_id = api_client.post(f"/api/documents/{document.id}/chat/", format="json").data["id"]
+    response = api_client.post(f"/api/chat/{session_id}/message/", {"content": "Intent: summary\n\nUser prompt: Summarize"}, format="json")
+    assert response.status_code == 201
+    assert [citation["page"] for citation in response.data["citations"]] == [sentence["page"] for sentence in summary.sentences]
+    assert response.data["citations"][0]["match_reasons"] == ["precomputed summary of Rivers"]
+    assert summary.sentences[0]["text"] in response.data["content"]
+    response = api_client.post(
+        f"/api/chat/{session_id}/message/",
+        {"content": "Intent: summary\n\nUser prompt: Summarize\n\nContext:\nPage range: 3-4"},
+        format="json",
+    )
+    assert {citation["page"] for citation in response.data["citations"]} == {3, 4}
+
+    # A new version only summarizes the section whose pages changed.
+    summarized = []
+    real_summarize = summaries.summarize_section
+    monkeypatch.setattr(summaries, "summarize_section", lambda blocks: summarized.append(sorted(blocks)) or real_summarize(blocks))
+    child = DocumentVersion.objects.create(document=document, version_number=2, parent=parent, created_by=user)
+    child.file.save("child.pdf", ContentFile(build(edited=True)))
+    with django_capture_on_commit_callbacks(execute=True):
+        tasks.ingest_version.apply(args=[child.id])
+    child.refresh_from_db()
+    assert summarized == [[3, 4]]
+    assert child.summary.sections[0]["sentences"] == summary.sections[0]["sentences"]
+    assert any("Storms" in sentence["text"] for sentence in child.summary.sections[1]["sentences"])
+
+    # Versions copied from another, as edits and page operations do, are summarized too.
+    with django_capture_on_commit_callbacks(execute=True):
+        copy = clone_version(child, created_by=user)
+    copy.refresh_from_db()
+    assert copy.processing_state["summary"] == "completed"
+    assert copy.summary.sentences
+
+
+@pytest.mark.django_db
+def test_processing_state_merges_do_not_overwrite_each_other(user, workspace):
+    _, version = create_document(workspace, user)
+    stale = DocumentVersion.objects.get(pk=version.pk)
+
+    version.merge_processing_state({"render": "completed"})
+    stale.merge_processing_state({"text": "completed"}, text_content="Fresh")
+
+    version.refresh_from_db()
+    assert version.processing_state == {"render": "completed", "text": "completed"}
+    assert version.text_content == "Fresh"
+
+
 @pytest.mark.django_db
 def test_documents_list_can_be_filtered_by_workspace(api_client, user):
     workspace_a = Workspace.objects.create(name="A", owner=user)
@@ -138,6 +1229,38 @@ def test_documents_list_can_be_filtered_by_workspace(api_client, user):
     assert response.data[0]["workspace"] == workspace_a.id
 
 
+@pytest.mark.django_db
+def test_list_endpoints_are_slim_and_support_field_selection(api_client, user, workspace, django_assert_max_num_queries):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    for _ in range(5):
+        create_document(workspace, user)
+    api_client.force_authenticate(user=user)
+
+    with CaptureQueriesContext(connection) as queries, django_assert_max_num_queries(4):
+        response = api_client.get("/api/documents/")
+    assert len(response.data) == 5
+    assert "text_content" not in response.data[0]["current_version"]
+    assert response.data[0]["workspace_role"] == WorkspaceRole.OWNER
+    assert not any("text_content" in query["sql"] for query in queries.captured_queries)
+
+    response = api_client.get("/api/documents/?expand=current_version")
+    assert response.data[0]["current_version"]["text_content"] == "Hello World"
+
+    response = api_client.get("/api/documents/?fields=id,title")
+    assert set(response.data[0]) == {"id", "title"}
+
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.get("/api/versions/?fields=id,version_number")
+    assert set(response.data[0]) == {"id", "version_number"}
+    assert not any("pdf_info" in query["sql"] for query in queries.captured_queries)
+    assert "text_content" not in api_client.get("/api/versions/").data[0]
+    assert api_client.get("/api/versions/?expand=text_content").data[0]["text_content"] == "Hello World"
+    version_id = response.data[0]["id"]
+    assert api_client.get(f"/api/versions/{version_id}/").data["text_content"] == "Hello World"
+
+
 @pytest.mark.django_db
 def test_permissions_for_annotations_and_encrypt(api_client, user, editor, viewer, workspace):
     WorkspaceMember.objects.create(workspace=workspace, user=editor, role=WorkspaceRole.EDITOR)
@@ -703,3 +1826,135 @@ def test_annotation_update_requires_matching_revision(api_client, user, workspac
     )
     assert stale_response.status_code == 409
     assert stale_response.data["current_revision"] == 2
+
+
+@pytest.mark.django_db
+def test_batch_conversion_zips_outputs_for_many_versions(api_client, user, workspace, django_capture_on_commit_callbacks):
+    from pdf_web.operations.models import BatchConversionJob
+
+    _, first = create_document(workspace, user)
+    _, second = create_document(workspace, user)
+    api_client.force_authenticate(user=user)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post(
+            "/api/batch-conversions/",
+            {"workspace": workspace.id, "target_format": "jpg", "version_ids": [first.id, second.id], "max_parallel": 1},
+            format="json",
+        )
+    assert response.status_code == 202
+    assert len(response.data["items"]) == 2
+
+    batch = BatchConversionJob.objects.get(id=response.data["id"])
+    assert batch.status == "completed"
+    assert batch.progress == 100
+    with batch.result_file.open("rb") as handle, zipfile.ZipFile(BytesIO(handle.read())) as archive:
+        names = archive.namelist()
+    assert "manifest.json" in names
+    assert len([name for name in names if name.endswith(".jpg")]) == 2
+
+
+@pytest.mark.django_db
+def test_batch_conversion_from_archive_reports_partial_failures(api_client, user, workspace, monkeypatch, django_capture_on_commit_callbacks):
+    import json
+
+    from pdf_web.operations import tasks
+    from pdf_web.operations.models import BatchConversionJob
+
+    real_convert = tasks.create_converted_version
+
+    def flaky_convert(version, **kwargs):
+        if version.file.name.endswith("broken.pdf"):
+            raise RuntimeError("corrupt source")
+        return real_convert(version, **kwargs)
+
+    monkeypatch.setattr(tasks, "create_converted_version", flaky_convert)
+
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, mode="w") as upload:
+        upload.writestr("invoices/good.pdf", make_pdf_file().read())
+        # Different bytes, or the entry would share good.pdf's stored file and name.
+        upload.writestr("invoices/broken.pdf", make_pdf_file().read() + b"\n")
+        upload.writestr("__MACOSX/._good.pdf", b"")
+    archive = SimpleUploadedFile("invoices.zip", buffer.getvalue(), content_type="application/zip")
+
+    api_client.force_authenticate(user=user)
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post(
+            "/api/batch-conversions/",
+            {"workspace": workspace.id, "target_format": "jpg", "archive": archive},
+            format="multipart",
+        )
+    assert response.status_code == 202
+
+    batch = BatchConversionJob.objects.get(id=response.data["id"])
+    assert batch.status == "partial"
+    assert batch.items.filter(status="failed").count() == 1
+    with batch.result_file.open("rb") as handle, zipfile.ZipFile(BytesIO(handle.read())) as result:
+        manifest = json.loads(result.read("manifest.json"))
+    assert sorted(item["status"] for item in manifest["items"]) == ["completed", "failed"]
+
+
+@pytest.mark.django_db
+def test_stalled_batch_items_are_failed_and_the_batch_finalized(user, workspace, settings, monkeypatch, django_capture_on_commit_callbacks):
+    from pdf_web.operations import tasks
+    from pdf_web.operations.models import BatchConversionJob
+    from pdf_web.operations.models import ConversionJob
+    from pdf_web.operations.tasks import fail_stalled_batch_items
+
+    batch = BatchConversionJob.objects.create(workspace=workspace, requested_by=user, target_format="jpg", status="running")
+    document, version = create_document(workspace, user)
+    long_ago = timezone.now() - timedelta(seconds=settings.TASK_QUEUE_PROFILES["conversion-heavy"]["time_limit"] + 1)
+    # Claimed items are running from the batch's point of view; only their task records a start.
+    for name, started_at in {"lost": long_ago, "busy": timezone.now(), "queued": None}.items():
+        ConversionJob.objects.create(
+            workspace=workspace,
+            document=document,
+            version=version,
+            requested_by=user,
+            target_format="jpg",
+            batch=batch,
+            status="running",
+            started_at=started_at,
+            params={"name": name},
+        )
+
+    assert fail_stalled_batch_items.apply().get() == 1
+    batch.refresh_from_db()
+    assert batch.status == "running"
+    assert batch.items.get(params__name="lost").status == "failed"
+
+    # A result arriving after the item was swept does not bring it back.
+    busy = batch.items.get(params__name="busy")
+
+    def swept_while_converting(source, **kwargs):
+        ConversionJob.objects.filter(pk=busy.pk).update(status="failed", error="stalled")
+        return source
+
+    monkeypatch.setattr(tasks, "create_converted_version", swept_while_converting)
+    tasks.process_conversion_job.apply(args=[busy.id])
+    busy.refresh_from_db()
+    assert (busy.status, busy.error, busy.result_version_id) == ("failed", "stalled", None)
+
+    # However long an item waits in the queue, it is not swept before its task starts.
+    assert fail_stalled_batch_items.apply().get() == 0
+    batch.items.filter(params__name="queued").update(started_at=long_ago)
+    with django_capture_on_commit_callbacks(execute=True):
+        assert fail_stalled_batch_items.apply().get() == 1
+    batch.refresh_from_db()
+    assert batch.status == "failed"
+    assert batch.progress == 100
+
+
+@pytest.mark.django_db
+def test_batch_conversion_rejects_versions_from_other_workspaces(api_client, user, workspace):
+    other = Workspace.objects.create(name="Other", owner=user)
+    _, foreign_version = create_document(other, user)
+    api_client.force_authenticate(user=user)
+    response = api_client.post(
+        "/api/batch-conversions/",
+        {"workspace": workspace.id, "target_format": "jpg", "version_ids": [foreign_version.id]},
+        format="json",
+    )
+    assert response.status_code == 400
+    assert response.data["version_ids"] == [foreign_version.id]
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.storage import Storage
+
+from pdf_web.documents.source_cache import local_source_path
+
+
+class RemoteStorage(Storage):
+    """Stand-in for an object store: no local paths, slow and counted reads."""
+
+    def __init__(self, location):
+        self.backing = FileSystemStorage(location=location)
+        self.opened = 0
+        self._counter = threading.Lock()
+
+    def _open(self, name, mode="rb"):
+        with self._counter:
+            self.opened += 1
+        time.sleep(0.05)
+        return self.backing.open(name, mode)
+
+    def _save(self, name, content):
+        return self.backing.save(name, content)
+
+    def exists(self, name):
+        return self.backing.exists(name)
+
+
+class FakeFile:
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+
+    @property
+    def path(self):
+        return self.storage.path(self.name)
+
+
+class FakeVersion:
+    def __init__(self, pk, storage, name, file_hash=""):
+        self.pk = pk
+        self.file = FakeFile(storage, name)
+        self.file_hash = file_hash
+
+
+def _stored(storage, name: str, content: bytes) -> str:
+    return storage.save(name, ContentFile(content))
+
+
+def test_concurrent_requests_download_a_source_once(tmp_path, settings):
+    settings.SOURCE_CACHE_DIR = str(tmp_path / "cache")
+    storage = RemoteStorage(location=tmp_path / "bucket")
+    name = _stored(storage, "doc.pdf", b"%PDF-1.7 source")
+    # Two versions with identical content share one cached copy.
+    versions = [FakeVersion(pk, storage, name, file_hash="abc123") for pk in (1, 2)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        paths = list(pool.map(local_source_path, versions * 4))
+
+    assert storage.opened == 1
+    assert len(set(paths)) == 1
+    assert Path(paths[0]).read_bytes() == b"%PDF-1.7 source"
+    assert not list(Path(settings.SOURCE_CACHE_DIR).glob("*.part"))
+
+
+def test_least_recently_used_sources_are_evicted(tmp_path, settings):
+    settings.SOURCE_CACHE_DIR = str(tmp_path / "cache")
+    settings.SOURCE_CACHE_MAX_BYTES = 250
+    storage = RemoteStorage(location=tmp_path / "bucket")
+    versions = [
+        FakeVersion(pk, storage, _stored(storage, f"doc-{pk}.pdf", bytes(100)), file_hash=f"hash-{pk}")
+        for pk in range(3)
+    ]
+    first, second = (local_source_path(version) for version in versions[:2])
+    past = time.time() - 60
+    os.utime(second, (past, past))
+    # Reading the first source again makes the second the least recently used.
+    assert local_source_path(versions[0]) == first
+
+    third = local_source_path(versions[2])
+
+    assert Path(first).exists()
+    assert not Path(second).exists()
+    assert Path(third).exists()
+
+
+def test_lock_files_are_shared_by_keys_with_a_common_prefix(tmp_path, settings):
+    settings.SOURCE_CACHE_DIR = str(tmp_path / "cache")
+    storage = RemoteStorage(location=tmp_path / "bucket")
+    name = _stored(storage, "doc.pdf", b"%PDF-1.7")
+
+    for pk, file_hash in enumerate(["aa01", "aa02", "ab03", "aa04"]):
+        local_source_path(FakeVersion(pk, storage, name, file_hash=file_hash))
+
+    assert sorted(path.name for path in Path(settings.SOURCE_CACHE_DIR).glob("*.lock")) == [".aa.lock", ".ab.lock", ".evict.lock"]
+
+
+def test_local_storage_is_read_in_place(tmp_path, settings):
+    settings.SOURCE_CACHE_DIR = str(tmp_path / "cache")
+    storage = FileSystemStorage(location=tmp_path / "media")
+    name = _stored(storage, "doc.pdf", b"%PDF-1.7")
+
+    assert local_source_path(FakeVersion(1, storage, name)) == storage.path(name)
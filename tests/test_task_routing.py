@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import logging
+import time
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import cache
+
+from config.celery_app import QUEUE_WAIT_CACHE_KEY
+from config.celery_app import app
+from config.celery_app import record_queue_wait
+from config.celery_app import stamp_published_at
+from pdf_web.core.tasks import queue_depths
+from pdf_web.core.tasks import report_queue_metrics
+from pdf_web.core.tasks import routed_queues
+
+
+def _route(task_name: str) -> str:
+    return app.amqp.router.route({}, task_name)["queue"].name
+
+
+def test_interactive_and_heavy_tasks_use_separate_queues():
+    assert _route("pdf_web.documents.tasks.render_page_images") == "render"
+    assert _route("pdf_web.documents.tasks.ingest_version") == "ingest"
+    assert _route("pdf_web.documents.tasks.parse_bookmarks") == "text"
+    assert _route("pdf_web.operations.tasks.process_conversion_job") == "conversion-heavy"
+    assert _route("pdf_web.operations.tasks.apply_operation") == "operations"
+    assert _route("pdf_web.ai.tasks.embed_document") == "ai"
+    assert _route("pdf_web.users.tasks.get_users_count") == settings.CELERY_TASK_DEFAULT_QUEUE
+    # Cache eviction is housekeeping and stays off the queue users wait on.
+    for housekeeping in ("evict_page_render_cache", "delete_orphan_page_content", "delete_unreferenced_files", "expire_upload_sessions"):
+        assert _route(f"pdf_web.documents.tasks.{housekeeping}") == settings.CELERY_TASK_DEFAULT_QUEUE
+
+
+def test_routed_tasks_inherit_queue_time_limits():
+    annotations = settings.CELERY_TASK_ANNOTATIONS
+    heavy = settings.TASK_QUEUE_PROFILES["conversion-heavy"]
+    assert annotations["pdf_web.operations.tasks.process_conversion_job"]["time_limit"] == heavy["time_limit"]
+    assert annotations["pdf_web.documents.tasks.ingest_version"]["time_limit"] > settings.TASK_QUEUE_PROFILES["render"]["time_limit"]
+    assert all(name in annotations for name in settings.CELERY_TASK_ROUTES)
+
+
+def test_queue_wait_is_recorded_and_over_budget_waits_warn(caplog):
+    headers: dict = {}
+    stamp_published_at(headers=headers)
+    assert headers["published_at"] <= time.time()
+
+    budget = settings.TASK_QUEUE_PROFILES["render"]["max_wait"]
+    request = SimpleNamespace(published_at=time.time() - budget - 1, delivery_info={"routing_key": "render"})
+    task = SimpleNamespace(name="pdf_web.documents.tasks.render_page_images", request=request)
+    with caplog.at_level(logging.INFO):
+        record_queue_wait(task=task)
+
+    assert cache.get(QUEUE_WAIT_CACHE_KEY.format(queue="render")) > budget
+    assert any(record.levelno == logging.WARNING for record in caplog.records)
+
+
+def test_report_queue_metrics_covers_every_queue():
+    metrics = report_queue_metrics.apply().get()
+    assert set(metrics) == {settings.CELERY_TASK_DEFAULT_QUEUE, *settings.TASK_QUEUE_PROFILES}
+
+
+class _AmqpChannel:
+    """Behaves like an AMQP channel: a failed passive declare closes it for good."""
+
+    def __init__(self, depths: dict[str, int]):
+        self.depths = depths
+        self.is_open = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.is_open = False
+
+    def queue_declare(self, queue: str, passive: bool):
+        if not self.is_open:
+            raise ConnectionError("channel is closed")
+        if queue not in self.depths:
+            self.is_open = False
+            raise ConnectionError(f"no queue {queue!r}")
+        return SimpleNamespace(message_count=self.depths[queue])
+
+
+def test_queue_depths_survive_an_undeclared_queue():
+    depths = {queue: 3 for queue in routed_queues()[2:]}
+    connection = SimpleNamespace(channel=lambda: _AmqpChannel(depths), default_channel=_AmqpChannel(depths))
+    broker = SimpleNamespace(connection_for_read=lambda: nullcontext(connection))
+
+    assert queue_depths(broker) == {queue: depths.get(queue) for queue in routed_queues()}
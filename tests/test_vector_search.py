@@ -0,0 +1,129 @@
+"""Benchmark: recall and latency of the HNSW chunk search against an exact scan.
+
+The corpus is synthetic: unit vectors scattered around random topic centres,
+split between the version searched and a smaller neighbouring version so the
+version filter has rows to discard. Queries are drawn near the centres. Each is
+answered through the index and by an exact scan with index scans disabled, and
+recall is the share of the exact top ``K`` the index returns.
+
+The default corpus keeps the suite quick; set ``VECTOR_BENCHMARK_CHUNKS`` to
+1000000 for the full-size run (about 8 GB of table and index).
+"""
+
+from __future__ import annotations
+
+import os
+import statistics
+import time
+
+import numpy as np
+import pytest
+from django.db import connection
+from pgvector.django import MaxInnerProduct
+from pgvector.psycopg import register_vector
+from psycopg.types.json import Jsonb
+
+from pdf_web.ai.encoders import EMBEDDING_DIMENSIONS
+from pdf_web.ai.encoders import normalize
+from pdf_web.ai.models import EmbeddingChunk
+from pdf_web.ai.retrieval import nearest_to_vector
+from pdf_web.ai.services import EMBEDDING_INSERT_BATCH_SIZE
+from pdf_web.documents.models import Document
+from pdf_web.documents.models import DocumentVersion
+from pdf_web.documents.models import Workspace
+
+CHUNKS = int(os.environ.get("VECTOR_BENCHMARK_CHUNKS", 10000))
+CHUNKS_PER_TOPIC = 100
+QUERIES = 30
+K = 10
+NOISE = 0.8
+
+
+def _scattered(rng, centres, count):
+    picks = rng.integers(len(centres), size=count)
+    noise = rng.standard_normal((count, EMBEDDING_DIMENSIONS), dtype=np.float32) * NOISE / np.sqrt(EMBEDDING_DIMENSIONS)
+    return normalize(centres[picks] + noise)
+
+
+def _load(rng, centres, version, count):
+    # Binary COPY; formatting a million 1536-float vectors as text would dominate the run.
+    register_vector(connection.connection)
+    with connection.cursor() as cursor, cursor.copy(
+        "COPY ai_embeddingchunk (version_id, page_number, chunk_index, text, text_hash, embedding, metadata) "
+        "FROM STDIN WITH (FORMAT BINARY)"
+    ) as copy:
+        copy.set_types(["int8", "int4", "int4", "text", "varchar", "vector", "jsonb"])
+        for start in range(0, count, EMBEDDING_INSERT_BATCH_SIZE):
+            for row, vector in enumerate(_scattered(rng, centres, min(EMBEDDING_INSERT_BATCH_SIZE, count - start))):
+                copy.write_row((version.pk, start + row + 1, 0, "", "", vector, Jsonb({})))
+
+
+def _timed(search):
+    started = time.perf_counter()
+    result = search()
+    return result, time.perf_counter() - started
+
+
+def _exact(version, vector):
+    # Inside the test's transaction SET LOCAL would outlast this search, so the setting is reset by hand.
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_indexscan = off")
+        try:
+            return nearest_to_vector(version, vector, K)
+        finally:
+            cursor.execute("RESET enable_indexscan")
+
+
+@pytest.mark.django_db
+def test_hnsw_search_recall_and_latency_against_exact_scan(user, record_property):
+    rng = np.random.default_rng(7)
+    centres = normalize(rng.standard_normal((max(CHUNKS // CHUNKS_PER_TOPIC, 1), EMBEDDING_DIMENSIONS), dtype=np.float32))
+    workspace = Workspace.objects.create(name="Benchmark", owner=user)
+    document = Document.objects.create(workspace=workspace, title="Corpus", created_by=user)
+    searched, neighbour = (
+        DocumentVersion.objects.create(document=document, version_number=number, file=f"corpus-{number}.pdf", created_by=user)
+        for number in (1, 2)
+    )
+    index = next(index for index in EmbeddingChunk._meta.indexes if index.name == "ai_chunk_embedding_hnsw")
+    with connection.schema_editor() as editor:
+        # Building the graph once after loading is far quicker than growing it row by row.
+        editor.remove_index(EmbeddingChunk, index)
+        started = time.perf_counter()
+        _load(rng, centres, searched, CHUNKS - CHUNKS // 10)
+        _load(rng, centres, neighbour, CHUNKS // 10)
+        load_seconds = time.perf_counter() - started
+        # Deferred foreign key checks would otherwise block the index build.
+        editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        editor.execute("SET LOCAL maintenance_work_mem = '1GB'")
+        started = time.perf_counter()
+        editor.add_index(EmbeddingChunk, index)
+        build_seconds = time.perf_counter() - started
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE ai_embeddingchunk")
+    plan = (
+        EmbeddingChunk.objects.filter(version=searched)
+        .order_by(MaxInnerProduct("embedding", centres[0]))
+        .values_list("pk", flat=True)[:K]
+        .explain()
+    )
+    assert "ai_chunk_embedding_hnsw" in plan
+
+    recalls, approximate_seconds, exact_seconds = [], [], []
+    for query in _scattered(rng, centres, QUERIES):
+        found, seconds = _timed(lambda: nearest_to_vector(searched, query, K))
+        approximate_seconds.append(seconds)
+        expected, seconds = _timed(lambda: _exact(searched, query))
+        exact_seconds.append(seconds)
+        assert len(expected) == K
+        recalls.append(len(set(found) & set(expected)) / K)
+
+    recall = statistics.mean(recalls)
+    approximate, exact = statistics.median(approximate_seconds), statistics.median(exact_seconds)
+    record_property("chunks", CHUNKS)
+    record_property("load seconds", round(load_seconds, 1))
+    record_property("index build seconds", round(build_seconds, 1))
+    record_property(f"recall@{K}", round(recall, 3))
+    record_property("median ms with the index", round(approximate * 1000, 1))
+    record_property("median ms exact", round(exact * 1000, 1))
+    assert recall >= 0.9
+    assert approximate < exact